@@ -0,0 +1,451 @@
+'''
+This module benchmarks the load, align, and render pipeline of
+djia_npp_bokeh.py stage by stage and stores the results as JSON so that
+regressions can be compared between commits. It runs against the bundled
+data/djia_close_2022-03-03.csv with a local stand-in reader in place of
+Stooq.com, and against synthetic series scaled in length and number of
+events. The import cases time each entry point in a fresh interpreter and
+record which heavy optional packages it loads. The bootstrap cases time the
+forward path simulation of djia_bootstrap.py by number of paths and number
+of processes.
+
+Run from the repository root with, for example,
+    python -m benchmarks.bench_djia_npp --output bench.json
+    python -m benchmarks.bench_djia_npp --compare old.json --output new.json
+
+This module defines the following function(s):
+    time_stage()
+    synthetic_series()
+    synthetic_events()
+    bench_render()
+    bench_bundled()
+    bench_synthetic()
+    bench_bootstrap()
+    bench_imports()
+    run_benchmarks()
+    compare_benchmarks()
+    main()
+'''
+# Import packages
+import numpy as np
+import pandas as pd
+import datetime as dt
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import bokeh
+from bokeh.io import save
+from bokeh.models import ColumnDataSource
+from bokeh.resources import CDN
+import djia_align
+import djia_bands
+import djia_bootstrap
+import djia_columnar
+import djia_events
+import djia_store
+import djia_npp_bokeh as djia
+
+CUR_PATH = os.path.split(os.path.abspath(__file__))[0]
+REPO_PATH = os.path.join(CUR_PATH, '..')
+BUNDLED_DATE = '2022-03-03'
+BUNDLED_CSV = os.path.join(REPO_PATH, 'data',
+                           'djia_close_' + BUNDLED_DATE + '.csv')
+BUNDLED_ROWS = 32584
+BKWD_DAYS_MAX = 243
+FRWD_DAYS_MAX = 1821
+MAX_CSV_SCALE = 100  # Larger synthetic csv files take minutes and GBs to load
+HEAVY_MODULES = ('bokeh', 'pandas_datareader')
+IMPORT_CASES = {
+    'import_djia_data': 'import djia_data',
+    'import_djia_npp_bokeh': 'import djia_npp_bokeh',
+    'offline_data_path': ('import djia_data; djia_data.get_djia_data(' +
+                          str(FRWD_DAYS_MAX) + ', ' + str(BKWD_DAYS_MAX) +
+                          ", '" + BUNDLED_DATE + "', False, " +
+                          'save_data=False)')}
+
+'''
+Define functions
+'''
+
+
+def time_stage(results, case, stage, func, repeats, **info):
+    '''
+    This function times func() repeats times and appends a result record.
+
+    Args:
+        results (list): list of result dictionaries to append to
+        case (str): name of the benchmark case
+        stage (str): name of the pipeline stage
+        func (function): function of no arguments to time
+        repeats (int): number of timed calls
+        info (dict): extra fields of the record, e.g. n_rows and n_events
+
+    Returns:
+        out (object): return value of the last call of func()
+    '''
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        out = func()
+        times.append(time.perf_counter() - start)
+    record = {'case': case, 'stage': stage, 'repeats': repeats,
+              'seconds_min': min(times),
+              'seconds_median': float(np.median(times))}
+    record.update(info)
+    results.append(record)
+    print('{:<28} {:<18} {:>10.4f} s'.format(case, stage, min(times)))
+
+    return out
+
+
+def synthetic_series(n_rows, seed=0):
+    '''
+    This function creates a synthetic daily closing value series as a
+    geometric random walk over consecutive weekdays.
+
+    Args:
+        n_rows (int): number of rows
+        seed (int): seed of the random number generator
+
+    Returns:
+        day_arr (array): sorted int64 array of epoch days
+        close_arr (array): float array of closing values
+    '''
+    rng = np.random.default_rng(seed)
+    n_cal = int(n_rows * 7 / 5) + 7
+    cal_days = np.arange(-27000, -27000 + n_cal, dtype=np.int64)
+    # 1970-01-01 was a Thursday, so weekday 0 (Monday) is (days + 3) % 7
+    day_arr = cal_days[(cal_days + 3) % 7 < 5][:n_rows]
+    close_arr = 30.0 * np.exp(np.cumsum(rng.normal(0.0, 0.011, n_rows)))
+
+    return day_arr, close_arr
+
+
+def synthetic_events(day_arr, n_events, seed=0):
+    '''
+    This function creates n_events peak date ranges of 60 to 120 days spread
+    over the span of a synthetic series.
+
+    Args:
+        day_arr (array): sorted int64 array of epoch days
+        n_events (int): number of events
+        seed (int): seed of the random number generator
+
+    Returns:
+        maxdate_rng_lst (list): list of tuples with start datetime64 date and
+            end datetime64 date of the peak range of each event
+    '''
+    rng = np.random.default_rng(seed)
+    lo_days = np.sort(rng.integers(day_arr[0], day_arr[-1] - 120, n_events))
+    hi_days = lo_days + rng.integers(60, 121, n_events)
+    maxdate_rng_lst = list(zip(lo_days.astype('datetime64[D]'),
+                               hi_days.astype('datetime64[D]')))
+
+    return maxdate_rng_lst
+
+
+def bench_render(results, case, events, repeats, render_modes, tmp_dir):
+    '''
+    This function times the percentile bands, data source construction,
+    figure build, and HTML write stages of djia_npp() for the given aligned
+    events.
+    '''
+    labels = ['event ' + str(i) for i in range(events.n_events)]
+    info = {'n_rows': int(events.valid.sum()), 'n_events': events.n_events}
+    time_stage(results, case, 'event_bands',
+               lambda: djia_bands.event_bands(events), repeats, **info)
+    for render_mode in render_modes:
+        if render_mode == 'lines':
+            time_stage(results, case, 'cds_lines',
+                       lambda: [ColumnDataSource(events.event_frame(i))
+                                for i in range(events.n_events)],
+                       repeats, **info)
+        else:
+            time_stage(results, case, 'cds_multi_line',
+                       lambda: djia.multi_line_source(events, labels),
+                       repeats, **info)
+        fig = time_stage(results, case, 'figure_' + render_mode,
+                         lambda: djia.make_npp_figure(
+                             events, labels, dt.datetime(2022, 3, 3),
+                             render_mode=render_mode),
+                         repeats, **info)
+        html_path = os.path.join(tmp_dir, 'bench.html')
+        time_stage(results, case, 'html_' + render_mode,
+                   lambda: save(fig, filename=html_path, resources=CDN,
+                                title='bench'),
+                   repeats, **info)
+        results[-1]['html_bytes'] = os.path.getsize(html_path)
+
+
+def bench_bundled(results, repeats, tmp_dir):
+    '''
+    This function benchmarks every stage on the bundled 2022-03-03 data.
+    '''
+    case = 'bundled'
+    info = {'n_rows': BUNDLED_ROWS, 'n_events': 15}
+    djia_close = time_stage(
+        results, case, 'load_csv',
+        lambda: pd.read_csv(BUNDLED_CSV, names=['Date', 'Close'],
+                            parse_dates=['Date'], skiprows=1,
+                            na_values=['.', 'na', 'NaN']).dropna(),
+        repeats, **info)
+    col_path = djia_columnar.columnar_path(tmp_dir, 'djia_close')
+    djia_columnar.write_columnar(djia_close, col_path)
+    time_stage(results, case, 'load_npy',
+               lambda: djia_columnar.read_columnar(col_path), repeats, **info)
+
+    # Fetch through the store with a local stand-in reader for Stooq.com
+    reader = djia_store.csv_reader(BUNDLED_CSV)
+    store_dir = os.path.join(tmp_dir, 'store')
+    time_stage(results, case, 'fetch_full',
+               lambda: djia_store.update_store(
+                   store_dir, 'djia_close', '^DJI', dt.datetime(2022, 2, 25),
+                   reader=reader), 1, **info)
+    time_stage(results, case, 'fetch_delta',
+               lambda: djia_store.update_store(
+                   store_dir, 'djia_close', '^DJI', dt.datetime(2022, 3, 3),
+                   reader=reader), 1, **info)
+
+    maxdate_rng_lst = djia.get_djia_data(
+        FRWD_DAYS_MAX, BKWD_DAYS_MAX, BUNDLED_DATE,
+        download_from_internet=False, data_dir=store_dir, save_data=False)[7]
+    day_arr = djia_align.to_epoch_days(djia_close['Date'])
+    close_arr = djia_close['Close'].to_numpy(dtype=np.float64)
+    peak_idx = time_stage(results, case, 'peak_search',
+                          lambda: djia_align.find_peaks(day_arr, close_arr,
+                                                        maxdate_rng_lst),
+                          repeats, **info)
+    time_stage(results, case, 'alignment',
+               lambda: djia_align.align_windows(day_arr, close_arr, peak_idx,
+                                                BKWD_DAYS_MAX, FRWD_DAYS_MAX),
+               repeats, **info)
+    time_stage(results, case, 'drawdown_detect',
+               lambda: djia_events.detect_drawdowns(djia_close, 0.1),
+               repeats, **info)
+    events = djia_align.align_events(djia_close, maxdate_rng_lst,
+                                     BKWD_DAYS_MAX, FRWD_DAYS_MAX)
+    time_stage(results, case, 'to_wide', events.to_wide, repeats, **info)
+    shutil.copy(BUNDLED_CSV, tmp_dir)
+    time_stage(results, case, 'get_djia_data',
+               lambda: djia.get_djia_data(
+                   FRWD_DAYS_MAX, BKWD_DAYS_MAX, BUNDLED_DATE,
+                   download_from_internet=False, data_dir=tmp_dir),
+               repeats, **info)
+    bench_render(results, case, events, repeats, ['lines', 'multi_line'],
+                 tmp_dir)
+
+
+def bench_synthetic(results, scales, n_events_lst, repeats, tmp_dir):
+    '''
+    This function benchmarks csv load (up to MAX_CSV_SCALE), peak search,
+    and alignment on synthetic series of scale times the bundled length, and
+    the render stages on synthetic event counts.
+    '''
+    for scale in scales:
+        n_rows = int(BUNDLED_ROWS * scale)
+        day_arr, close_arr = synthetic_series(n_rows)
+        if scale <= MAX_CSV_SCALE:
+            # Cycle the dates through the bundled span so every row can be
+            # parsed as a datetime64[ns] however long the series is
+            csv_days = (day_arr - day_arr[0]) % (BUNDLED_ROWS * 7 // 5) - 27000
+            csv_path = os.path.join(tmp_dir, 'synthetic.csv')
+            pd.DataFrame({'Date': csv_days.astype('datetime64[D]'),
+                          'Close': close_arr}).to_csv(csv_path, index=False)
+            time_stage(results, 'synthetic_x' + str(scale), 'load_csv',
+                       lambda: pd.read_csv(csv_path, names=['Date', 'Close'],
+                                           parse_dates=['Date'], skiprows=1),
+                       repeats, n_rows=n_rows, n_events=0)
+            os.remove(csv_path)
+        for n_events in n_events_lst:
+            case = 'synthetic_x{}_e{}'.format(scale, n_events)
+            info = {'n_rows': n_rows, 'n_events': n_events}
+            maxdate_rng_lst = synthetic_events(day_arr, n_events)
+            peak_idx = time_stage(
+                results, case, 'peak_search',
+                lambda: djia_align.find_peaks(day_arr, close_arr,
+                                              maxdate_rng_lst),
+                repeats, **info)
+            time_stage(results, case, 'alignment',
+                       lambda: djia_align.align_windows(
+                           day_arr, close_arr, peak_idx, BKWD_DAYS_MAX,
+                           FRWD_DAYS_MAX), repeats, **info)
+
+    # Render stages depend on the number of events, not the series length
+    day_arr, close_arr = synthetic_series(BUNDLED_ROWS)
+    djia_close = pd.DataFrame({'Date': day_arr.astype('datetime64[D]')
+                               .astype('datetime64[ns]'),
+                               'Close': close_arr})
+    for n_events in n_events_lst:
+        events = djia_align.align_events(
+            djia_close, synthetic_events(day_arr, n_events), BKWD_DAYS_MAX,
+            FRWD_DAYS_MAX)
+        render_modes = (['lines', 'multi_line'] if n_events <= 100 else
+                        ['multi_line'])
+        bench_render(results, 'synthetic_render_e' + str(n_events), events,
+                     repeats, render_modes, tmp_dir)
+
+
+def bench_bootstrap(results, n_paths_lst, procs_lst, repeats):
+    '''
+    This function benchmarks the forward path simulation of the current
+    recession of the bundled data by number of paths and processes.
+    '''
+    events = djia.get_djia_data(FRWD_DAYS_MAX, BKWD_DAYS_MAX, BUNDLED_DATE,
+                                download_from_internet=False,
+                                return_events=True, save_data=False)[0]
+    for n_paths in n_paths_lst:
+        for n_procs in procs_lst:
+            time_stage(results, 'bootstrap_p' + str(n_paths),
+                       'procs_' + str(n_procs),
+                       lambda: djia_bootstrap.forward_cones(
+                           events, n_paths, n_procs=n_procs),
+                       repeats, n_rows=BUNDLED_ROWS,
+                       n_events=events.n_events, n_paths=n_paths,
+                       n_procs=n_procs)
+
+
+def bench_imports(results, repeats):
+    '''
+    This function times each statement of IMPORT_CASES in a fresh Python
+    interpreter, so that the import cost is not hidden by modules already
+    loaded, and records the heavy modules in HEAVY_MODULES that it loaded.
+    '''
+    script = ('import json, sys, time\n'
+              'start = time.perf_counter()\n'
+              '{stmt}\n'
+              'seconds = time.perf_counter() - start\n'
+              'heavy = sorted({{m.split(".")[0] for m in sys.modules}} & '
+              'set({heavy!r}))\n'
+              'print(json.dumps({{"seconds": seconds, "heavy": heavy}}))\n')
+    for stage, stmt in IMPORT_CASES.items():
+        times = []
+        for _ in range(repeats):
+            out = subprocess.run(
+                [sys.executable, '-c',
+                 script.format(stmt=stmt, heavy=HEAVY_MODULES)],
+                cwd=REPO_PATH, capture_output=True, text=True, check=True)
+            run = json.loads(out.stdout.strip().splitlines()[-1])
+            times.append(run['seconds'])
+        record = {'case': 'imports', 'stage': stage, 'repeats': repeats,
+                  'seconds_min': min(times),
+                  'seconds_median': float(np.median(times)),
+                  'heavy_modules': run['heavy']}
+        results.append(record)
+        print('{:<28} {:<18} {:>10.4f} s {}'.format(
+            'imports', stage, min(times), ' '.join(run['heavy'])))
+
+
+def run_benchmarks(scales=(1, 10, 100, 1000), n_events_lst=(10, 100, 1000),
+                   repeats=3, output=None, n_paths_lst=(10000, 100000),
+                   procs_lst=(1, 2, 4)):
+    '''
+    This function runs the bundled and synthetic benchmarks and optionally
+    writes the results to a JSON file.
+
+    Args:
+        scales (tuple): synthetic series lengths as multiples of the bundled
+            series length
+        n_events_lst (tuple): synthetic numbers of events
+        repeats (int): number of timed calls of each stage
+        output (str or None): path of the JSON results file
+        n_paths_lst (tuple): numbers of simulated forward paths
+        procs_lst (tuple): numbers of processes of the simulation
+
+    Returns:
+        bench (dict): dictionary of environment info and list of results
+    '''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_PATH,
+                                capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    bench = {'commit': commit,
+             'timestamp': dt.datetime.now().isoformat(timespec='seconds'),
+             'python': platform.python_version(), 'numpy': np.__version__,
+             'pandas': pd.__version__, 'bokeh': bokeh.__version__,
+             'results': []}
+    bench_imports(bench['results'], repeats)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bench_bundled(bench['results'], repeats, tmp_dir)
+        bench_synthetic(bench['results'], scales, n_events_lst, repeats,
+                        tmp_dir)
+    bench_bootstrap(bench['results'], n_paths_lst, procs_lst, repeats)
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(bench, f, indent=1)
+
+    return bench
+
+
+def compare_benchmarks(old_bench, new_bench, threshold=1.2):
+    '''
+    This function compares the minimum times of matching (case, stage)
+    records of two benchmark runs and prints the ratio new / old.
+
+    Args:
+        old_bench (dict): benchmark results of the baseline run
+        new_bench (dict): benchmark results of the new run
+        threshold (float): ratio above which a stage is flagged as a
+            regression
+
+    Returns:
+        regressions (list): list of (case, stage, ratio) tuples above the
+            threshold
+    '''
+    old_times = {(r['case'], r['stage']): r['seconds_min']
+                 for r in old_bench['results']}
+    regressions = []
+    for rec in new_bench['results']:
+        key = (rec['case'], rec['stage'])
+        if key not in old_times or old_times[key] <= 0:
+            continue
+        ratio = rec['seconds_min'] / old_times[key]
+        flag = ' REGRESSION' if ratio > threshold else ''
+        print('{:<28} {:<18} {:>7.2f}x{}'.format(key[0], key[1], ratio,
+                                                 flag))
+        if ratio > threshold:
+            regressions.append((key[0], key[1], ratio))
+
+    return regressions
+
+
+def main(argv=None):
+    '''
+    This function is the command line entry point of the benchmarks.
+    '''
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scales', type=float, nargs='+',
+                        default=[1, 10, 100, 1000])
+    parser.add_argument('--events', type=int, nargs='+',
+                        default=[10, 100, 1000])
+    parser.add_argument('--paths', type=int, nargs='+',
+                        default=[10000, 100000])
+    parser.add_argument('--procs', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--compare', default=None,
+                        help='JSON results of a baseline run')
+    parser.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args(argv)
+    scales = [int(s) if float(s).is_integer() else s for s in args.scales]
+    bench = run_benchmarks(scales, args.events, args.repeats, args.output,
+                           args.paths, args.procs)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            old_bench = json.load(f)
+        if compare_benchmarks(old_bench, bench, args.threshold):
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    # execute only if run as a script
+    sys.exit(main())
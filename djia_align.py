@@ -0,0 +1,511 @@
+'''
+This module contains the peak-alignment engine used by get_djia_data() in
+djia_data.py. It finds the peak closing value of each event with a single
+searchsorted over the sorted Date array and then gathers every aligned window
+in one batched operation into preallocated events x offsets arrays, touching
+only the rows that fall inside the windows. The arrays are kept in a compact
+AlignedEvents container with a converter to the legacy wide DataFrame.
+
+This module defines the following function(s):
+    to_epoch_days()
+    segment_rows()
+    find_peaks()
+    align_windows()
+    align_sessions()
+    bars_per_session()
+    offsets_per_year()
+    align_events()
+    concat_events()
+    align_peaks()
+
+This module defines the following class(es):
+    AlignedEvents
+'''
+# Import packages
+import numpy as np
+import pandas as pd
+from djia_metrics import get_metrics
+
+# Offsets from peak per year of each offset unit, used to convert months from
+# peak to offsets ('days' keeps the 364.25 days per year of djia_npp()). The
+# 'bars' value is per bar per session, see offsets_per_year()
+OFFSETS_PER_YEAR = {'days': 364.25, 'sessions': 252, 'bars': 252}
+
+'''
+Define functions
+'''
+
+
+def to_epoch_days(dates):
+    '''
+    This function converts a sequence of dates to an int64 array of days since
+    the Unix epoch (1970-01-01).
+
+    Args:
+        dates (array_like): Series, DatetimeIndex, array, or list of
+            datetimes or date strings. NumPy datetime64 arrays are converted
+            directly, so they are not limited to the datetime64[ns] range
+
+    Returns:
+        day_arr (array): int64 array of epoch days
+    '''
+    if (isinstance(dates, np.ndarray) and
+            np.issubdtype(dates.dtype, np.datetime64)):
+        return dates.astype('datetime64[D]').astype(np.int64)
+    day_arr = (pd.to_datetime(dates).values.astype('datetime64[D]')
+               .astype(np.int64))
+
+    return day_arr
+
+
+def segment_rows(lo_arr, hi_arr):
+    '''
+    This function expands a set of half-open row ranges [lo, hi) into one flat
+    array of row positions and the matching array of range (event) numbers,
+    without a Python loop over the ranges.
+
+    Args:
+        lo_arr (array): int array of inclusive lower row bounds
+        hi_arr (array): int array of exclusive upper row bounds
+
+    Returns:
+        ev_arr (array): int array of event number for each gathered row
+        row_arr (array): int array of gathered row positions
+        seg_lens (array): int array of number of rows in each range
+    '''
+    seg_lens = (np.asarray(hi_arr) - np.asarray(lo_arr)).astype(np.int64)
+    seg_starts = np.cumsum(seg_lens) - seg_lens
+    ev_arr = np.repeat(np.arange(len(seg_lens)), seg_lens)
+    row_arr = (np.arange(seg_lens.sum()) - seg_starts[ev_arr] +
+               np.asarray(lo_arr)[ev_arr])
+
+    return ev_arr, row_arr, seg_lens
+
+
+def find_peaks(day_arr, close_arr, maxdate_rng_lst):
+    '''
+    This function finds the row of the peak closing value within each of the
+    date ranges in maxdate_rng_lst. All range bounds are located with one
+    searchsorted call. Ties are broken in favor of the latest date, which
+    matches the original masked max() definition of the peak date.
+
+    Args:
+        day_arr (array): sorted int64 array of epoch days of the series
+        close_arr (array): float array of closing values of the series
+        maxdate_rng_lst (list): list of tuples with start string date and end
+            string date within which range we define the peak value
+
+    Returns:
+        peak_idx (array): int array of row positions of each peak
+    '''
+    rng_days = to_epoch_days(np.ravel(maxdate_rng_lst)).reshape(-1, 2)
+    # End bounds are inclusive, so search for the day after each end date
+    bounds = np.searchsorted(day_arr, rng_days + np.array([0, 1]),
+                             side='left')
+    lo_arr = bounds[:, 0]
+    hi_arr = bounds[:, 1]
+    empty = np.flatnonzero(hi_arr <= lo_arr)
+    if empty.size > 0:
+        raise ValueError('No closing values in peak date range(s) ' +
+                         str([tuple(maxdate_rng_lst[i]) for i in empty]))
+    ev_arr, row_arr, seg_lens = segment_rows(lo_arr, hi_arr)
+    seg_starts = np.cumsum(seg_lens) - seg_lens
+    seg_close = close_arr[row_arr]
+    peak_vals = np.fmax.reduceat(seg_close, seg_starts)
+    is_peak = seg_close == peak_vals[ev_arr]
+    peak_idx = np.maximum.reduceat(np.where(is_peak, row_arr, -1),
+                                   seg_starts)
+
+    return peak_idx
+
+
+def align_windows(day_arr, close_arr, peak_idx, bkwd_days_max,
+                  frwd_days_max):
+    '''
+    This function gathers the rows within bkwd_days_max days before and
+    frwd_days_max days after each peak into preallocated events x offsets
+    arrays indexed by calendar days from peak. Offsets with no trading day
+    are left as NaT (dates) and NaN (closes).
+
+    Args:
+        day_arr (array): sorted int64 array of epoch days of the series
+        close_arr (array): float array of closing values of the series
+        peak_idx (array): int array of row positions of each peak
+        bkwd_days_max (int): maximum number of days backward from the peak
+        frwd_days_max (int): maximum number of days forward from the peak
+
+    Returns:
+        date_mat (array): E x K datetime64[D] array of aligned dates
+        close_mat (array): E x K float array of aligned closing values
+    '''
+    peak_idx = np.asarray(peak_idx, dtype=np.int64)
+    n_events = len(peak_idx)
+    n_offsets = bkwd_days_max + frwd_days_max + 1
+    peak_days = day_arr[peak_idx]
+    win_bounds = np.searchsorted(
+        day_arr, np.column_stack([peak_days - bkwd_days_max,
+                                  peak_days + frwd_days_max + 1]),
+        side='left')
+    ev_arr, row_arr, _ = segment_rows(win_bounds[:, 0], win_bounds[:, 1])
+    off_arr = day_arr[row_arr] - peak_days[ev_arr] + bkwd_days_max
+
+    date_mat = np.full((n_events, n_offsets), np.datetime64('NaT'),
+                       dtype='datetime64[D]')
+    close_mat = np.full((n_events, n_offsets), np.nan)
+    date_mat[ev_arr, off_arr] = day_arr[row_arr].astype('datetime64[D]')
+    close_mat[ev_arr, off_arr] = close_arr[row_arr]
+
+    return date_mat, close_mat
+
+
+def align_sessions(day_arr, close_arr, peak_idx, bkwd_sessions_max,
+                   frwd_sessions_max):
+    '''
+    This function gathers the bkwd_sessions_max rows (trading sessions)
+    before and frwd_sessions_max rows after each peak into events x offsets
+    arrays indexed by trading sessions from peak, in one step from the row
+    positions. The arrays have no gaps for weekends and holidays, and only
+    offsets before the first or after the last row of the series are left
+    as NaT (dates) and NaN (closes).
+
+    Args:
+        day_arr (array): sorted int64 array of epoch days of the series
+        close_arr (array): float array of closing values of the series
+        peak_idx (array): int array of row positions of each peak
+        bkwd_sessions_max (int): maximum number of sessions backward from the
+            peak
+        frwd_sessions_max (int): maximum number of sessions forward from the
+            peak
+
+    Returns:
+        date_mat (array): E x K datetime64[D] array of aligned dates
+        close_mat (array): E x K float array of aligned closing values
+    '''
+    peak_idx = np.asarray(peak_idx, dtype=np.int64)
+    row_mat = (peak_idx[:, np.newaxis] +
+               np.arange(-bkwd_sessions_max, frwd_sessions_max + 1))
+    in_series = (row_mat >= 0) & (row_mat < len(day_arr))
+    row_mat = np.clip(row_mat, 0, len(day_arr) - 1)
+    date_mat = np.where(in_series, day_arr[row_mat].astype('datetime64[D]'),
+                        np.datetime64('NaT'))
+    close_mat = np.where(in_series, close_arr[row_mat], np.nan)
+
+    return date_mat, close_mat
+
+
+def bars_per_session(day_arr):
+    '''
+    This function returns the typical number of bars per trading session of
+    a series of intraday bars, as the median number of rows per day.
+
+    Args:
+        day_arr (array): sorted int64 array of epoch days of the series
+
+    Returns:
+        n_bars (int): median number of rows per day, at least 1
+    '''
+    day_arr = np.asarray(day_arr)
+    day_counts = np.diff(np.flatnonzero(np.concatenate(
+        ([True], day_arr[1:] != day_arr[:-1], [True]))))
+    n_bars = max(1, int(np.median(day_counts))) if day_counts.size else 1
+
+    return n_bars
+
+
+def offsets_per_year(events):
+    '''
+    This function returns the number of offsets from peak per year of the
+    aligned events, used to place the month ticks of the plot. For intraday
+    bars, it is the sessions per year times the bars per session of the
+    event with the most valid bars.
+
+    Args:
+        events (AlignedEvents): aligned events x offsets arrays
+
+    Returns:
+        per_year (float): number of offsets per year
+    '''
+    per_year = OFFSETS_PER_YEAR[events.offset_unit]
+    if events.offset_unit == 'bars':
+        i = int(np.argmax(events.valid.sum(axis=1)))
+        per_year *= bars_per_session(events.date_days[i, events.valid[i]])
+
+    return per_year
+
+
+class AlignedEvents:
+    '''
+    This class holds the aligned windows of E events over K calendar-day
+    (or trading-session) offsets from peak as dense events x offsets arrays,
+    instead of the interleaved wide DataFrame of Date{i}, Close{i}, and
+    close_dv_pk{i} columns. Offsets with no trading day are marked False in
+    the validity mask. Cross-event statistics are plain array operations on
+    the matrices.
+
+    Attributes:
+        days_frm_peak (array): length K int array of days (or sessions) from
+            peak
+        close (array): E x K float array of closing values (NaN if invalid)
+        close_dv_pk (array): E x K float array of closing value divided by the
+            peak value of the event (NaN if invalid)
+        date_days (array): E x K int32 array of epoch days of each aligned
+            date (0 if invalid)
+        valid (array): E x K bool array, True where the event has a trading
+            day at that offset
+        peak_vals (array): length E float array of peak values
+        peak_dates (list): list of string date (YYYY-mm-dd) of each peak
+        offset_unit (str): 'days' if the offsets are calendar days from peak,
+            'sessions' if they are trading sessions from peak, 'bars' if they
+            are intraday bars from peak
+    '''
+
+    def __init__(self, days_frm_peak, close, date_days, valid, peak_vals,
+                 peak_dates, offset_unit='days'):
+        self.days_frm_peak = days_frm_peak
+        self.close = close
+        self.date_days = date_days
+        self.valid = valid
+        self.peak_vals = np.asarray(peak_vals, dtype=np.float64)
+        self.peak_dates = list(peak_dates)
+        self.offset_unit = offset_unit
+        self.close_dv_pk = close / self.peak_vals[:, np.newaxis]
+
+    @property
+    def n_events(self):
+        return self.close.shape[0]
+
+    def event_dates(self, i):
+        '''
+        This method returns the datetime64[ns] dates of event i, with NaT at
+        invalid offsets.
+        '''
+        return np.where(self.valid[i], self.date_days[i].astype(np.int64),
+                        np.iinfo(np.int64).min).astype(
+                            'datetime64[D]').astype('datetime64[ns]')
+
+    def event_frame(self, i):
+        '''
+        This method returns the valid rows of event i as a DataFrame with
+        columns days_frm_peak, Date, Close, and close_dv_pk, indexed by offset
+        position like the dropna() of the corresponding wide columns.
+
+        Args:
+            i (int): event number
+
+        Returns:
+            event_df (DataFrame): DataFrame of the valid rows of event i
+        '''
+        idx = np.flatnonzero(self.valid[i])
+        event_df = pd.DataFrame(
+            {'days_frm_peak': self.days_frm_peak[idx],
+             'Date': self.event_dates(i)[idx],
+             'Close': self.close[i, idx],
+             'close_dv_pk': self.close_dv_pk[i, idx]}, index=idx)
+
+        return event_df
+
+    def window(self, bkwd_days, frwd_days):
+        '''
+        This method returns the events restricted to a smaller window of
+        bkwd_days before and frwd_days after the peak. The result equals the
+        alignment of the same events computed directly with that window.
+
+        Args:
+            bkwd_days (int): number of days backward from the peak
+            frwd_days (int): number of days forward from the peak
+
+        Returns:
+            events_win (AlignedEvents): aligned events in the smaller window
+        '''
+        bkwd_days_max = -int(self.days_frm_peak[0])
+        frwd_days_max = int(self.days_frm_peak[-1])
+        if bkwd_days > bkwd_days_max or frwd_days > frwd_days_max:
+            raise ValueError('Window (' + str(bkwd_days) + ', ' +
+                             str(frwd_days) + ') is larger than aligned ' +
+                             'window (' + str(bkwd_days_max) + ', ' +
+                             str(frwd_days_max) + ')')
+        cols = slice(bkwd_days_max - bkwd_days,
+                     bkwd_days_max + frwd_days + 1)
+        events_win = AlignedEvents(self.days_frm_peak[cols],
+                                   self.close[:, cols],
+                                   self.date_days[:, cols],
+                                   self.valid[:, cols], self.peak_vals,
+                                   self.peak_dates, self.offset_unit)
+
+        return events_win
+
+    def truncate(self, end_date):
+        '''
+        This method returns the events as they would be aligned from the
+        series ending on end_date, by marking every offset dated after
+        end_date invalid. The peaks are kept, so end_date must be on or after
+        the end of the peak date range of every event.
+
+        Args:
+            end_date (str, datetime, or int): last date, or last epoch day
+
+        Returns:
+            events_trunc (AlignedEvents): aligned events through end_date
+        '''
+        if isinstance(end_date, (int, np.integer)):
+            end_day = int(end_date)
+        else:
+            end_day = int(to_epoch_days([end_date])[0])
+        valid = self.valid & (self.date_days <= end_day)
+        events_trunc = AlignedEvents(self.days_frm_peak,
+                                     np.where(valid, self.close, np.nan),
+                                     np.where(valid, self.date_days, 0),
+                                     valid, self.peak_vals, self.peak_dates,
+                                     self.offset_unit)
+
+        return events_trunc
+
+    def take(self, rows):
+        '''
+        This method returns a subset of the events in a given order.
+
+        Args:
+            rows (array_like): int array of event numbers
+
+        Returns:
+            events_take (AlignedEvents): aligned events of the given rows
+        '''
+        rows = np.asarray(rows, dtype=np.int64)
+        events_take = AlignedEvents(self.days_frm_peak, self.close[rows],
+                                    self.date_days[rows], self.valid[rows],
+                                    self.peak_vals[rows],
+                                    [self.peak_dates[i] for i in rows],
+                                    self.offset_unit)
+
+        return events_take
+
+    def to_wide(self):
+        '''
+        This method converts the aligned arrays to the legacy N x (1 + 3 * E)
+        wide DataFrame of days_frm_peak, Date{i}, Close{i}, and close_dv_pk{i}
+        columns written to djia_close_pk_[yyyy-mm-dd].csv. The first column
+        is sessions_frm_peak for trading-session offsets.
+
+        Returns:
+            djia_close_pk (DataFrame): wide DataFrame of the aligned events
+        '''
+        pk_dict = {self.offset_unit + '_frm_peak': self.days_frm_peak}
+        for i in range(self.n_events):
+            pk_dict[f'Date{i}'] = self.event_dates(i)
+            pk_dict[f'Close{i}'] = self.close[i]
+            pk_dict[f'close_dv_pk{i}'] = self.close_dv_pk[i]
+        djia_close_pk = pd.DataFrame(pk_dict)
+
+        return djia_close_pk
+
+
+def align_events(djia_close, maxdate_rng_lst, bkwd_days_max, frwd_days_max,
+                 metrics=None, offset_unit='days'):
+    '''
+    This function finds the peak of each event and gathers the aligned
+    windows by days (or trading sessions) from peak into an AlignedEvents
+    container.
+
+    Args:
+        djia_close (DataFrame): DataFrame with sorted 'Date' and 'Close'
+            columns
+        maxdate_rng_lst (list): list of tuples with start string date and end
+            string date within which range we define the peak value of each
+            event
+        bkwd_days_max (int): maximum number of days (or sessions) backward
+            from the peak
+        frwd_days_max (int): maximum number of days (or sessions) forward
+            from the peak
+        metrics (StageMetrics or None): if not None, records the
+            'peak_search' and 'alignment' stages, see djia_metrics.py
+        offset_unit (str): 'days' to align on calendar days from peak with
+            align_windows(), or 'sessions' or 'bars' to align on rows
+            (trading sessions or intraday bars) from peak with
+            align_sessions()
+
+    Returns:
+        events (AlignedEvents): aligned events x offsets arrays
+    '''
+    if offset_unit not in OFFSETS_PER_YEAR:
+        raise ValueError('offset_unit must be days, sessions, or bars, ' +
+                         'not ' + str(offset_unit))
+    align_func = align_windows if offset_unit == 'days' else align_sessions
+    metrics = get_metrics(metrics)
+    with metrics.stage('peak_search', n_rows=len(djia_close)):
+        day_arr = to_epoch_days(djia_close['Date'])
+        close_arr = djia_close['Close'].to_numpy(dtype=np.float64)
+        peak_idx = find_peaks(day_arr, close_arr, maxdate_rng_lst)
+    with metrics.stage('alignment') as record:
+        date_mat, close_mat = align_func(day_arr, close_arr, peak_idx,
+                                         bkwd_days_max, frwd_days_max)
+        valid = ~np.isnat(date_mat)
+        date_days = np.where(valid, date_mat.astype(np.int64),
+                             0).astype(np.int32)
+        peak_dates = [str(d) for d in
+                      day_arr[peak_idx].astype('datetime64[D]')]
+        events = AlignedEvents(
+            np.arange(-bkwd_days_max, frwd_days_max + 1, dtype=int),
+            close_mat, date_days, valid, close_arr[peak_idx], peak_dates,
+            offset_unit)
+        record['n_rows'] = int(valid.sum())
+        record['n_bytes'] = (close_mat.nbytes + date_days.nbytes +
+                             valid.nbytes)
+
+    return events
+
+
+def concat_events(events_lst):
+    '''
+    This function stacks the events of several AlignedEvents containers with
+    the same offsets from peak into one container.
+
+    Args:
+        events_lst (list): list of AlignedEvents with equal days_frm_peak
+            and offset_unit
+
+    Returns:
+        events (AlignedEvents): aligned events of all containers in order
+    '''
+    first = events_lst[0]
+    for events_i in events_lst[1:]:
+        if (events_i.offset_unit != first.offset_unit or
+                not np.array_equal(events_i.days_frm_peak,
+                                   first.days_frm_peak)):
+            raise ValueError('Events to concatenate must have the same ' +
+                             'offsets from peak')
+    events = AlignedEvents(
+        first.days_frm_peak, np.vstack([e.close for e in events_lst]),
+        np.vstack([e.date_days for e in events_lst]),
+        np.vstack([e.valid for e in events_lst]),
+        np.concatenate([e.peak_vals for e in events_lst]),
+        [d for e in events_lst for d in e.peak_dates], first.offset_unit)
+
+    return events
+
+
+def align_peaks(djia_close, maxdate_rng_lst, bkwd_days_max, frwd_days_max):
+    '''
+    This function finds the peak of each event and builds the wide DataFrame
+    of aligned Date{i}, Close{i}, and close_dv_pk{i} columns by days from
+    peak. It produces the same DataFrame as the original per-event merge
+    chain.
+
+    Args:
+        djia_close (DataFrame): DataFrame with sorted 'Date' and 'Close'
+            columns
+        maxdate_rng_lst (list): list of tuples with start string date and end
+            string date within which range we define the peak value of each
+            event
+        bkwd_days_max (int): maximum number of days backward from the peak
+        frwd_days_max (int): maximum number of days forward from the peak
+
+    Returns:
+        djia_close_pk (DataFrame): N x (1 + 3 * E) DataFrame of days_frm_peak,
+            Date{i}, Close{i}, and close_dv_pk{i} for each event
+        peak_vals (list): list of peak values of each event
+        peak_dates (list): list of string date (YYYY-mm-dd) of each peak
+    '''
+    events = align_events(djia_close, maxdate_rng_lst, bkwd_days_max,
+                          frwd_days_max)
+
+    return events.to_wide(), events.peak_vals.tolist(), events.peak_dates
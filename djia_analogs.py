@@ -0,0 +1,195 @@
+'''
+This module searches the full history of a series for analogs of the
+current event: the windows of the past whose path, normalized by their first
+value, is closest to the path of the series since the peak of the current
+event. Every start row of the history is scored at once, without a loop over
+start rows. The paths are compared as logarithms of the normalized values,
+so that the sums stay accurate over long series: the sliding sums of each
+window come from cumulative sums, and the sliding dot products of the
+windows with the current path from FFT cross-correlation in fixed-size
+blocks (overlap-save), so that the cost is O(n log n) and the memory is
+bounded for minute series as well. Each start row gets the root mean squared
+error (RMSE) of the log normalized paths, which is close to the relative
+error of the normalized paths, and the correlation of the paths. The top-k
+non-overlapping matches are aligned like the recessions and plotted as
+additional events by djia_npp().
+
+This module defines the following function(s):
+    sliding_dot()
+    window_scores()
+    find_analogs()
+    analog_events()
+'''
+# Import packages
+import numpy as np
+import pandas as pd
+from djia_align import to_epoch_days, align_events
+
+'''
+Define functions
+'''
+
+
+def sliding_dot(x_arr, q_arr, block_len=65536):
+    '''
+    This function computes the dot product of q_arr with every window of
+    x_arr of the same length, by FFT cross-correlation of blocks of x_arr
+    (overlap-save).
+
+    Args:
+        x_arr (array): float array of length n
+        q_arr (array): float array of length m <= n
+        block_len (int): minimum FFT length of each block, raised to the
+            next power of two of at least 2 * m
+
+    Returns:
+        dot_arr (array): float array of length n - m + 1 of
+            sum_j x_arr[s + j] * q_arr[j] for each start s
+    '''
+    n_x, n_q = len(x_arr), len(q_arr)
+    n_out = n_x - n_q + 1
+    n_fft = 1 << max(int(block_len - 1).bit_length(),
+                     int(2 * n_q - 1).bit_length())
+    step = n_fft - n_q + 1
+    q_fft = np.conj(np.fft.rfft(q_arr, n_fft))
+    dot_arr = np.empty(n_out)
+    for start in range(0, n_out, step):
+        corr = np.fft.irfft(np.fft.rfft(x_arr[start:start + n_fft], n_fft) *
+                            q_fft, n_fft)
+        n_blk = min(step, n_out - start)
+        dot_arr[start:start + n_blk] = corr[:n_blk]
+
+    return dot_arr
+
+
+def window_scores(log_arr, path_arr):
+    '''
+    This function scores every window of a log series against a log
+    normalized path, with each window normalized by its first value.
+
+    Args:
+        log_arr (array): float array of length n of log values, best
+            centered about zero
+        path_arr (array): float array of length m of the log normalized
+            path, with path_arr[0] = 0
+
+    Returns:
+        rmse (array): float array of length n - m + 1 of the RMSE of the
+            log normalized window starting at each row against path_arr
+        corr (array): float array of length n - m + 1 of the correlation of
+            the window starting at each row with path_arr (NaN for constant
+            windows)
+    '''
+    n_q = len(path_arr)
+    cum1 = np.concatenate(([0.0], np.cumsum(log_arr)))
+    cum2 = np.concatenate(([0.0], np.cumsum(log_arr * log_arr)))
+    sum1 = cum1[n_q:] - cum1[:-n_q]
+    sum2 = cum2[n_q:] - cum2[:-n_q]
+    dot = sliding_dot(log_arr, path_arr)
+    first = log_arr[:len(sum1)]
+    path1 = path_arr.sum()
+    path2 = path_arr @ path_arr
+    # sum_j (x[s + j] - x[s] - p[j]) ** 2 expanded in sliding sums
+    sse = (sum2 - 2.0 * first * sum1 + n_q * first * first - 2.0 * dot +
+           2.0 * first * path1 + path2)
+    rmse = np.sqrt(np.maximum(sse, 0.0) / n_q)
+    cov = dot - sum1 * path1 / n_q
+    var_x = np.maximum(sum2 - sum1 * sum1 / n_q, 0.0)
+    var_p = path2 - path1 * path1 / n_q
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = np.where(var_x * var_p > 0.0, cov / np.sqrt(var_x * var_p),
+                        np.nan)
+
+    return rmse, corr
+
+
+def find_analogs(djia_close, peak_date, n_analogs=5, metric='rmse',
+                 exclusion=None):
+    '''
+    This function finds the n_analogs windows of the history before
+    peak_date whose normalized path is closest to the path of the series
+    from peak_date to its last date, with at least exclusion rows between
+    the start rows of any two matches.
+
+    Args:
+        djia_close (DataFrame): DataFrame with sorted Date and Close columns
+        peak_date (str): date of the peak of the current event in
+            'YYYY-mm-dd' format
+        n_analogs (int): number of matches
+        metric (str): 'rmse' to rank by lowest RMSE or 'corr' to rank by
+            highest correlation
+        exclusion (int or None): minimum number of rows between the start
+            rows of two matches, defaults to the length of the path
+
+    Returns:
+        analog_df (DataFrame): DataFrame with columns start_date, start_row,
+            rmse, and corr of each match, best first
+    '''
+    if metric not in ('rmse', 'corr'):
+        raise ValueError('metric must be rmse or corr, not ' + str(metric))
+    day_arr = to_epoch_days(djia_close['Date'])
+    log_arr = np.log(djia_close['Close'].to_numpy(dtype=np.float64))
+    log_arr = log_arr - log_arr.mean()
+    peak_row = int(np.searchsorted(day_arr, to_epoch_days([peak_date])[0]))
+    path_arr = log_arr[peak_row:] - log_arr[peak_row]
+    n_q = len(path_arr)
+    if n_q < 2 or peak_row < n_q:
+        raise ValueError('Path from peak ' + str(peak_date) + ' has ' +
+                         str(n_q) + ' rows, which must be at least 2 and ' +
+                         'at most the ' + str(peak_row) + ' rows before it')
+    if exclusion is None:
+        exclusion = n_q
+
+    # Windows that end before the peak of the current event
+    rmse, corr = window_scores(log_arr[:peak_row], path_arr)
+    score = rmse if metric == 'rmse' else -corr
+    score = np.where(np.isnan(score), np.inf, score)
+    row_lst = []
+    for i in range(min(n_analogs, len(score))):
+        row = int(np.argmin(score))
+        if not np.isfinite(score[row]):
+            break
+        row_lst.append(row)
+        score[max(0, row - exclusion + 1):row + exclusion] = np.inf
+    row_arr = np.array(row_lst, dtype=np.int64)
+    analog_df = pd.DataFrame(
+        {'start_date': pd.DatetimeIndex(
+            day_arr[row_arr].astype('datetime64[D]')).strftime('%Y-%m-%d'),
+         'start_row': row_arr, 'rmse': rmse[row_arr], 'corr': corr[row_arr]})
+
+    return analog_df
+
+
+def analog_events(djia_close, analog_df, bkwd_days_max, frwd_days_max,
+                  offset_unit='days', metric='rmse'):
+    '''
+    This function aligns the analog windows like the recessions, with the
+    start date of each analog in place of the peak.
+
+    Args:
+        djia_close (DataFrame): DataFrame with sorted Date and Close columns
+        analog_df (DataFrame): DataFrame from find_analogs()
+        bkwd_days_max (int): maximum number of days (or sessions) backward
+            from the start date
+        frwd_days_max (int): maximum number of days (or sessions) forward
+            from the start date
+        offset_unit (str): 'days', 'sessions', or 'bars', see
+            djia_align.align_events()
+        metric (str): 'rmse' or 'corr', ranking of the analogs in
+            find_analogs(), whose score is shown in the labels
+
+    Returns:
+        events (AlignedEvents): aligned events of the analogs
+        label_lst (list): list of string legend label of each analog
+    '''
+    events = align_events(djia_close,
+                          [(d, d) for d in analog_df['start_date']],
+                          bkwd_days_max, frwd_days_max,
+                          offset_unit=offset_unit)
+    label_fmt = ' (RMSE={:.3f})' if metric == 'rmse' else ' (r={:.2f})'
+    label_lst = ['Analog ' + pd.Timestamp(d).strftime('%b %Y') +
+                 label_fmt.format(score)
+                 for d, score in zip(analog_df['start_date'],
+                                     analog_df[metric])]
+
+    return events, label_lst
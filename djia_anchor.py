@@ -0,0 +1,203 @@
+'''
+This module lets one HTML page of the normalized peak plot show every choice
+of normalization. Instead of only the closing values divided by the peak
+value with day 0 at the peak, the figure carries the raw closing values and
+offsets from peak of each event plus a small per-event anchor table: the
+offsets from peak of the peak, the trough, and the official NBER start month
+of each recession. A select control and a number input in the page re-anchor
+every event in the browser, at one of these anchors or at N days (or
+sessions) after the peak, by re-offsetting the offsets and re-normalizing
+the closing values of each event from typed arrays, without regenerating the
+page.
+
+This module defines the following function(s):
+    anchor_offsets()
+    add_anchor_control()
+'''
+# Import packages
+import numpy as np
+import pandas as pd
+from djia_align import to_epoch_days, offsets_per_year
+
+ANCHOR_OPTIONS = [('peak', 'Peak'), ('trough', 'Trough'),
+                  ('nber', 'NBER start'), ('after_peak', 'N after peak')]
+
+# Callback of the anchor controls. Each event is anchored at its first valid
+# offset at or after the anchor offset (its last valid offset if none), so
+# that the anchor point of every event is one of its closing values.
+ANCHOR_JS = """
+    const kind = select.value
+    const n_after = spinner.value
+    const tab = anchors.data
+    function anchor_index(x0, target) {
+        let lo = 0
+        let hi = x0.length - 1
+        if (x0[hi] < target)
+            return hi
+        while (lo < hi) {
+            const mid = (lo + hi) >> 1
+            if (x0[mid] < target)
+                lo = mid + 1
+            else
+                hi = mid
+        }
+        return lo
+    }
+    function reanchor(x0, close, i) {
+        const target = kind == 'after_peak' ? n_after : tab[kind][i]
+        const j = anchor_index(x0, target)
+        const a = x0[j]
+        const v = close[j]
+        return {a: a, v: v, xs: Float64Array.from(x0, (x) => x - a),
+                ys: Float64Array.from(close, (c) => c / v)}
+    }
+    if (multi) {
+        const data = Object.assign({}, sources[0].data)
+        data.xs = []
+        data.ys = []
+        data.peak_val = Float64Array.from(data.peak_val)
+        data.peak_ms = Float64Array.from(data.peak_ms)
+        for (let i = 0; i < data.peak_offset.length; i++) {
+            const r = reanchor(data.peak_offset[i], data.close[i], i)
+            data.xs.push(r.xs)
+            data.ys.push(r.ys)
+            data.peak_val[i] = r.v
+            // Trading-session dates are looked up from the calendar days
+            // from peak, so only calendar-day offsets move the date base
+            if (days)
+                data.peak_ms[i] = tab.peak_ms[i] + r.a * 86400000
+        }
+        sources[0].data = data
+    } else {
+        sources.forEach((source, i) => {
+            const data = Object.assign({}, source.data)
+            const r = reanchor(data.peak_offset, data.Close, i)
+            data.days_frm_peak = r.xs
+            data.close_dv_pk = r.ys
+            source.data = data
+        })
+    }
+    // The bands and cones are percentiles of values normalized at the peak
+    bands.forEach((r) => { r.visible = kind == 'peak' })
+    const name = kind == 'after_peak' ? n_after + ' ' + unit + ' after peak'
+        : names[kind]
+    fig.xaxis[0].axis_label = 'Months from ' + name
+    fig.yaxis[0].axis_label = series_label + ' as fraction of ' + name
+    const overrides = Object.assign({}, fig.xaxis[0].major_label_overrides)
+    overrides[0] = kind == 'peak' ? 'peak' : 'anchor'
+    fig.xaxis[0].major_label_overrides = overrides
+"""
+
+'''
+Define functions
+'''
+
+
+def anchor_offsets(events, rec_beg_yrmth_lst=None):
+    '''
+    This function computes the anchor table of the events: the offset from
+    peak of the peak, the trough (the lowest valid close at or after the
+    peak), and the NBER start (the first valid offset in or after the
+    beginning month) of each event.
+
+    Args:
+        events (AlignedEvents): aligned events x offsets arrays
+        rec_beg_yrmth_lst (list or None): list of string beginning year and
+            month of each event, e.g. 'Feb 2020', or None for events without
+            one, whose NBER start is their peak
+
+    Returns:
+        anchor_df (DataFrame): DataFrame with one row per event and columns
+            peak, trough, and nber of offsets from peak, and peak_ms of the
+            peak date in milliseconds since the epoch
+    '''
+    n_events = events.n_events
+    if rec_beg_yrmth_lst is None:
+        rec_beg_yrmth_lst = [None] * n_events
+    offsets = events.days_frm_peak
+
+    # Trough: position of the lowest valid close at or after the peak
+    after = events.valid & (offsets >= 0)
+    trough_pos = np.argmin(np.where(after, events.close, np.inf), axis=1)
+    trough = np.where(after.any(axis=1), offsets[trough_pos], 0)
+
+    # NBER start: first valid offset dated on or after the beginning month
+    has_beg = np.array([beg is not None for beg in rec_beg_yrmth_lst])
+    beg_days = np.zeros(n_events, dtype=np.int64)
+    if has_beg.any():
+        beg_days[has_beg] = to_epoch_days(pd.to_datetime(
+            [beg for beg in rec_beg_yrmth_lst if beg is not None],
+            format='%b %Y'))
+    on_after = events.valid & (events.date_days >= beg_days[:, np.newaxis])
+    nber = np.where(has_beg & on_after.any(axis=1),
+                    offsets[np.argmax(on_after, axis=1)], 0)
+
+    peak_ms = (np.array(events.peak_dates, dtype='datetime64[D]')
+               .astype('datetime64[ms]').astype(np.int64).astype(np.float64))
+    anchor_df = pd.DataFrame({'peak': np.zeros(n_events, dtype=np.int64),
+                              'trough': trough.astype(np.int64),
+                              'nber': nber.astype(np.int64),
+                              'peak_ms': peak_ms})
+
+    return anchor_df
+
+
+def add_anchor_control(fig, events, anchor_df, series_label='DJIA'):
+    '''
+    This function adds the raw offsets from peak (and, for a multi_line
+    figure, the raw closing values) to the event data sources of a figure
+    from djia_npp_bokeh.make_npp_figure() and lays out the figure under the
+    controls that re-anchor the events in the browser.
+
+    Args:
+        fig (bokeh Figure): normalized peak plot figure
+        events (AlignedEvents): aligned events drawn in the figure
+        anchor_df (DataFrame): DataFrame from anchor_offsets()
+        series_label (str): name of the series in the axis label
+
+    Returns:
+        layout (bokeh Column): the controls above the figure
+    '''
+    from bokeh.layouts import column, row
+    from bokeh.models import ColumnDataSource, CustomJS, Select, Spinner
+    multi_lines = [r for r in fig.renderers
+                   if type(r.glyph).__name__ == 'MultiLine']
+    if multi_lines:
+        source = multi_lines[0].data_source
+        ev_arr, off_arr = np.nonzero(events.valid)
+        split_pts = np.cumsum(events.valid.sum(axis=1))[:-1]
+        data = dict(source.data)
+        data['peak_offset'] = np.split(events.days_frm_peak[off_arr],
+                                       split_pts)
+        data['close'] = np.split(events.close[ev_arr, off_arr], split_pts)
+        source.data = data
+        sources = [source]
+    else:
+        sources = [r.data_source for r in fig.renderers
+                   if 'close_dv_pk' in r.data_source.data]
+        for source in sources:
+            data = dict(source.data)
+            data['peak_offset'] = np.asarray(data['days_frm_peak'])
+            source.data = data
+    # Percentile bands and forward path cones of djia_npp_bokeh.py
+    bands = [r for r in fig.renderers if 'n_events' in r.data_source.data
+             or r.data_source.name == 'npp_cones']
+
+    unit = events.offset_unit
+    select = Select(title='Anchor', value='peak', options=ANCHOR_OPTIONS,
+                    width=160)
+    spinner = Spinner(title='N ' + unit + ' after peak', low=0, step=1,
+                      value=int(np.round(offsets_per_year(events) / 4)),
+                      width=160)
+    names = {'peak': 'peak', 'trough': 'trough', 'nber': 'NBER start'}
+    callback = CustomJS(
+        args=dict(select=select, spinner=spinner, sources=sources,
+                  anchors=ColumnDataSource(anchor_df), bands=bands, fig=fig,
+                  multi=bool(multi_lines), days=unit == 'days', unit=unit,
+                  names=names, series_label=series_label),
+        code=ANCHOR_JS)
+    select.js_on_change('value', callback)
+    spinner.js_on_change('value', callback)
+    layout = column(row(select, spinner), fig)
+
+    return layout
@@ -0,0 +1,272 @@
+'''
+This module renders a range of historical daily snapshots of the DJIA
+normalized peak plot, images/djia_npp_[yyyy-mm-dd].html, one for each
+trading day in a date range, as djia_npp() would have rendered them on that
+day. The series is loaded and aligned once through the last date of the
+range, and each snapshot truncates the aligned arrays at its own end date
+instead of recomputing the peaks. The snapshots are written in parallel by a
+process pool. The aligned base data are handed to each worker process once,
+inherited from the parent under the fork start method or passed once to the
+pool initializer otherwise, and each task only sends an end date. With
+data_mode='sidecar', the snapshots share the compressed data files of the
+events that do not change from one day to the next (see djia_sidecar.py).
+
+Run from the repository root with, for example,
+    python djia_backfill.py 2021-03-03 2022-03-03 --offline --procs 4
+
+This module defines the following function(s):
+    backfill_dates()
+    render_snapshot()
+    backfill_npp()
+    main()
+'''
+# Import packages
+import numpy as np
+import pandas as pd
+import datetime as dt
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+from djia_data import load_djia_close, get_djia_data
+import djia_npp_bokeh as djia
+from djia_sidecar import save_sidecar
+
+logger = logging.getLogger('djia_npp')
+
+# Base data of the worker processes, set once per process
+_BACKFILL_STATE = {}
+
+'''
+Define functions
+'''
+
+
+def backfill_dates(djia_close, start_date_str, end_date_str):
+    '''
+    This function returns the trading days of the series from start_date_str
+    through end_date_str.
+
+    Args:
+        djia_close (DataFrame): DataFrame with Date and Close columns
+        start_date_str (str): first date in 'YYYY-mm-dd' format
+        end_date_str (str): last date in 'YYYY-mm-dd' format
+
+    Returns:
+        date_str_lst (list): list of string dates in 'YYYY-mm-dd' format
+    '''
+    dates = djia_close['Date']
+    in_range = ((dates >= pd.Timestamp(start_date_str)) &
+                (dates <= pd.Timestamp(end_date_str)))
+    date_str_lst = dates[in_range].dt.strftime('%Y-%m-%d').tolist()
+
+    return date_str_lst
+
+
+def render_snapshot(state, end_date_str):
+    '''
+    This function truncates the aligned events at end_date_str and writes the
+    snapshot HTML file of that day.
+
+    Args:
+        state (dict): base data with the aligned events, the legend labels,
+            the window of the plot, the render mode, the data mode, and the
+            image directory
+        end_date_str (str): end date of the snapshot in 'YYYY-mm-dd' format
+
+    Other functions and files called by this function:
+        djia_npp_bokeh.make_npp_figure()
+        djia_sidecar.save_sidecar() (if the data mode is 'sidecar')
+
+    Files created by this function:
+        images/djia_npp_[yyyy-mm-dd].html
+        images/npp_data/[hash].npb for each new event data file (if the data
+            mode is 'sidecar')
+
+    Returns:
+        filename (str): path of the snapshot HTML file
+    '''
+    from bokeh.io import save
+    from bokeh.resources import CDN
+
+    events = state['events'].truncate(end_date_str)
+    end_date = dt.datetime.strptime(end_date_str, '%Y-%m-%d')
+    fig = djia.make_npp_figure(
+        events, state['rec_label_lst'], end_date, state['frwd_mths_main'],
+        state['bkwd_mths_main'], state['frwd_mths_max'],
+        state['bkwd_mths_max'], state['render_mode'])
+    filename = os.path.join(state['image_dir'],
+                            'djia_npp_' + end_date_str + '.html')
+    if state['data_mode'] == 'sidecar':
+        save_sidecar(fig, events, filename, djia.NPP_FIG_TITLE)
+    else:
+        save(fig, filename=filename, resources=CDN, title=djia.NPP_FIG_TITLE)
+
+    return filename
+
+
+def _init_backfill_worker(state):
+    _BACKFILL_STATE.update(state)
+
+
+def _render_backfill_task(end_date_str):
+    return render_snapshot(_BACKFILL_STATE, end_date_str)
+
+
+def backfill_npp(start_date, end_date, frwd_mths_main=36, bkwd_mths_main=4,
+                 frwd_mths_max=60, bkwd_mths_max=8,
+                 download_from_internet=True, render_mode='lines',
+                 n_procs=None, image_dir=None, data_dir=None, reader=None,
+                 data_mode='inline'):
+    '''
+    This function writes the snapshot of the normalized peak plot of every
+    trading day from start_date through end_date.
+
+    Args:
+        start_date (str): first snapshot date in 'YYYY-mm-dd' format
+        end_date (str): either 'today' or the last snapshot date in
+            'YYYY-mm-dd' format
+        frwd_mths_main (int): number of months forward from the peak to plot in
+            the default main window of the visualization
+        bkwd_mths_main (int): number of months backward from the peak to plot
+            in the default main window of the visualization
+        frwd_mths_max (int): maximum number of months forward from the peak to
+            allow for the plot, to be seen by zooming out
+        bkwd_mths_max (int): maximum number of months backward from the peak to
+            allow for the plot, to be seen by zooming out
+        download_from_internet (bool): =True if download data from Stooq.com,
+            otherwise read date in from local directory
+        render_mode (str): 'lines' or 'multi_line', see djia_npp()
+        n_procs (int or None): number of worker processes, defaults to the
+            number of CPUs, 1 to render in this process
+        image_dir (str or None): directory of the HTML files, defaults to the
+            images folder of this directory
+        data_dir (str or None): directory of data files, defaults to the data
+            folder of this directory
+        reader (function or None): reader passed to get_djia_data()
+        data_mode (str): 'inline' or 'sidecar', see djia_npp()
+
+    Other functions and files called by this function:
+        djia_data.load_djia_close()
+        djia_data.get_djia_data()
+        render_snapshot()
+
+    Files created by this function:
+        images/djia_npp_[yyyy-mm-dd].html for each trading day
+        images/npp_data/[hash].npb for each distinct event data file (if
+            data_mode='sidecar')
+
+    Returns:
+        filename_lst (list): list of paths of the snapshot HTML files
+    '''
+    if render_mode not in ('lines', 'multi_line'):
+        raise ValueError('render_mode must be lines or multi_line, not ' +
+                         str(render_mode))
+    if data_mode not in ('inline', 'sidecar'):
+        raise ValueError('data_mode must be inline or sidecar, not ' +
+                         str(data_mode))
+    if end_date == 'today':
+        end_date = dt.date.today().strftime('%Y-%m-%d')
+    if image_dir is None:
+        image_dir = os.path.join(os.path.split(os.path.abspath(__file__))[0],
+                                 'images')
+    if not os.access(image_dir, os.F_OK):
+        os.makedirs(image_dir)
+    frwd_days_max = int(np.round(frwd_mths_max * 364.25 / 12))
+    bkwd_days_max = int(np.round(bkwd_mths_max * 364.25 / 12))
+
+    # Load and align the series once through the last snapshot date
+    djia_close, end_date_str2 = load_djia_close(
+        end_date, download_from_internet, reader, data_dir)
+    (events, end_date_str2, peak_vals, peak_dates, rec_label_yr_lst,
+        rec_label_yrmth_lst, rec_beg_yrmth_lst, maxdate_rng_lst) = \
+        get_djia_data(frwd_days_max, bkwd_days_max, end_date_str2,
+                      data_dir=data_dir, return_events=True, save_data=False,
+                      djia_close=djia_close)
+    date_str_lst = backfill_dates(djia_close, start_date, end_date_str2)
+    last_rng_end = max(pd.Timestamp(rng[1]) for rng in maxdate_rng_lst)
+    if date_str_lst and pd.Timestamp(date_str_lst[0]) < last_rng_end:
+        raise ValueError('Backfill start date ' + date_str_lst[0] +
+                         ' is before the end of the last peak date range ' +
+                         last_rng_end.strftime('%Y-%m-%d'))
+    state = {'events': events, 'rec_label_lst': rec_label_yrmth_lst,
+             'frwd_mths_main': frwd_mths_main,
+             'bkwd_mths_main': bkwd_mths_main,
+             'frwd_mths_max': frwd_mths_max, 'bkwd_mths_max': bkwd_mths_max,
+             'render_mode': render_mode, 'data_mode': data_mode,
+             'image_dir': image_dir}
+    if n_procs is None:
+        n_procs = os.cpu_count() or 1
+    n_procs = max(1, min(n_procs, len(date_str_lst)))
+    logger.info('Rendering %d snapshots from %s to %s with %d processes',
+                len(date_str_lst), start_date, end_date_str2, n_procs)
+
+    if n_procs == 1:
+        filename_lst = [render_snapshot(state, d) for d in date_str_lst]
+    else:
+        if 'fork' in multiprocessing.get_all_start_methods():
+            # Workers inherit the base data from this process
+            ctx = multiprocessing.get_context('fork')
+            _BACKFILL_STATE.clear()
+            _BACKFILL_STATE.update(state)
+            initializer, initargs = None, ()
+        else:
+            # Workers receive the base data once, not once per task
+            ctx = multiprocessing.get_context()
+            initializer, initargs = _init_backfill_worker, (state,)
+        try:
+            with ctx.Pool(n_procs, initializer, initargs) as pool:
+                filename_lst = pool.map(_render_backfill_task, date_str_lst,
+                                        chunksize=max(1, len(date_str_lst) //
+                                                      (4 * n_procs)))
+        finally:
+            _BACKFILL_STATE.clear()
+
+    return filename_lst
+
+
+def main(argv=None):
+    '''
+    This function is the command line interface of backfill_npp().
+
+    Args:
+        argv (list or None): command line arguments, defaults to sys.argv[1:]
+
+    Returns:
+        filename_lst (list): list of paths of the snapshot HTML files
+    '''
+    parser = argparse.ArgumentParser(
+        description='Render daily snapshots of the DJIA normalized peak plot')
+    parser.add_argument('start_date', help='first date in YYYY-mm-dd format')
+    parser.add_argument('end_date', nargs='?', default='today',
+                        help="'today' or last date in YYYY-mm-dd format")
+    parser.add_argument('--frwd-mths-main', type=int, default=36)
+    parser.add_argument('--bkwd-mths-main', type=int, default=4)
+    parser.add_argument('--frwd-mths-max', type=int, default=60)
+    parser.add_argument('--bkwd-mths-max', type=int, default=8)
+    parser.add_argument('--offline', action='store_true',
+                        help='read local data instead of Stooq.com')
+    parser.add_argument('--render-mode', choices=['lines', 'multi_line'],
+                        default='lines')
+    parser.add_argument('--data-mode', choices=['inline', 'sidecar'],
+                        default='inline')
+    parser.add_argument('--procs', type=int, default=None)
+    parser.add_argument('--image-dir', default=None)
+    parser.add_argument('--data-dir', default=None)
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    filename_lst = backfill_npp(
+        args.start_date, args.end_date, args.frwd_mths_main,
+        args.bkwd_mths_main, args.frwd_mths_max, args.bkwd_mths_max,
+        download_from_internet=not args.offline,
+        render_mode=args.render_mode, n_procs=args.procs,
+        image_dir=args.image_dir, data_dir=args.data_dir,
+        data_mode=args.data_mode)
+
+    return filename_lst
+
+
+if __name__ == '__main__':
+    # execute only if run as a script
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    main()
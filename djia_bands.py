@@ -0,0 +1,98 @@
+'''
+This module computes the cross-event envelope of the aligned events: the
+median and percentile bands of close_dv_pk across events at each day from
+peak. All percentiles, plus the minimum and maximum used for the axis limits
+of the plot, come from one NaN-aware pass that sorts the events x offsets
+array along the event axis once, so the cost does not grow with the number
+of percentiles and stays small with hundreds of events.
+
+This module defines the following function(s):
+    check_bands()
+    nan_quantiles()
+    event_bands()
+'''
+# Import packages
+import numpy as np
+import pandas as pd
+
+'''
+Define functions
+'''
+
+
+def check_bands(bands):
+    '''
+    This function checks the percentiles of the bands drawn by
+    djia_npp_bokeh.plot_event_bands(), which shades the area between each
+    pair of percentiles symmetric about the middle one and draws the middle
+    one of an odd number as a line.
+
+    Args:
+        bands (tuple): percentiles of the bands, e.g. (10, 25, 50, 75, 90)
+
+    Returns: None
+    '''
+    if len(bands) < 2:
+        raise ValueError('bands must have at least two percentiles to shade ' +
+                         'between, not ' + str(tuple(bands)))
+    if any(not 0 <= pct <= 100 for pct in bands):
+        raise ValueError('bands must be percentiles in [0, 100], not ' +
+                         str(tuple(bands)))
+
+
+def nan_quantiles(values, percentiles):
+    '''
+    This function computes percentiles of each column of a 2D array ignoring
+    NaN values, with the linear interpolation of np.nanpercentile(), from one
+    sort along axis 0.
+
+    Args:
+        values (array): float array of shape (n_events, n_offsets)
+        percentiles (array_like): percentiles in [0, 100]
+
+    Returns:
+        quant_mat (array): float array of shape (len(percentiles),
+            n_offsets), NaN in columns without valid values
+        n_valid (array): int array of number of valid values in each column
+    '''
+    pct_arr = np.asarray(percentiles, dtype=np.float64)
+    sorted_mat = np.sort(values, axis=0)  # NaN values sort last
+    n_valid = np.count_nonzero(~np.isnan(values), axis=0)
+    pos = pct_arr[:, np.newaxis] / 100.0 * np.maximum(n_valid - 1, 0)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, np.maximum(n_valid - 1, 0))
+    frac = pos - lo
+    lo_vals = np.take_along_axis(sorted_mat, lo, axis=0)
+    hi_vals = np.take_along_axis(sorted_mat, hi, axis=0)
+    quant_mat = lo_vals + frac * (hi_vals - lo_vals)
+    quant_mat[:, n_valid == 0] = np.nan
+
+    return quant_mat, n_valid
+
+
+def event_bands(events, percentiles=(10, 25, 50, 75, 90), min_events=3):
+    '''
+    This function computes the percentiles of close_dv_pk across events at
+    each day from peak, together with the minimum and maximum.
+
+    Args:
+        events (AlignedEvents): aligned events x offsets arrays
+        percentiles (tuple): percentiles of the bands
+        min_events (int): minimum number of events with a value at a day
+            from peak for its percentiles to be defined
+
+    Returns:
+        band_df (DataFrame): DataFrame with columns days_frm_peak, n_events,
+            min, max, and p[percentile] (e.g. p10, p50) of each percentile
+    '''
+    quant_mat, n_valid = nan_quantiles(events.close_dv_pk,
+                                       (0, 100) + tuple(percentiles))
+    band_dict = {'days_frm_peak': events.days_frm_peak, 'n_events': n_valid,
+                 'min': quant_mat[0], 'max': quant_mat[1]}
+    too_few = n_valid < min_events
+    for i, pct in enumerate(percentiles):
+        band_dict['p{:g}'.format(pct)] = np.where(too_few, np.nan,
+                                                  quant_mat[i + 2])
+    band_df = pd.DataFrame(band_dict)
+
+    return band_df
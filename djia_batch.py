@@ -0,0 +1,325 @@
+'''
+This module runs the normalized peak plot pipeline of djia_npp_bokeh.py as a
+batch over a list of series, for example other indices and sector series,
+against the same table of recessions. The batch has two stages. The fetch
+stage brings the local store of every series (see djia_store.py) up to the
+end date through a bounded pool of threads, retrying failed reads, with any
+reader(symbol, start_date, end_date) in place of Stooq.com, so that a local
+file source or fake server works offline. The render stage then reads,
+aligns, and writes the plot of each series in parallel in a process pool.
+Each series is identified by a name used in its file names, e.g.
+data/spx_close.csv and images/spx_npp_[yyyy-mm-dd].html, and a ticker
+symbol, e.g. '^SPX'.
+
+Run from the repository root with, for example,
+    python djia_batch.py djia=^DJI spx=^SPX ndq=^NDQ --end-date 2022-03-03
+
+This module defines the following function(s):
+    parse_symbols()
+    fetch_symbols()
+    render_symbol()
+    batch_npp()
+    main()
+'''
+# Import packages
+import numpy as np
+import datetime as dt
+import argparse
+import concurrent.futures
+import functools
+import logging
+import multiprocessing
+import os
+import sys
+from djia_data import get_djia_data
+from djia_store import stooq_reader, retry_reader, fetch_store
+import djia_npp_bokeh as djia
+
+logger = logging.getLogger('djia_npp')
+
+'''
+Define functions
+'''
+
+
+def parse_symbols(symbols):
+    '''
+    This function converts the series of a batch to a list of (name, symbol)
+    tuples.
+
+    Args:
+        symbols (dict or list): dictionary of symbols by name, or list of
+            'name=symbol' strings or symbols, in which case the name is the
+            lower case letters and digits of the symbol
+
+    Returns:
+        series_lst (list): list of (name, symbol) tuples
+    '''
+    if isinstance(symbols, dict):
+        return list(symbols.items())
+    series_lst = []
+    for item in symbols:
+        if '=' in item:
+            name, symbol = item.split('=', 1)
+        else:
+            symbol = item
+            name = ''.join(c for c in symbol.lower() if c.isalnum())
+        series_lst.append((name, symbol))
+
+    return series_lst
+
+
+def fetch_symbols(series_lst, end_date, reader=None, data_dir=None,
+                  n_fetch=4, retries=3, backoff_sec=1.0):
+    '''
+    This function appends the new closing values of every series through
+    end_date to its local store, with at most n_fetch reads at a time.
+
+    Args:
+        series_lst (list): list of (name, symbol) tuples
+        end_date (datetime): last date to fetch
+        reader (function or None): reader(symbol, start_date, end_date),
+            defaults to stooq_reader()
+        data_dir (str or None): directory of the stores, defaults to the data
+            folder of this directory
+        n_fetch (int): maximum number of concurrent reads
+        retries (int): number of retries of a failed read
+        backoff_sec (float): seconds before the first retry, see
+            djia_store.retry_reader()
+
+    Other functions and files called by this function:
+        djia_store.retry_reader()
+        djia_store.fetch_store()
+
+    Files created by this function:
+        [name]_close.csv and [name]_close.meta.json for each series
+
+    Returns:
+        n_new_dict (dict): number of appended rows by name
+        failed (dict): error message by name of the series whose fetch failed
+    '''
+    if reader is None:
+        reader = stooq_reader
+    if data_dir is None:
+        data_dir = os.path.join(os.path.split(os.path.abspath(__file__))[0],
+                                'data')
+    if not os.access(data_dir, os.F_OK):
+        os.makedirs(data_dir)
+    reader = retry_reader(reader, retries, backoff_sec)
+    n_new_dict = {}
+    failed = {}
+    with concurrent.futures.ThreadPoolExecutor(n_fetch) as pool:
+        futures = {pool.submit(fetch_store, data_dir, name + '_close',
+                               symbol, end_date, reader): name
+                   for name, symbol in series_lst}
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            try:
+                n_new_dict[name] = future.result()[1]
+                logger.info('Appended %d new rows to %s store',
+                            n_new_dict[name], name)
+            except Exception as err:
+                failed[name] = repr(err)
+                logger.warning('Fetch of %s failed: %s', name, failed[name])
+
+    return n_new_dict, failed
+
+
+def render_symbol(name, symbol, end_date_str, options):
+    '''
+    This function reads the local data of one series through end_date_str,
+    aligns it, and writes its normalized peak plot.
+
+    Args:
+        name (str): name of the series in its file names
+        symbol (str): ticker symbol of the series
+        end_date_str (str): end date in 'YYYY-mm-dd' format
+        options (dict): window of the plot, render_mode, data_dir, and
+            image_dir of batch_npp()
+
+    Other functions and files called by this function:
+        djia_data.get_djia_data()
+        djia_npp_bokeh.make_npp_figure()
+
+    Files created by this function:
+        images/[name]_npp_[yyyy-mm-dd].html
+        data/[name]_close_pk_[yyyy-mm-dd].csv
+
+    Returns:
+        filename (str): path of the HTML file
+    '''
+    from bokeh.io import save
+    from bokeh.resources import CDN
+
+    frwd_days_max = int(np.round(options['frwd_mths_max'] * 364.25 / 12))
+    bkwd_days_max = int(np.round(options['bkwd_mths_max'] * 364.25 / 12))
+    (events, end_date_str2, peak_vals, peak_dates, rec_label_yr_lst,
+        rec_label_yrmth_lst, rec_beg_yrmth_lst, maxdate_rng_lst) = \
+        get_djia_data(frwd_days_max, bkwd_days_max, end_date_str,
+                      download_from_internet=False,
+                      data_dir=options['data_dir'], return_events=True,
+                      symbol=symbol, series_name=name)
+    series_label = name.upper()
+    fig_title = djia.NPP_FIG_TITLE_FMT.format(series_label, events.n_events)
+    fig = djia.make_npp_figure(
+        events, rec_label_yrmth_lst,
+        dt.datetime.strptime(end_date_str2, '%Y-%m-%d'),
+        options['frwd_mths_main'], options['bkwd_mths_main'],
+        options['frwd_mths_max'], options['bkwd_mths_max'],
+        options['render_mode'], fig_title, series_label=series_label)
+    filename = os.path.join(options['image_dir'],
+                            name + '_npp_' + end_date_str2 + '.html')
+    save(fig, filename=filename, resources=CDN, title=fig_title)
+
+    return filename
+
+
+def _render_symbol_task(end_date_str, options, series):
+    '''
+    This function runs render_symbol() in a worker process and returns the
+    error message instead of raising it, so that one failed series does not
+    stop the batch.
+    '''
+    name, symbol = series
+    try:
+        return name, render_symbol(name, symbol, end_date_str, options), None
+    except Exception as err:
+        return name, None, repr(err)
+
+
+def batch_npp(symbols, end_date='today', frwd_mths_main=36, bkwd_mths_main=4,
+              frwd_mths_max=60, bkwd_mths_max=8, download_from_internet=True,
+              reader=None, render_mode='lines', n_fetch=4, retries=3,
+              n_procs=None, image_dir=None, data_dir=None):
+    '''
+    This function fetches, aligns, and renders the normalized peak plot of
+    every series of a batch.
+
+    Args:
+        symbols (dict or list): series of the batch, see parse_symbols()
+        end_date (str): either 'today' or the end date in 'YYYY-mm-dd' format
+        frwd_mths_main (int): number of months forward from the peak to plot in
+            the default main window of the visualization
+        bkwd_mths_main (int): number of months backward from the peak to plot
+            in the default main window of the visualization
+        frwd_mths_max (int): maximum number of months forward from the peak to
+            allow for the plot, to be seen by zooming out
+        bkwd_mths_max (int): maximum number of months backward from the peak to
+            allow for the plot, to be seen by zooming out
+        download_from_internet (bool): =True to run the fetch stage,
+            otherwise only read the local data files
+        reader (function or None): reader(symbol, start_date, end_date) of
+            the fetch stage, defaults to stooq_reader()
+        render_mode (str): 'lines' or 'multi_line', see djia_npp()
+        n_fetch (int): maximum number of concurrent reads
+        retries (int): number of retries of a failed read
+        n_procs (int or None): number of render processes, defaults to the
+            number of CPUs, 1 to render in this process
+        image_dir (str or None): directory of the HTML files, defaults to the
+            images folder of this directory
+        data_dir (str or None): directory of data files, defaults to the data
+            folder of this directory
+
+    Other functions and files called by this function:
+        parse_symbols()
+        fetch_symbols()
+        render_symbol()
+
+    Files created by this function:
+        images/[name]_npp_[yyyy-mm-dd].html for each series
+
+    Returns:
+        filename_dict (dict): path of the HTML file by name
+        failed (dict): error message by name of the series that failed
+    '''
+    if render_mode not in ('lines', 'multi_line'):
+        raise ValueError('render_mode must be lines or multi_line, not ' +
+                         str(render_mode))
+    if end_date == 'today':
+        end_date = dt.date.today().strftime('%Y-%m-%d')
+    cur_path = os.path.split(os.path.abspath(__file__))[0]
+    if image_dir is None:
+        image_dir = os.path.join(cur_path, 'images')
+    if not os.access(image_dir, os.F_OK):
+        os.makedirs(image_dir)
+    if data_dir is None:
+        data_dir = os.path.join(cur_path, 'data')
+    series_lst = parse_symbols(symbols)
+    failed = {}
+    if download_from_internet:
+        n_new_dict, failed = fetch_symbols(
+            series_lst, dt.datetime.strptime(end_date, '%Y-%m-%d'), reader,
+            data_dir, n_fetch, retries)
+        series_lst = [s for s in series_lst if s[0] not in failed]
+
+    options = {'frwd_mths_main': frwd_mths_main,
+               'bkwd_mths_main': bkwd_mths_main,
+               'frwd_mths_max': frwd_mths_max, 'bkwd_mths_max': bkwd_mths_max,
+               'render_mode': render_mode, 'data_dir': data_dir,
+               'image_dir': image_dir}
+    task = functools.partial(_render_symbol_task, end_date, options)
+    if n_procs is None:
+        n_procs = os.cpu_count() or 1
+    n_procs = max(1, min(n_procs, len(series_lst)))
+    if n_procs == 1:
+        results = [task(series) for series in series_lst]
+    else:
+        with multiprocessing.Pool(n_procs) as pool:
+            results = pool.map(task, series_lst)
+    filename_dict = {}
+    for name, filename, err in results:
+        if err is None:
+            filename_dict[name] = filename
+        else:
+            failed[name] = err
+            logger.warning('Render of %s failed: %s', name, err)
+
+    return filename_dict, failed
+
+
+def main(argv=None):
+    '''
+    This function is the command line interface of batch_npp().
+
+    Args:
+        argv (list or None): command line arguments, defaults to sys.argv[1:]
+
+    Returns:
+        status (int): 0 if every series succeeded, otherwise 1
+    '''
+    parser = argparse.ArgumentParser(
+        description='Render the normalized peak plot of several series')
+    parser.add_argument('symbols', nargs='+',
+                        help="'name=symbol' or symbol of each series")
+    parser.add_argument('--end-date', default='today',
+                        help="'today' or end date in YYYY-mm-dd format")
+    parser.add_argument('--frwd-mths-main', type=int, default=36)
+    parser.add_argument('--bkwd-mths-main', type=int, default=4)
+    parser.add_argument('--frwd-mths-max', type=int, default=60)
+    parser.add_argument('--bkwd-mths-max', type=int, default=8)
+    parser.add_argument('--offline', action='store_true',
+                        help='only read local data files')
+    parser.add_argument('--render-mode', choices=['lines', 'multi_line'],
+                        default='lines')
+    parser.add_argument('--fetch-threads', type=int, default=4)
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--procs', type=int, default=None)
+    parser.add_argument('--image-dir', default=None)
+    parser.add_argument('--data-dir', default=None)
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    filename_dict, failed = batch_npp(
+        args.symbols, args.end_date, args.frwd_mths_main,
+        args.bkwd_mths_main, args.frwd_mths_max, args.bkwd_mths_max,
+        download_from_internet=not args.offline,
+        render_mode=args.render_mode, n_fetch=args.fetch_threads,
+        retries=args.retries, n_procs=args.procs, image_dir=args.image_dir,
+        data_dir=args.data_dir)
+    status = 1 if failed else 0
+
+    return status
+
+
+if __name__ == '__main__':
+    # execute only if run as a script
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sys.exit(main())
@@ -0,0 +1,334 @@
+'''
+This module simulates forward paths of the current (last) event by block
+bootstrap of the daily returns of the historical events and summarizes them
+as quantile cones for the normalized peak plot. The returns are drawn at
+their phase of the recession: the block of simulated sessions s to
+s + block_len after the peak is copied from a random historical event,
+starting within phase_window sessions of session s of that event, so that
+the paths follow the crash and recovery dynamics of the past events instead
+of a pool of returns that ignores the time since the peak.
+
+All paths of a chunk are simulated at once with NumPy, one block at a time,
+and each block of log levels is added to a histogram of log levels by
+session instead of being kept, so the memory of a chunk is that of one block
+of its paths and does not grow with the horizon or the number of paths. The
+chunks are spread across a process pool and their histograms summed. Each
+chunk has its own random generator spawned from one seed, so the result
+does not depend on the number of processes. The quantiles of each session
+are read from the summed histogram, to within one bin of width
+(HIST_HI - HIST_LO) / HIST_BINS in log level.
+
+This module defines the following function(s):
+    session_returns()
+    simulate_chunk()
+    bootstrap_histogram()
+    hist_quantiles()
+    forward_offsets()
+    forward_cones()
+'''
+# Import packages
+import numpy as np
+import pandas as pd
+import multiprocessing
+import os
+from djia_metrics import get_metrics
+
+# Range and number of bins of the log level histograms, relative to the
+# current log level of the event
+HIST_LO = -4.0
+HIST_HI = 3.0
+HIST_BINS = 4096
+
+# Returns and settings of the worker processes, set once per process
+_BOOTSTRAP_STATE = {}
+
+'''
+Define functions
+'''
+
+
+def session_returns(events, rows):
+    '''
+    This function computes the log returns of the given events from each
+    trading session after the peak to the next, with sessions counted over
+    the valid offsets from peak, so that weekends and holidays of calendar
+    day offsets are skipped.
+
+    Args:
+        events (AlignedEvents): aligned events x offsets arrays
+        rows (array_like): int array of event numbers
+
+    Returns:
+        ret_mat (array): float array of shape (len(rows), S) with the log
+            return from session s to s + 1 after the peak in column s, NaN
+            after the last session of an event
+    '''
+    after = events.valid[rows] & (events.days_frm_peak >= 0)
+    n_sess = after.sum(axis=1)
+    ret_mat = np.full((len(n_sess), max(int(n_sess.max(initial=0)) - 1, 0)),
+                      np.nan)
+    for i, row in enumerate(rows):
+        log_close = np.log(events.close[row, after[i]])
+        ret_mat[i, :len(log_close) - 1] = np.diff(log_close)
+
+    return ret_mat
+
+
+def simulate_chunk(ret_mat, start_sess, n_steps, n_paths, block_len,
+                   phase_window, seed_seq):
+    '''
+    This function simulates one chunk of paths and returns the histogram of
+    their log levels, relative to the current level, at each step.
+
+    Args:
+        ret_mat (array): float array of session log returns from
+            session_returns()
+        start_sess (int): session after the peak of the current level
+        n_steps (int): number of simulated sessions
+        n_paths (int): number of paths of the chunk
+        block_len (int): number of sessions of each block
+        phase_window (int): maximum distance in sessions between the
+            simulated session and the historical session of a block start
+        seed_seq (SeedSequence): seed of the random generator of the chunk
+
+    Returns:
+        hist (array): int64 array of shape (n_steps, HIST_BINS) of the
+            number of paths in each log level bin at each step
+    '''
+    rng = np.random.default_rng(seed_seq)
+    n_hist, n_sess = ret_mat.shape
+    # block_ok[e, t] is True if event e has a full block starting at t
+    n_bad = np.concatenate(
+        (np.zeros((n_hist, 1), dtype=np.int64),
+         np.cumsum(np.isnan(ret_mat), axis=1)), axis=1)
+    block_ok = (n_bad[:, block_len:] - n_bad[:, :-block_len]) == 0
+    ret_flat = np.nan_to_num(ret_mat).ravel()
+    width = (HIST_HI - HIST_LO) / HIST_BINS
+    hist = np.zeros((n_steps, HIST_BINS), dtype=np.int64)
+    level = np.zeros(n_paths)
+    blk_arr = np.arange(block_len)
+    for step in range(0, n_steps, block_len):
+        n_blk = min(block_len, n_steps - step)
+        sess = start_sess + step
+        lo = max(0, min(sess - phase_window, block_ok.shape[1] - 1))
+        hi = max(lo, min(sess + phase_window, block_ok.shape[1] - 1))
+        ev_cand, st_cand = np.nonzero(block_ok[:, lo:hi + 1])
+        if len(ev_cand) == 0:
+            # No event has a full block near this session
+            lo = 0
+            ev_cand, st_cand = np.nonzero(block_ok)
+        pick = rng.integers(0, len(ev_cand), n_paths)
+        flat_start = ev_cand[pick] * n_sess + st_cand[pick] + lo
+        rets = ret_flat[flat_start[:, np.newaxis] + blk_arr[:n_blk]]
+        levels = level[:, np.newaxis] + np.cumsum(rets, axis=1)
+        level = levels[:, -1]
+        bins = np.clip(((levels - HIST_LO) / width).astype(np.int64), 0,
+                       HIST_BINS - 1)
+        hist[step:step + n_blk] += np.bincount(
+            (bins + blk_arr[:n_blk] * HIST_BINS).ravel(),
+            minlength=n_blk * HIST_BINS).reshape(n_blk, HIST_BINS)
+
+    return hist
+
+
+def _init_bootstrap_worker(state):
+    _BOOTSTRAP_STATE.update(state)
+
+
+def _simulate_chunks_task(chunk_lst):
+    '''
+    This function sums the histograms of a list of (n_paths, seed_seq)
+    chunks with the returns and settings of _BOOTSTRAP_STATE.
+    '''
+    state = _BOOTSTRAP_STATE
+    hist = np.zeros((state['n_steps'], HIST_BINS), dtype=np.int64)
+    for n_paths, seed_seq in chunk_lst:
+        hist += simulate_chunk(state['ret_mat'], state['start_sess'],
+                               state['n_steps'], n_paths,
+                               state['block_len'], state['phase_window'],
+                               seed_seq)
+
+    return hist
+
+
+def bootstrap_histogram(ret_mat, start_sess, n_steps, n_paths=100000,
+                        block_len=21, phase_window=21, chunk_size=10000,
+                        n_procs=1, seed=0):
+    '''
+    This function simulates n_paths paths in chunks of chunk_size paths,
+    spread across n_procs processes, and sums the histograms of the chunks.
+
+    Args:
+        ret_mat (array): float array of session log returns from
+            session_returns()
+        start_sess (int): session after the peak of the current level
+        n_steps (int): number of simulated sessions
+        n_paths (int): number of paths
+        block_len (int): number of sessions of each block
+        phase_window (int): maximum distance in sessions between the
+            simulated session and the historical session of a block start
+        chunk_size (int): number of paths simulated at once
+        n_procs (int or None): number of worker processes, defaults to the
+            number of CPUs, 1 to simulate in this process
+        seed (int): seed of the chunk random generators
+
+    Other functions and files called by this function:
+        simulate_chunk()
+
+    Returns:
+        hist (array): int64 array of shape (n_steps, HIST_BINS) of the
+            number of paths in each log level bin at each step
+    '''
+    n_chunks = -(-n_paths // chunk_size)
+    chunk_lst = list(zip(
+        [chunk_size] * (n_chunks - 1) + [n_paths - chunk_size *
+                                         (n_chunks - 1)],
+        np.random.SeedSequence(seed).spawn(n_chunks)))
+    if n_procs is None:
+        n_procs = os.cpu_count() or 1
+    n_procs = max(1, min(n_procs, n_chunks))
+    state = {'ret_mat': ret_mat, 'start_sess': start_sess,
+             'n_steps': n_steps, 'block_len': block_len,
+             'phase_window': phase_window}
+    task_lst = [chunk_lst[i::n_procs] for i in range(n_procs)]
+    _BOOTSTRAP_STATE.clear()
+    _BOOTSTRAP_STATE.update(state)
+    try:
+        if n_procs == 1:
+            hist_lst = [_simulate_chunks_task(chunk_lst)]
+        else:
+            if 'fork' in multiprocessing.get_all_start_methods():
+                # Workers inherit the returns from this process
+                ctx = multiprocessing.get_context('fork')
+                initializer, initargs = None, ()
+            else:
+                # Workers receive the returns once, not once per chunk
+                ctx = multiprocessing.get_context()
+                initializer, initargs = _init_bootstrap_worker, (state,)
+            with ctx.Pool(n_procs, initializer, initargs) as pool:
+                hist_lst = pool.map(_simulate_chunks_task, task_lst)
+    finally:
+        _BOOTSTRAP_STATE.clear()
+    hist = np.sum(hist_lst, axis=0)
+
+    return hist
+
+
+def hist_quantiles(hist, percentiles):
+    '''
+    This function reads percentiles of the log level at each step from the
+    histograms, interpolating linearly within the bins.
+
+    Args:
+        hist (array): int array of shape (n_steps, HIST_BINS)
+        percentiles (array_like): percentiles in [0, 100]
+
+    Returns:
+        quant_mat (array): float array of shape (len(percentiles), n_steps)
+            of log levels relative to the current level
+    '''
+    width = (HIST_HI - HIST_LO) / HIST_BINS
+    cum = np.cumsum(hist, axis=1)
+    n_paths = cum[:, -1:]
+    quant_mat = np.empty((len(percentiles), hist.shape[0]))
+    for i, pct in enumerate(percentiles):
+        target = pct / 100.0 * n_paths
+        bin_idx = np.minimum(np.argmax(cum >= target, axis=1),
+                             HIST_BINS - 1)[:, np.newaxis]
+        below = np.take_along_axis(cum, bin_idx, axis=1) - \
+            np.take_along_axis(hist, bin_idx, axis=1)
+        frac = ((target - below) /
+                np.maximum(np.take_along_axis(hist, bin_idx, axis=1), 1))
+        quant_mat[i] = HIST_LO + width * (bin_idx + frac)[:, 0]
+
+    return quant_mat
+
+
+def forward_offsets(events, row, n_steps):
+    '''
+    This function returns the offsets from peak of the n_steps sessions
+    after the last valid session of an event: the next weekdays for calendar
+    day offsets and the next offsets for trading sessions or bars.
+
+    Args:
+        events (AlignedEvents): aligned events x offsets arrays
+        row (int): event number
+        n_steps (int): number of sessions
+
+    Returns:
+        off_arr (array): int64 array of offsets from peak of each session
+    '''
+    last = np.flatnonzero(events.valid[row])[-1]
+    if events.offset_unit != 'days':
+        return events.days_frm_peak[last] + np.arange(1, n_steps + 1)
+    last_date = np.datetime64(int(events.date_days[row, last]), 'D')
+    peak_day = np.datetime64(events.peak_dates[row], 'D')
+    off_arr = (np.busday_offset(last_date, np.arange(1, n_steps + 1),
+                                roll='forward') - peak_day).astype(np.int64)
+
+    return off_arr
+
+
+def forward_cones(events, n_paths=100000, percentiles=(5, 25, 50, 75, 95),
+                  block_len=21, phase_window=21, chunk_size=10000,
+                  n_procs=1, seed=0, metrics=None):
+    '''
+    This function simulates the forward paths of the current (last) event
+    through the end of the aligned window from the returns of the other
+    events and returns the quantile cones of close_dv_pk.
+
+    Args:
+        events (AlignedEvents): aligned events x offsets arrays, with the
+            current event last
+        n_paths (int): number of paths
+        percentiles (tuple): percentiles of the cones
+        block_len (int): number of sessions of each block
+        phase_window (int): maximum distance in sessions between the
+            simulated session and the historical session of a block start
+        chunk_size (int): number of paths simulated at once
+        n_procs (int or None): number of worker processes, see
+            bootstrap_histogram()
+        seed (int): seed of the simulation
+        metrics (StageMetrics or None): if not None, records the 'bootstrap'
+            stage with the number of paths and steps, see djia_metrics.py
+
+    Other functions and files called by this function:
+        session_returns()
+        bootstrap_histogram()
+        hist_quantiles()
+        forward_offsets()
+
+    Returns:
+        cone_df (DataFrame): DataFrame with columns days_frm_peak and
+            p[percentile] (e.g. p5, p50) of close_dv_pk, starting at the last
+            valid offset of the current event, empty if the window has no
+            offsets after it
+    '''
+    cur = events.n_events - 1
+    ret_mat = session_returns(events, np.arange(cur))
+    after = np.flatnonzero(events.valid[cur] & (events.days_frm_peak >= 0))
+    start_sess = len(after) - 1
+    start_level = np.log(events.close_dv_pk[cur, after[-1]])
+    # Simulate the sessions of the history after the current session that
+    # fall inside the aligned window
+    n_steps = max(ret_mat.shape[1] - start_sess, 0)
+    off_arr = forward_offsets(events, cur, n_steps)
+    n_steps = int(np.searchsorted(off_arr, events.days_frm_peak[-1],
+                                  side='right'))
+    if n_steps == 0 or ret_mat.shape[1] < block_len:
+        return pd.DataFrame(columns=['days_frm_peak'] +
+                            ['p{:g}'.format(p) for p in percentiles])
+    with get_metrics(metrics).stage('bootstrap', n_paths=n_paths,
+                                    n_steps=n_steps):
+        hist = bootstrap_histogram(ret_mat, start_sess, n_steps, n_paths,
+                                   block_len, phase_window, chunk_size,
+                                   n_procs, seed)
+    quant_mat = hist_quantiles(hist, percentiles)
+    cone_dict = {'days_frm_peak': np.append(events.days_frm_peak[after[-1]],
+                                            off_arr[:n_steps])}
+    for i, pct in enumerate(percentiles):
+        cone_dict['p{:g}'.format(pct)] = np.exp(
+            start_level + np.append(0.0, quant_mat[i]))
+    cone_df = pd.DataFrame(cone_dict)
+
+    return cone_df
@@ -0,0 +1,218 @@
+'''
+This module contains a two-tier memoization cache for the aligned events
+computed by get_djia_data(). Entries are keyed on a content hash of the
+source series and event date ranges plus the (bkwd_days_max, frwd_days_max)
+window. The first tier is an in-process least-recently-used (LRU) dictionary
+with a bounded number of entries. The optional second tier is a directory of
+.npz files bounded in total bytes, from which the least recently used files
+are evicted. A request for a window can be answered by slicing any cached
+entry of the same series with a window at least as large.
+
+This module defines the following function(s):
+    series_hash()
+
+This module defines the following class(es):
+    AlignCache
+'''
+# Import packages
+import numpy as np
+import collections
+import hashlib
+import io
+import os
+from djia_align import AlignedEvents
+
+'''
+Define functions
+'''
+
+
+def series_hash(djia_close, maxdate_rng_lst, offset_unit='days'):
+    '''
+    This function computes the content hash of a closing value series, the
+    event date ranges, and the offset unit used to align it.
+
+    Args:
+        djia_close (DataFrame): DataFrame with 'Date' and 'Close' columns
+        maxdate_rng_lst (list): list of tuples with start string date and end
+            string date of the peak range of each event
+        offset_unit (str): 'days' or 'sessions', see AlignedEvents
+
+    Returns:
+        content_hash (str): hexadecimal SHA-1 hash
+    '''
+    hasher = hashlib.sha1()
+    hasher.update(np.ascontiguousarray(
+        djia_close['Date'].values.astype('datetime64[D]')).tobytes())
+    hasher.update(np.ascontiguousarray(
+        djia_close['Close'].to_numpy(dtype=np.float64)).tobytes())
+    hasher.update(repr([tuple(rng) for rng in maxdate_rng_lst]).encode())
+    if offset_unit != 'days':
+        # The hash of a calendar-day series excludes the offset unit, so
+        # that existing cache entries stay valid
+        hasher.update(offset_unit.encode())
+    content_hash = hasher.hexdigest()
+
+    return content_hash
+
+
+class AlignCache:
+    '''
+    This class is a two-tier cache of AlignedEvents keyed on
+    (content_hash, bkwd_days_max, frwd_days_max).
+
+    Attributes:
+        max_entries (int): maximum number of entries in the in-process tier
+        cache_dir (str or None): directory of the on-disk tier, None for no
+            on-disk tier
+        max_bytes (int): maximum total size in bytes of the on-disk tier
+        hits (int): number of get() calls answered from the cache
+        misses (int): number of get() calls not answered from the cache
+    '''
+
+    def __init__(self, max_entries=16, cache_dir=None, max_bytes=2 ** 28):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._mem = collections.OrderedDict()
+        if cache_dir is not None and not os.access(cache_dir, os.F_OK):
+            os.makedirs(cache_dir)
+
+    def get(self, content_hash, bkwd_days_max, frwd_days_max):
+        '''
+        This method returns the cached AlignedEvents for a series and window,
+        sliced from a larger cached window if needed, or None on a miss.
+        Entries found on disk are promoted to the in-process tier.
+
+        Args:
+            content_hash (str): content hash from series_hash()
+            bkwd_days_max (int): maximum number of days backward from peak
+            frwd_days_max (int): maximum number of days forward from peak
+
+        Returns:
+            events (AlignedEvents or None): cached aligned events
+        '''
+        key = self._covering_key(list(self._mem), content_hash,
+                                 bkwd_days_max, frwd_days_max)
+        if key is not None:
+            self._mem.move_to_end(key)
+            events = self._mem[key]
+        else:
+            key = self._covering_key(self._disk_keys(), content_hash,
+                                     bkwd_days_max, frwd_days_max)
+            if key is None:
+                self.misses += 1
+                return None
+            file_path = self._disk_path(key)
+            os.utime(file_path)
+            events = _load_events(file_path)
+            self._put_mem(key, events)
+        self.hits += 1
+        if key[1:] != (bkwd_days_max, frwd_days_max):
+            events = events.window(bkwd_days_max, frwd_days_max)
+
+        return events
+
+    def put(self, content_hash, bkwd_days_max, frwd_days_max, events):
+        '''
+        This method stores AlignedEvents in both tiers and evicts the least
+        recently used entries beyond the tier limits.
+
+        Args:
+            content_hash (str): content hash from series_hash()
+            bkwd_days_max (int): maximum number of days backward from peak
+            frwd_days_max (int): maximum number of days forward from peak
+            events (AlignedEvents): aligned events to cache
+        '''
+        key = (content_hash, bkwd_days_max, frwd_days_max)
+        self._put_mem(key, events)
+        if self.cache_dir is not None:
+            _save_events(self._disk_path(key), events)
+            self._evict_disk()
+
+    def _put_mem(self, key, events):
+        self._mem[key] = events
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    @staticmethod
+    def _covering_key(keys, content_hash, bkwd_days_max, frwd_days_max):
+        '''
+        This method returns the exact key if present, otherwise the smallest
+        key of the same series whose window covers the requested window.
+        '''
+        exact = (content_hash, bkwd_days_max, frwd_days_max)
+        if exact in keys:
+            return exact
+        covering = [k for k in keys if k[0] == content_hash and
+                    k[1] >= bkwd_days_max and k[2] >= frwd_days_max]
+        if not covering:
+            return None
+
+        return min(covering, key=lambda k: k[1] + k[2])
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir,
+                            '{}_{}_{}.npz'.format(*key))
+
+    def _disk_keys(self):
+        if self.cache_dir is None:
+            return []
+        keys = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith('.npz'):
+                continue
+            parts = file_name[:-len('.npz')].split('_')
+            if len(parts) == 3:
+                keys.append((parts[0], int(parts[1]), int(parts[2])))
+
+        return keys
+
+    def _evict_disk(self):
+        '''
+        This method deletes the least recently used .npz files until the
+        on-disk tier is within max_bytes.
+        '''
+        file_paths = [self._disk_path(k) for k in self._disk_keys()]
+        file_stats = sorted((os.stat(p).st_mtime, os.stat(p).st_size, p)
+                            for p in file_paths)
+        total_bytes = sum(size for _, size, _ in file_stats)
+        for _, size, file_path in file_stats:
+            if total_bytes <= self.max_bytes:
+                break
+            os.remove(file_path)
+            total_bytes -= size
+
+
+def _save_events(file_path, events):
+    '''
+    This function atomically writes AlignedEvents to an .npz file.
+    '''
+    buffer = io.BytesIO()
+    np.savez(buffer, days_frm_peak=events.days_frm_peak, close=events.close,
+             date_days=events.date_days, valid=events.valid,
+             peak_vals=events.peak_vals,
+             peak_dates=np.array(events.peak_dates),
+             offset_unit=np.array(events.offset_unit))
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(buffer.getvalue())
+    os.replace(tmp_path, file_path)
+
+
+def _load_events(file_path):
+    '''
+    This function reads AlignedEvents from an .npz file.
+    '''
+    with np.load(file_path) as npz:
+        offset_unit = (str(npz['offset_unit']) if 'offset_unit' in npz
+                       else 'days')
+        events = AlignedEvents(npz['days_frm_peak'], npz['close'],
+                               npz['date_days'], npz['valid'],
+                               npz['peak_vals'], npz['peak_dates'].tolist(),
+                               offset_unit)
+
+    return events
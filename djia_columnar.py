@@ -0,0 +1,112 @@
+'''
+This module defines a columnar binary storage format for the DataFrames
+written and read by get_djia_data(), as an optional alternative to csv files.
+A DataFrame is stored as a directory with one NumPy .npy file per column and
+a small JSON schema file with the column order and kinds. Datetime columns
+are stored as int64 days since the Unix epoch (with NaT stored as the minimum
+int64 value) and numeric columns are stored in their own dtype, so every
+column can be memory-mapped on read without parsing.
+
+This module defines the following function(s):
+    columnar_path()
+    write_columnar()
+    read_columnar()
+'''
+# Import packages
+import numpy as np
+import pandas as pd
+import json
+import os
+import shutil
+
+NAT_DAYS = np.iinfo(np.int64).min
+SCHEMA_FILE = 'schema.json'
+
+'''
+Define functions
+'''
+
+
+def columnar_path(data_dir, stem):
+    '''
+    This function returns the path of the columnar directory for a file stem,
+    e.g. data/djia_close_2022-03-03.npy for stem 'djia_close_2022-03-03'.
+
+    Args:
+        data_dir (str): data directory
+        stem (str): file name without extension
+
+    Returns:
+        col_path (str): path of the columnar directory
+    '''
+    col_path = os.path.join(data_dir, stem + '.npy')
+
+    return col_path
+
+
+def write_columnar(df, col_path):
+    '''
+    This function writes a DataFrame to a columnar directory of .npy files.
+    The directory is written next to its final location and then renamed
+    into place so readers never see a partially written directory.
+
+    Args:
+        df (DataFrame): DataFrame with datetime and numeric columns
+        col_path (str): path of the columnar directory
+
+    Returns:
+        n_bytes (int): total size in bytes of the column files
+    '''
+    tmp_path = col_path + '.tmp'
+    if os.access(tmp_path, os.F_OK):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    schema = []
+    n_bytes = 0
+    for j, col in enumerate(df.columns):
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            kind = 'date'
+            # NaT casts to NAT_DAYS, the minimum int64 value
+            col_arr = df[col].values.astype('datetime64[D]').astype(np.int64)
+        else:
+            kind = 'value'
+            col_arr = df[col].to_numpy()
+        file_name = str(j) + '.npy'
+        np.save(os.path.join(tmp_path, file_name), col_arr)
+        n_bytes += os.path.getsize(os.path.join(tmp_path, file_name))
+        schema.append({'name': str(col), 'kind': kind, 'file': file_name})
+    with open(os.path.join(tmp_path, SCHEMA_FILE), 'w') as f:
+        json.dump({'n_rows': len(df), 'columns': schema}, f)
+    if os.access(col_path, os.F_OK):
+        shutil.rmtree(col_path)
+    os.replace(tmp_path, col_path)
+
+    return n_bytes
+
+
+def read_columnar(col_path, mmap_mode='r'):
+    '''
+    This function reads a DataFrame from a columnar directory of .npy files.
+
+    Args:
+        col_path (str): path of the columnar directory
+        mmap_mode (str or None): memory-map mode passed to numpy.load(),
+            None reads the columns into memory
+
+    Returns:
+        df (DataFrame): DataFrame with the stored columns, with date columns
+            converted back to datetime64[ns]
+    '''
+    with open(os.path.join(col_path, SCHEMA_FILE)) as f:
+        schema = json.load(f)
+    col_dict = {}
+    for col_info in schema['columns']:
+        col_arr = np.load(os.path.join(col_path, col_info['file']),
+                          mmap_mode=mmap_mode)
+        if col_info['kind'] == 'date':
+            # NAT_DAYS casts back to NaT
+            col_arr = col_arr.astype('datetime64[D]').astype('datetime64[ns]')
+        col_dict[col_info['name']] = col_arr
+    df = pd.DataFrame(col_dict)
+
+    return df
@@ -0,0 +1,428 @@
+'''
+This module is the data-only entry point of the DJIA normalized peak plot. It
+reads the Dow Jones Industrial Average (DJIA) daily closing price series from
+the local data files or the local DJIA store, or brings the store up to date
+from Stooq.com, and aligns it into one series for each of the last 15
+recessions of the event table data/recessions.csv, or for each drawdown
+detected in the series (see djia_events.py), by calendar days or by trading
+sessions from peak. It can also align the bars of an intraday file, read in
+bounded memory by djia_intraday.py, by bars from peak. It imports neither
+Bokeh nor, on the offline path, pandas_datareader, so that batch jobs that
+only need the aligned data start quickly. The plotting functions are in
+djia_npp_bokeh.py.
+
+This module defines the following function(s):
+    load_djia_close()
+    get_djia_data()
+    main()
+'''
+# Import packages
+import numpy as np
+import pandas as pd
+import datetime as dt
+import os
+import sys
+import argparse
+import logging
+from djia_align import (align_events, to_epoch_days, bars_per_session,
+                        OFFSETS_PER_YEAR)
+from djia_store import stooq_reader, fetch_store, load_store
+from djia_columnar import columnar_path, write_columnar, read_columnar
+from djia_cache import series_hash
+from djia_metrics import get_metrics
+from djia_events import load_event_table, detect_drawdowns
+
+logger = logging.getLogger('djia_npp')
+
+'''
+Define functions
+'''
+
+
+def load_djia_close(end_date_str, download_from_internet=True, reader=None,
+                    data_dir=None, storage_format='csv', metrics=None,
+                    symbol='^DJI', series_name='djia'):
+    '''
+    This function either downloads or reads in the DJIA closing value series
+    through end_date_str, without aligning it.
+
+    Args:
+        end_date_str (str): end date of DJIA time series in 'YYYY-mm-dd' format
+        download_from_internet (bool): =True if download data from Stooq.com,
+            otherwise read date in from local directory
+        reader (function or None): reader(symbol, start_date, end_date) used
+            in place of stooq_reader() to fetch new data
+        data_dir (str or None): directory of data files, defaults to the data
+            folder of this directory
+        storage_format (str): 'csv' or 'npy', see get_djia_data()
+        metrics (StageMetrics or None): if not None, records the 'fetch' and
+            'parse' stages, see djia_metrics.py
+        symbol (str): ticker symbol passed to the reader
+        series_name (str): name of the series in the data file names, which
+            are [series_name]_close_[yyyy-mm-dd].csv and the store
+            [series_name]_close.csv
+
+    Other functions and files called by this function:
+        djia_store.fetch_store()
+        djia_store.load_store()
+        djia_close_[yyyy-mm-dd].csv
+        djia_close.csv (DJIA store, read if no djia_close_[yyyy-mm-dd].csv)
+        djia_close_[yyyy-mm-dd].npy (if storage_format='npy')
+
+    Files created by this function:
+        djia_close.csv and djia_close.meta.json (DJIA store, appended to)
+        djia_close_[yyyy-mm-dd].npy (if storage_format='npy')
+
+    Returns:
+        djia_close (DataFrame): DataFrame with Date and Close columns
+        end_date_str2 (str): actual end date of the series in 'YYYY-mm-dd'
+            format
+    '''
+    end_date = dt.datetime.strptime(end_date_str, '%Y-%m-%d')
+    metrics = get_metrics(metrics)
+    if data_dir is None:
+        data_dir = os.path.join(os.path.split(os.path.abspath(__file__))[0],
+                                'data')
+    filename_basic = os.path.join(data_dir,
+                                  series_name + '_close_' + end_date_str +
+                                  '.csv')
+    colpath_basic = columnar_path(data_dir,
+                                  series_name + '_close_' + end_date_str)
+
+    if download_from_internet:
+        # Bring the local DJIA store up to end_date, downloading only the
+        # days after its last stored date from Stooq.com (requires internet
+        # connection unless a local stand-in reader is given)
+        if reader is None:
+            reader = stooq_reader
+        with metrics.stage('fetch') as record:
+            meta, n_new = fetch_store(data_dir, series_name + '_close',
+                                      symbol, end_date, reader=reader)
+            record['n_rows'] = n_new
+        logger.info('Appended %d new rows to %s store', n_new, symbol)
+        with metrics.stage('parse', n_bytes=meta['n_bytes']) as record:
+            djia_close = load_store(data_dir, series_name + '_close',
+                                    end_date)
+            record['n_rows'] = len(djia_close)
+        end_date_str2 = djia_close['Date'].iloc[-1].strftime('%Y-%m-%d')
+    elif storage_format == 'npy' and os.access(colpath_basic, os.F_OK):
+        # Memory-map the columnar binary copy of the data
+        end_date_str2 = end_date_str
+        with metrics.stage('parse') as record:
+            djia_close = read_columnar(colpath_basic)
+            record['n_rows'] = len(djia_close)
+    elif os.access(filename_basic, os.F_OK):
+        # Import the data as pandas DataFrame
+        end_date_str2 = end_date_str
+        with metrics.stage('parse') as record:
+            djia_close = pd.read_csv(filename_basic,
+                                     names=['Date', 'Close'],
+                                     parse_dates=['Date'], skiprows=1,
+                                     na_values=['.', 'na', 'NaN'])
+            djia_close = djia_close.dropna()
+            record['n_rows'] = len(djia_close)
+            record['n_bytes'] = os.path.getsize(filename_basic)
+        if storage_format == 'npy':
+            # Save a columnar binary copy so later runs skip csv parsing
+            write_columnar(djia_close, colpath_basic)
+    else:
+        # Read the data through end_date from the local DJIA store
+        with metrics.stage('parse') as record:
+            djia_close = load_store(data_dir, series_name + '_close',
+                                    end_date)
+            record['n_rows'] = 0 if djia_close is None else len(djia_close)
+        if djia_close is None or len(djia_close) == 0:
+            raise FileNotFoundError('No file ' + filename_basic + ' and no ' +
+                                    symbol + ' store data in ' + data_dir)
+        end_date_str2 = djia_close['Date'].iloc[-1].strftime('%Y-%m-%d')
+
+    return djia_close, end_date_str2
+
+
+def get_djia_data(frwd_days_max, bkwd_days_max, end_date_str,
+                  download_from_internet=True, reader=None, data_dir=None,
+                  storage_format='csv', return_events=False, cache=None,
+                  save_data=True, metrics=None, djia_close=None,
+                  symbol='^DJI', series_name='djia', event_table=None,
+                  drawdown_threshold=None, offset_unit='days'):
+    '''
+    This function either downloads or reads in the DJIA data series and adds
+    variables days_frm_peak and close_dv_pk for each of the last 15 recessions
+    (or for each event of another event table or each detected drawdown).
+
+    Args:
+        frwd_days_max (int): maximum number of days (or sessions) forward
+            from the peak to plot
+        bckwd_days_max (int): maximum number of days (or sessions) backward
+            from the peak to plot
+        end_date_str (str): end date of DJIA time series in 'YYYY-mm-dd' format
+        download_from_internet (bool): =True if download data from Stooq.com,
+            otherwise read date in from local directory
+        reader (function or None): reader(symbol, start_date, end_date) used
+            in place of stooq_reader() to fetch new data, e.g. a local
+            stand-in from csv_reader()
+        data_dir (str or None): directory of data files, defaults to the data
+            folder of this directory
+        storage_format (str): 'csv' to read and write csv files, or 'npy' to
+            read the columnar binary djia_close_[yyyy-mm-dd].npy directory
+            (created from the csv file on first use) and write the aligned
+            output as djia_close_pk_[yyyy-mm-dd].npy
+        return_events (bool): =True to return the aligned data as an
+            AlignedEvents container of events x offsets arrays instead of the
+            wide DataFrame
+        cache (AlignCache or None): if not None, cache of aligned events
+            keyed on the content of the series and the window, used to skip
+            the peak search and alignment on repeated calls, and the write
+            of an aligned output file that already exists
+        save_data (bool): =True to write the aligned output file
+        metrics (StageMetrics or None): if not None, records the 'fetch',
+            'parse', 'peak_search', 'alignment', and 'write' stages, see
+            djia_metrics.py
+        djia_close (DataFrame or None): if not None, already loaded Date and
+            Close series to align instead of loading it, in which case its
+            last date is the end date
+        symbol (str): ticker symbol passed to the reader
+        series_name (str): name of the series in the data file names, which
+            are [series_name]_close_[yyyy-mm-dd].csv, the store
+            [series_name]_close.csv, and the output
+            [series_name]_close_pk_[yyyy-mm-dd].csv
+        event_table (str or None): path of the event table csv file of the
+            recessions, defaults to data/recessions.csv, see
+            djia_events.load_event_table()
+        drawdown_threshold (float or None): if not None, align every
+            drawdown of the series of at least this fraction of its running
+            maximum instead of the events of the event table, see
+            djia_events.detect_drawdowns()
+        offset_unit (str): 'days' to align on calendar days from peak, or
+            'sessions' (or 'bars' for the intraday bars of djia_close) to
+            align on rows from peak, in which case frwd_days_max and
+            bkwd_days_max are numbers of sessions (or bars), see
+            djia_align.align_events()
+
+    Other functions and files called by this function:
+        load_djia_close() (if djia_close is None)
+        djia_events.load_event_table() or djia_events.detect_drawdowns()
+        data/recessions.csv
+        djia_cache.AlignCache (if cache is not None)
+
+    Files created by this function:
+        djia_close.csv and djia_close.meta.json (DJIA store, appended to)
+        djia_close_pk_[yyyy-mm-dd].csv (or .npy if storage_format='npy',
+            not written if save_data=False, or if the events are a cache hit
+            and the file exists)
+        djia_close_dd[pct]_pk_[yyyy-mm-dd].csv in place of the above if
+            drawdown_threshold is not None, with pct the threshold in percent
+        djia_close_pk_sessions_[yyyy-mm-dd].csv (or with the dd[pct] part
+            above) if offset_unit='sessions'
+        djia_close_[yyyy-mm-dd].npy (if storage_format='npy')
+
+    Returns:
+        djia_close_pk (DataFrame): N x 46 DataFrame of days_frm_peak, Date{i},
+            Close{i}, and close_dv_pk{i} for each of the 15 recessions for the
+            periods specified by bkwd_days_max and frwd_days_max, or an
+            AlignedEvents container of the same data if return_events=True
+        end_date_str2 (str): actual end date of DJIA time series in
+            'YYYY-mm-dd' format. Can differ from the end_date input to this
+            function if the final data for that day have not come out yet
+            (usually 2 hours after markets close, 6:30pm EST), or if the
+            end_date is one on which markets are closed (e.g. weekends and
+            holidays). In this latter case, the pandas_datareader library
+            chooses the most recent date for which we have DJIA data.
+        peak_vals (list): list of peak DJIA value at the beginning of each of
+            the last 15 recessions
+        peak_dates (list): list of string date (YYYY-mm-dd) of peak DJIA value
+            at the beginning of each of the last 15 recessions
+        rec_label_yr_lst (list): list of string start year and end year of each
+            of the last 15 recessions
+        rec_label_yrmth_lst (list): list of string start year and month and end
+            year and month of each of the last 15 recessions
+        rec_beg_yrmth_lst (list): list of string start year and month of each
+            of the last 15 recessions
+        maxdate_rng_lst (list): list of tuples with start string date and end
+            string date within which range we define the peak DJIA value at the
+            beginning of each of the last 15 recessions
+    '''
+    metrics = get_metrics(metrics)
+
+    # Name the current directory and make sure it has a data folder
+    cur_path = os.path.split(os.path.abspath(__file__))[0]
+    if data_dir is None:
+        data_fldr = 'data'
+        data_dir = os.path.join(cur_path, data_fldr)
+    if not os.access(data_dir, os.F_OK):
+        os.makedirs(data_dir)
+
+    if storage_format not in ('csv', 'npy'):
+        raise ValueError('storage_format must be csv or npy, not ' +
+                         str(storage_format))
+    if djia_close is None:
+        djia_close, end_date_str2 = load_djia_close(
+            end_date_str, download_from_internet, reader, data_dir,
+            storage_format, metrics, symbol, series_name)
+    else:
+        end_date_str2 = djia_close['Date'].iloc[-1].strftime('%Y-%m-%d')
+    end_date = dt.datetime.strptime(end_date_str2, '%Y-%m-%d')
+
+    if drawdown_threshold is None:
+        pk_stem = series_name + '_close_pk_'
+    else:
+        # Keep the drawdown events apart from the recession events
+        pk_stem = (series_name + '_close_dd' +
+                   str(int(round(drawdown_threshold * 100))) + '_pk_')
+    if offset_unit != 'days':
+        # Keep the trading-session offsets apart from the calendar-day ones
+        pk_stem += offset_unit + '_'
+    pk_stem += end_date_str2
+    filename_full = os.path.join(data_dir, pk_stem + '.csv')
+    colpath_full = columnar_path(data_dir, pk_stem)
+
+    logger.info('End date of %s series is %s', symbol,
+                end_date.strftime('%Y-%m-%d'))
+
+    # Set event-specific parameters from the event table of recessions, or
+    # detect every drawdown of the series beyond drawdown_threshold
+    if drawdown_threshold is None:
+        (rec_label_yr_lst, rec_label_yrmth_lst, rec_beg_yrmth_lst,
+            maxdate_rng_lst) = load_event_table(event_table)
+    else:
+        (rec_label_yr_lst, rec_label_yrmth_lst, rec_beg_yrmth_lst,
+            maxdate_rng_lst) = detect_drawdowns(djia_close,
+                                                drawdown_threshold)
+
+    # Drop the recessions whose peak date range starts before the first date
+    # of the series, which happens for series with a shorter history than
+    # the DJIA
+    first_date = djia_close['Date'].iloc[0]
+    keep_lst = [i for i, rng in enumerate(maxdate_rng_lst)
+                if pd.Timestamp(rng[0]) >= first_date]
+    if len(keep_lst) < len(maxdate_rng_lst):
+        logger.info('Dropped %d recessions before the first %s date %s',
+                    len(maxdate_rng_lst) - len(keep_lst), symbol,
+                    first_date.strftime('%Y-%m-%d'))
+        rec_label_yr_lst = [rec_label_yr_lst[i] for i in keep_lst]
+        rec_label_yrmth_lst = [rec_label_yrmth_lst[i] for i in keep_lst]
+        rec_beg_yrmth_lst = [rec_beg_yrmth_lst[i] for i in keep_lst]
+        maxdate_rng_lst = [maxdate_rng_lst[i] for i in keep_lst]
+
+    # Create normalized peak series for each recession. Each peak is the
+    # maximum closing value within two months (with only ? exceptions) of the
+    # beginning month of the recession. The aligned windows are gathered in
+    # one batched step because weekends make these data have missing points
+    # relative to the days_frm_peak grid
+    events = None
+    if cache is not None:
+        content_hash = series_hash(djia_close, maxdate_rng_lst, offset_unit)
+        events = cache.get(content_hash, bkwd_days_max, frwd_days_max)
+    if events is None:
+        events = align_events(djia_close, maxdate_rng_lst, bkwd_days_max,
+                              frwd_days_max, metrics=metrics,
+                              offset_unit=offset_unit)
+        if cache is not None:
+            cache.put(content_hash, bkwd_days_max, frwd_days_max, events)
+    elif os.path.exists(colpath_full if storage_format == 'npy' else
+                        filename_full):
+        # The output file of a cache hit was already written from the same
+        # series, so skip rebuilding the wide frame and rewriting it
+        save_data = False
+    peak_vals = events.peak_vals.tolist()
+    peak_dates = events.peak_dates
+    for i, peak_val in enumerate(peak_vals):
+        logger.info('peak_val %d is %s on date %s (Beg. rec. month: %s )', i,
+                    peak_val, peak_dates[i], rec_beg_yrmth_lst[i])
+
+    if return_events:
+        djia_close_pk = events
+        if save_data:
+            djia_close_pk_wide = events.to_wide()
+    else:
+        djia_close_pk = djia_close_pk_wide = events.to_wide()
+    if save_data:
+        with metrics.stage('write',
+                           n_rows=len(djia_close_pk_wide)) as record:
+            if storage_format == 'npy':
+                record['n_bytes'] = write_columnar(djia_close_pk_wide,
+                                                   colpath_full)
+            else:
+                djia_close_pk_wide.to_csv(filename_full, index=False)
+                record['n_bytes'] = os.path.getsize(filename_full)
+
+    return (djia_close_pk, end_date_str2, peak_vals, peak_dates,
+            rec_label_yr_lst, rec_label_yrmth_lst, rec_beg_yrmth_lst,
+            maxdate_rng_lst)
+
+
+def main(argv=None):
+    '''
+    This function is the command line interface of the data-only path. It
+    writes the aligned data file djia_close_pk_[yyyy-mm-dd].csv (or .npy)
+    for the given end date without importing the plotting stack.
+
+    Args:
+        argv (list or None): command line arguments, defaults to sys.argv[1:]
+
+    Other functions and files called by this function:
+        get_djia_data()
+
+    Returns:
+        end_date_str2 (str): end date of the aligned data in 'YYYY-mm-dd'
+            format
+    '''
+    parser = argparse.ArgumentParser(
+        description='Write the aligned DJIA data without plotting')
+    parser.add_argument('end_date', nargs='?', default='today',
+                        help="'today' or end date in YYYY-mm-dd format")
+    parser.add_argument('--frwd-mths-max', type=int, default=60)
+    parser.add_argument('--bkwd-mths-max', type=int, default=8)
+    parser.add_argument('--offline', action='store_true',
+                        help='read local data instead of Stooq.com')
+    parser.add_argument('--storage-format', choices=['csv', 'npy'],
+                        default='csv')
+    parser.add_argument('--data-dir', default=None,
+                        help='directory of data files, defaults to ./data')
+    parser.add_argument('--event-table', default=None,
+                        help='event table csv file, defaults to ' +
+                        'data/recessions.csv')
+    parser.add_argument('--drawdown-threshold', type=float, default=None,
+                        help='align every drawdown of at least this ' +
+                        'fraction instead of the event table')
+    parser.add_argument('--offset-unit', choices=['days', 'sessions', 'bars'],
+                        default='days',
+                        help='align on calendar days, trading sessions, ' +
+                        'or intraday bars from peak')
+    parser.add_argument('--intraday-file', default=None,
+                        help='intraday csv file to align instead of the ' +
+                        'daily series')
+    parser.add_argument('--bar-size', default='1D',
+                        help='bar size of the intraday file, e.g. 1D or 5min')
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    if args.end_date == 'today':
+        end_date_str = dt.date.today().strftime('%Y-%m-%d')
+    else:
+        end_date_str = args.end_date
+    djia_close = None
+    per_year = OFFSETS_PER_YEAR[args.offset_unit]
+    if args.intraday_file is not None:
+        from djia_intraday import load_intraday_close
+        djia_close = load_intraday_close(
+            args.intraday_file, load_event_table(args.event_table)[3],
+            args.bkwd_mths_max, args.frwd_mths_max, args.bar_size,
+            args.offset_unit)
+        if args.offset_unit == 'bars':
+            per_year *= bars_per_session(
+                to_epoch_days(djia_close['Date'].values))
+    frwd_days_max = int(np.round(args.frwd_mths_max * per_year / 12))
+    bkwd_days_max = int(np.round(args.bkwd_mths_max * per_year / 12))
+    end_date_str2 = get_djia_data(
+        frwd_days_max, bkwd_days_max, end_date_str,
+        download_from_internet=not args.offline, data_dir=args.data_dir,
+        storage_format=args.storage_format, event_table=args.event_table,
+        drawdown_threshold=args.drawdown_threshold,
+        offset_unit=args.offset_unit, djia_close=djia_close)[1]
+
+    return end_date_str2
+
+
+if __name__ == '__main__':
+    # execute only if run as a script
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    main()
@@ -0,0 +1,126 @@
+'''
+This module provides the events aligned by get_djia_data() in djia_data.py,
+as the four parallel lists of year labels, year and month labels, beginning
+months, and peak date ranges that the alignment uses. The events are either
+read from a small event table file, by default data/recessions.csv with one
+row per recession, or detected from the series itself as every drawdown of
+at least a threshold fraction from a running maximum, in one linear pass.
+
+This module defines the following function(s):
+    load_event_table()
+    detect_drawdowns()
+'''
+# Import packages
+import numpy as np
+import pandas as pd
+import os
+from djia_align import to_epoch_days, segment_rows
+
+CUR_PATH = os.path.split(os.path.abspath(__file__))[0]
+EVENT_TABLE = os.path.join(CUR_PATH, 'data', 'recessions.csv')
+EVENT_COLUMNS = ['label_yr', 'label_yrmth', 'beg_yrmth', 'peak_start',
+                 'peak_end']
+
+'''
+Define functions
+'''
+
+
+def load_event_table(file_path=None):
+    '''
+    This function reads an event table csv file with columns label_yr,
+    label_yrmth, beg_yrmth, peak_start, and peak_end and one row per event in
+    chronological order.
+
+    Args:
+        file_path (str or None): path of the event table, defaults to
+            data/recessions.csv
+
+    Returns:
+        rec_label_yr_lst (list): list of string start year and end year of
+            each event
+        rec_label_yrmth_lst (list): list of string start year and month and
+            end year and month of each event
+        rec_beg_yrmth_lst (list): list of string start year and month of each
+            event
+        maxdate_rng_lst (list): list of tuples with start string date and end
+            string date within which range we define the peak of each event
+    '''
+    if file_path is None:
+        file_path = EVENT_TABLE
+    event_df = pd.read_csv(file_path, dtype=str)
+    missing = [c for c in EVENT_COLUMNS if c not in event_df.columns]
+    if missing:
+        raise ValueError('Event table ' + file_path + ' has no column(s) ' +
+                         ', '.join(missing))
+    rec_label_yr_lst = event_df['label_yr'].tolist()
+    rec_label_yrmth_lst = event_df['label_yrmth'].tolist()
+    rec_beg_yrmth_lst = event_df['beg_yrmth'].tolist()
+    maxdate_rng_lst = list(zip(event_df['peak_start'], event_df['peak_end']))
+
+    return (rec_label_yr_lst, rec_label_yrmth_lst, rec_beg_yrmth_lst,
+            maxdate_rng_lst)
+
+
+def detect_drawdowns(djia_close, threshold=0.2):
+    '''
+    This function finds every drawdown of the series of at least threshold
+    as a fraction of its running maximum. The series is split at each new
+    running maximum into spells, and each spell whose lowest close is at
+    least threshold below its starting maximum is one event, from its peak
+    to its trough. The events are returned in the form of load_event_table()
+    with a peak date range of the peak date only, so that the alignment
+    finds the same peak.
+
+    Args:
+        djia_close (DataFrame): DataFrame with sorted Date and Close columns
+        threshold (float): minimum drawdown as a fraction of the peak, e.g.
+            0.2 for bear markets or 0.1 for corrections
+
+    Returns:
+        rec_label_yr_lst (list): list of string peak year and trough year of
+            each drawdown
+        rec_label_yrmth_lst (list): list of string peak year and month and
+            trough year and month of each drawdown
+        rec_beg_yrmth_lst (list): list of string peak year and month of each
+            drawdown
+        maxdate_rng_lst (list): list of tuples of the peak string date of
+            each drawdown
+    '''
+    day_arr = to_epoch_days(djia_close['Date'])
+    close_arr = djia_close['Close'].to_numpy(dtype=np.float64)
+    run_max = np.maximum.accumulate(close_arr)
+    ratio = close_arr / run_max
+
+    # Each spell starts at a close equal to the running maximum and runs to
+    # the row before the next one
+    spell_beg = np.flatnonzero(close_arr >= run_max)
+    spell_min = np.minimum.reduceat(ratio, spell_beg)
+    deep = np.flatnonzero(spell_min <= 1.0 - threshold)
+    peak_idx = spell_beg[deep]
+    spell_end = np.append(spell_beg[1:], len(close_arr))[deep]
+
+    # Trough of each deep spell: first row of the spell at its minimum
+    ev_arr, row_arr, seg_lens = segment_rows(peak_idx, spell_end)
+    at_min = ratio[row_arr] == spell_min[deep][ev_arr]
+    trough_idx = row_arr[at_min][np.unique(ev_arr[at_min],
+                                           return_index=True)[1]]
+
+    peak_dates = pd.DatetimeIndex(day_arr[peak_idx].astype('datetime64[D]'))
+    trough_dates = pd.DatetimeIndex(
+        day_arr[trough_idx].astype('datetime64[D]'))
+    rec_label_yr_lst = []
+    rec_label_yrmth_lst = []
+    for peak_date, trough_date in zip(peak_dates, trough_dates):
+        if peak_date.year == trough_date.year:
+            rec_label_yr_lst.append(str(peak_date.year))
+        else:
+            rec_label_yr_lst.append(str(peak_date.year) + '-' +
+                                    str(trough_date.year))
+        rec_label_yrmth_lst.append(peak_date.strftime('%b %Y') + ' - ' +
+                                   trough_date.strftime('%b %Y'))
+    rec_beg_yrmth_lst = peak_dates.strftime('%b %Y').tolist()
+    maxdate_rng_lst = [(d, d) for d in peak_dates.strftime('%Y-%m-%d')]
+
+    return (rec_label_yr_lst, rec_label_yrmth_lst, rec_beg_yrmth_lst,
+            maxdate_rng_lst)
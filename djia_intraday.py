@@ -0,0 +1,283 @@
+'''
+This module reads intraday (tick or minute) price files of any size in
+bounded memory and aggregates them to bars for the normalized peak plot. The
+file is read in chunks of rows, the rows outside the union of the event
+windows are dropped as each chunk is read, and the remaining rows are
+aggregated to bars of the requested size (closing values or open, high,
+low, and close) before the next chunk is read. Only one chunk, the rows of
+the one bar that spans two chunks, and the bars themselves are held in
+memory, so peak memory depends on the chunk size and the window size and
+not on the size of the file. Bars of one day or longer are aligned like the
+daily series by calendar days or sessions from peak; shorter bars are
+aligned by bars from peak (offset_unit='bars').
+
+The default file layout is that of the Stooq.com intraday files, with Date
+and Time columns and Open, High, Low, Close, and Volume columns, sorted by
+time.
+
+This module defines the following function(s):
+    event_windows()
+    in_windows()
+    aggregate_bars()
+    read_intraday()
+    load_intraday_close()
+'''
+# Import packages
+import numpy as np
+import pandas as pd
+import os
+from djia_align import to_epoch_days, bars_per_session
+from djia_metrics import get_metrics
+
+# Calendar days added to both ends of each event window, so that windows of
+# trading sessions or bars from peak are covered despite holidays
+WINDOW_PAD_DAYS = 10
+OHLC_COLUMNS = ['Open', 'High', 'Low', 'Close']
+NS_PER_DAY = 86400 * 10 ** 9
+
+'''
+Define functions
+'''
+
+
+def event_windows(maxdate_rng_lst, bkwd_mths_max, frwd_mths_max):
+    '''
+    This function returns the union of the calendar windows of the events,
+    from bkwd_mths_max months before the start of each peak date range to
+    frwd_mths_max months after its end, as sorted disjoint intervals.
+
+    Args:
+        maxdate_rng_lst (list): list of tuples with start string date and end
+            string date within which range we define the peak of each event
+        bkwd_mths_max (int): maximum number of months backward from the peak
+        frwd_mths_max (int): maximum number of months forward from the peak
+
+    Returns:
+        win_lo (array): sorted int64 array of inclusive window starts in
+            nanoseconds since the epoch
+        win_hi (array): int64 array of exclusive window ends in nanoseconds
+            since the epoch
+    '''
+    bkwd_days = int(np.round(bkwd_mths_max * 364.25 / 12)) + WINDOW_PAD_DAYS
+    frwd_days = int(np.round(frwd_mths_max * 364.25 / 12)) + WINDOW_PAD_DAYS
+    rng_days = to_epoch_days(np.ravel(maxdate_rng_lst)).reshape(-1, 2)
+    lo_arr = np.sort(rng_days[:, 0] - bkwd_days)
+    hi_arr = np.sort(rng_days[:, 1] + frwd_days + 1)
+    # Merge overlapping windows: a window starts a new interval if it starts
+    # after the end of all earlier windows
+    hi_max = np.maximum.accumulate(hi_arr)
+    new_int = np.concatenate(([True], lo_arr[1:] > hi_max[:-1]))
+    win_lo = lo_arr[new_int] * NS_PER_DAY
+    win_hi = np.append(hi_max[np.flatnonzero(new_int)[1:] - 1],
+                       hi_max[-1]) * NS_PER_DAY
+
+    return win_lo, win_hi
+
+
+def in_windows(time_arr, win_lo, win_hi):
+    '''
+    This function marks the times that fall inside one of the windows.
+
+    Args:
+        time_arr (array): int64 array of nanoseconds since the epoch
+        win_lo (array): sorted int64 array of inclusive window starts
+        win_hi (array): int64 array of exclusive window ends
+
+    Returns:
+        keep (array): boolean array, True for times inside a window
+    '''
+    pos = np.searchsorted(win_lo, time_arr, side='right') - 1
+    keep = (pos >= 0) & (time_arr < win_hi[np.maximum(pos, 0)])
+
+    return keep
+
+
+def aggregate_bars(time_arr, price_dict, bar_ns):
+    '''
+    This function aggregates sorted prices to bars of bar_ns nanoseconds,
+    each labeled by its start time, in one pass with reduceat.
+
+    Args:
+        time_arr (array): sorted int64 array of nanoseconds since the epoch
+        price_dict (dict): float arrays by column, 'Close' and optionally
+            'Open', 'High', and 'Low'
+        bar_ns (int): bar size in nanoseconds
+
+    Returns:
+        bar_df (DataFrame): DataFrame with Date column of bar start times and
+            the price columns of price_dict
+    '''
+    if len(time_arr) == 0:
+        return pd.DataFrame(
+            {'Date': np.zeros(0, dtype='datetime64[ns]'),
+             **{col: np.zeros(0) for col in OHLC_COLUMNS
+                if col in price_dict}})
+    label_arr = time_arr // bar_ns * bar_ns
+    starts = np.flatnonzero(np.concatenate(
+        ([True], label_arr[1:] != label_arr[:-1])))
+    ends = np.append(starts[1:], len(time_arr)) - 1
+    bar_dict = {'Date': label_arr[starts].astype('datetime64[ns]')}
+    if 'Open' in price_dict:
+        bar_dict['Open'] = price_dict['Open'][starts]
+    if 'High' in price_dict:
+        bar_dict['High'] = np.maximum.reduceat(price_dict['High'], starts)
+    if 'Low' in price_dict:
+        bar_dict['Low'] = np.minimum.reduceat(price_dict['Low'], starts)
+    bar_dict['Close'] = price_dict['Close'][ends]
+    bar_df = pd.DataFrame(bar_dict)
+
+    return bar_df
+
+
+def _bar_prices(price_dict, bar_cols, n_rows):
+    '''
+    This function returns the first n_rows prices of each bar column, taking
+    the open, high, and low of the closing values if the file has only
+    closing values.
+    '''
+    return {col: price_dict.get(col, price_dict['Close'])[:n_rows]
+            for col in bar_cols}
+
+
+def read_intraday(file_path, windows=None, bar_size='1D', how='close',
+                  chunksize=1000000, time_cols=('Date', 'Time'),
+                  date_format=None, metrics=None):
+    '''
+    This function streams an intraday price file in chunks, drops the rows
+    outside the event windows, and aggregates the rest to bars.
+
+    Args:
+        file_path (str): path of the intraday csv file, sorted by time
+        windows (tuple or None): (win_lo, win_hi) from event_windows(), or
+            None to keep every row
+        bar_size (str): bar size as a pandas Timedelta string, e.g. '1D',
+            '1H', or '5min'
+        how (str): 'close' for bars of closing values, or 'ohlc' for open,
+            high, low, and close bars, from the Open, High, and Low columns
+            of the file if it has them and from its Close column otherwise
+        chunksize (int): number of rows read at a time
+        time_cols (tuple): column(s) of the file that together give the time
+            of each row, e.g. ('Date', 'Time') or ('Datetime',)
+        date_format (str or None): strftime format of the joined time
+            column(s), e.g. '%Y-%m-%d %H:%M:%S', which parses faster than
+            inferring it
+        metrics (StageMetrics or None): if not None, records the 'parse'
+            stage with the numbers of rows read and kept and of bars, see
+            djia_metrics.py
+
+    Returns:
+        bar_df (DataFrame): DataFrame with Date column of bar start times and
+            Close (or Open, High, Low, and Close) columns
+    '''
+    if how not in ('close', 'ohlc'):
+        raise ValueError('how must be close or ohlc, not ' + str(how))
+    bar_ns = pd.Timedelta(bar_size).value
+    if bar_ns <= 0:
+        raise ValueError('bar_size must be positive, not ' + str(bar_size))
+    time_cols = list(time_cols)
+    header = pd.read_csv(file_path, nrows=0).columns
+    if how == 'ohlc' and all(col in header for col in OHLC_COLUMNS):
+        price_cols = OHLC_COLUMNS
+    else:
+        price_cols = ['Close']
+    bar_cols = OHLC_COLUMNS if how == 'ohlc' else ['Close']
+
+    bar_lst = []
+    carry_time = np.zeros(0, dtype=np.int64)
+    carry_price = {col: np.zeros(0) for col in price_cols}
+    n_read = n_kept = 0
+    prev_time = None
+    with get_metrics(metrics).stage(
+            'parse', n_bytes=os.path.getsize(file_path)) as record:
+        chunks = pd.read_csv(file_path, usecols=time_cols + price_cols,
+                             dtype={col: str for col in time_cols},
+                             chunksize=chunksize)
+        for chunk in chunks:
+            n_read += len(chunk)
+            chunk = chunk.dropna()
+            time_str = chunk[time_cols[0]]
+            for col in time_cols[1:]:
+                time_str = time_str + ' ' + chunk[col]
+            time_arr = (pd.to_datetime(time_str, format=date_format).values
+                        .astype('datetime64[ns]').astype(np.int64))
+            if len(time_arr) == 0:
+                continue
+            if np.any(time_arr[1:] < time_arr[:-1]) or (
+                    prev_time is not None and time_arr[0] < prev_time):
+                raise ValueError('Intraday file ' + file_path +
+                                 ' is not sorted by time')
+            prev_time = time_arr[-1]
+            keep = (np.ones(len(time_arr), dtype=bool) if windows is None
+                    else in_windows(time_arr, windows[0], windows[1]))
+            n_kept += int(keep.sum())
+            time_arr = np.concatenate((carry_time, time_arr[keep]))
+            price_dict = {col: np.concatenate(
+                (carry_price[col],
+                 chunk[col].to_numpy(dtype=np.float64)[keep]))
+                for col in price_cols}
+            # Hold back the rows of the last bar, which can continue in the
+            # next chunk
+            n_done = (np.searchsorted(time_arr, time_arr[-1] // bar_ns *
+                                      bar_ns, side='left')
+                      if len(time_arr) else 0)
+            carry_time = time_arr[n_done:]
+            carry_price = {col: arr[n_done:]
+                           for col, arr in price_dict.items()}
+            if n_done:
+                bar_lst.append(aggregate_bars(
+                    time_arr[:n_done],
+                    _bar_prices(price_dict, bar_cols, n_done), bar_ns))
+        bar_lst.append(aggregate_bars(
+            carry_time, _bar_prices(carry_price, bar_cols, len(carry_time)),
+            bar_ns))
+        bar_df = pd.concat(bar_lst, ignore_index=True)
+        record['n_rows'] = n_read
+        record['n_kept'] = n_kept
+        record['n_bars'] = len(bar_df)
+
+    return bar_df[['Date'] + bar_cols]
+
+
+def load_intraday_close(file_path, maxdate_rng_lst, bkwd_mths_max,
+                        frwd_mths_max, bar_size='1D', offset_unit='days',
+                        chunksize=1000000, metrics=None):
+    '''
+    This function reads the bars of an intraday file within the windows of
+    the events, to be aligned by get_djia_data() in place of the daily
+    series.
+
+    Args:
+        file_path (str): path of the intraday csv file, see read_intraday()
+        maxdate_rng_lst (list): list of tuples with start string date and end
+            string date within which range we define the peak of each event
+        bkwd_mths_max (int): maximum number of months backward from the peak
+        frwd_mths_max (int): maximum number of months forward from the peak
+        bar_size (str): bar size as a pandas Timedelta string
+        offset_unit (str): offset unit of the alignment, which must be 'bars'
+            for bars shorter than a day
+        chunksize (int): number of rows read at a time
+        metrics (StageMetrics or None): if not None, records the 'parse'
+            stage, see djia_metrics.py
+
+    Other functions and files called by this function:
+        event_windows()
+        read_intraday()
+
+    Returns:
+        djia_close (DataFrame): DataFrame with Date and Close columns of the
+            bars
+    '''
+    djia_close = read_intraday(
+        file_path, event_windows(maxdate_rng_lst, bkwd_mths_max,
+                                 frwd_mths_max),
+        bar_size, chunksize=chunksize, metrics=metrics)
+    if len(djia_close) == 0:
+        raise ValueError('Intraday file ' + file_path + ' has no rows in ' +
+                         'the event windows')
+    if (offset_unit != 'bars' and
+            bars_per_session(to_epoch_days(djia_close['Date'].values)) > 1):
+        raise ValueError('Bars of ' + str(bar_size) + ' are shorter than ' +
+                         'a day and need offset_unit=bars, not ' +
+                         str(offset_unit))
+
+    return djia_close
@@ -0,0 +1,99 @@
+'''
+This module contains the level-of-detail (LOD) downsampling stage applied
+between get_djia_data() and the creation of the Bokeh data sources in
+djia_npp(). The points of each event inside the default main window are kept
+at full resolution, and the zoom-out regions before and after the main
+window are decimated with the shape-preserving Largest-Triangle-Three-Buckets
+(LTTB) algorithm.
+
+This module defines the following function(s):
+    lttb_indices()
+    downsample_events()
+'''
+# Import packages
+import numpy as np
+from djia_align import AlignedEvents
+
+'''
+Define functions
+'''
+
+
+def lttb_indices(x, y, n_out):
+    '''
+    This function selects n_out points of the series (x, y) with the
+    Largest-Triangle-Three-Buckets algorithm. The first and last points are
+    always kept, and from each of the n_out - 2 buckets in between it keeps
+    the point that forms the largest triangle with the previously kept point
+    and the average of the next bucket.
+
+    Args:
+        x (array): sorted float array of x values
+        y (array): float array of y values
+        n_out (int): number of points to keep
+
+    Returns:
+        idx (array): int array of the positions of the kept points
+    '''
+    n_in = len(x)
+    if n_out >= n_in or n_out < 3:
+        return np.arange(n_in)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = (np.floor(np.arange(n_out - 1) * (n_in - 2) / (n_out - 2))
+             .astype(np.int64) + 1)
+    edges[-1] = n_in - 1
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0] = 0
+    idx[-1] = n_in - 1
+    a_pt = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_hi = edges[i + 2] if i + 2 < n_out - 1 else n_in
+        avg_x = x[hi:nxt_hi].mean()
+        avg_y = y[hi:nxt_hi].mean()
+        area = np.abs((x[a_pt] - avg_x) * (y[lo:hi] - y[a_pt]) -
+                      (x[a_pt] - x[lo:hi]) * (avg_y - y[a_pt]))
+        a_pt = lo + int(np.argmax(area))
+        idx[i + 1] = a_pt
+
+    return idx
+
+
+def downsample_events(events, main_lo, main_hi, lod_factor):
+    '''
+    This function decimates the aligned events outside the main window
+    [main_lo, main_hi] days from peak by lod_factor with LTTB, keeping the
+    points inside the main window at full resolution. Dropped points are
+    marked invalid in the returned container.
+
+    Args:
+        events (AlignedEvents): aligned events x offsets arrays
+        main_lo (int): first day from peak of the main window
+        main_hi (int): last day from peak of the main window
+        lod_factor (int): ratio of valid points to kept points outside the
+            main window
+
+    Returns:
+        events_lod (AlignedEvents): aligned events with the dropped points
+            marked invalid
+    '''
+    days = events.days_frm_peak
+    keep = events.valid.copy()
+    regions = [days < main_lo, days > main_hi]
+    for i in range(events.n_events):
+        for region in regions:
+            cols = np.flatnonzero(events.valid[i] & region)
+            n_out = int(np.ceil(len(cols) / lod_factor))
+            if n_out >= len(cols):
+                continue
+            sel = lttb_indices(days[cols], events.close_dv_pk[i, cols],
+                               max(n_out, 3))
+            keep[i, cols] = False
+            keep[i, cols[sel]] = True
+    events_lod = AlignedEvents(days, np.where(keep, events.close, np.nan),
+                               np.where(keep, events.date_days, 0), keep,
+                               events.peak_vals, events.peak_dates,
+                               events.offset_unit)
+
+    return events_lod
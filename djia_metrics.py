@@ -0,0 +1,157 @@
+'''
+This module contains the stage-level instrumentation of the load, align, and
+render pipeline. A StageMetrics object passed through the pipeline records
+the wall time, the peak resident set size of the process, optionally the
+peak Python memory allocations, and the row and byte counts of each stage
+(fetch, parse, peak search, alignment, CDS build, and HTML serialization),
+and logs each record through the 'djia_npp.metrics' logger. When no metrics
+object is given, the pipeline uses NULL_METRICS, whose stages do no timing,
+memory tracing, or logging.
+
+This module defines the following function(s):
+    peak_rss_bytes()
+    get_metrics()
+
+This module defines the following class(es):
+    StageMetrics
+'''
+# Import packages
+import time
+import logging
+import contextlib
+import tracemalloc
+import sys
+try:
+    import resource
+except ImportError:  # pragma: no cover (Windows)
+    resource = None
+
+METRICS_LOGGER = logging.getLogger('djia_npp.metrics')
+
+'''
+Define functions
+'''
+
+
+def peak_rss_bytes():
+    '''
+    This function returns the peak resident set size of the current process
+    in bytes, or None where the resource module is not available.
+
+    Returns:
+        rss_bytes (int or None): peak resident set size in bytes
+    '''
+    if resource is None:
+        return None
+    rss_bytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        # Linux reports ru_maxrss in kilobytes, macOS in bytes
+        rss_bytes *= 1024
+
+    return int(rss_bytes)
+
+
+class StageMetrics:
+    '''
+    This class collects one record per pipeline stage. Each record is a
+    dictionary with the keys 'stage', 'seconds', and 'rss_peak_bytes', the
+    key 'alloc_peak_bytes' if track_memory is True, and any counts (such as
+    'n_rows' and 'n_bytes') given to stage() or set on the record inside the
+    stage.
+
+    Attributes:
+        records (list): list of stage record dictionaries in run order
+        track_memory (bool): =True to trace the peak Python allocations of
+            each stage with tracemalloc, which slows the traced stages
+        logger (Logger): logger to which each record is written at INFO level
+    '''
+
+    def __init__(self, track_memory=False, logger=None):
+        self.records = []
+        self.track_memory = track_memory
+        self.logger = METRICS_LOGGER if logger is None else logger
+
+    @contextlib.contextmanager
+    def stage(self, name, **counts):
+        '''
+        This method times the body of a with statement as one stage and
+        yields its record, on which the body can set row and byte counts.
+        Stages are not meant to be nested.
+
+        Args:
+            name (str): name of the stage
+            counts (dict): initial counts of the record
+
+        Returns:
+            record (dict): record of the stage (yielded)
+        '''
+        record = {'stage': name}
+        record.update(counts)
+        started_tracing = False
+        if self.track_memory:
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+                started_tracing = True
+        start_time = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start_time
+            if self.track_memory:
+                record['alloc_peak_bytes'] = \
+                    tracemalloc.get_traced_memory()[1]
+                if started_tracing:
+                    tracemalloc.stop()
+            record['rss_peak_bytes'] = peak_rss_bytes()
+            self.records.append(record)
+            self.logger.info(
+                'stage %s: %s', name,
+                ', '.join(k + '=' + str(v) for k, v in record.items()
+                          if k != 'stage'),
+                extra={'djia_metrics': record})
+
+    def total_seconds(self):
+        '''
+        This method returns the sum of the wall times of all stages.
+        '''
+        return sum(record['seconds'] for record in self.records)
+
+    def to_dict(self):
+        '''
+        This method returns the records keyed by stage name. Repeated stages
+        keep their last record.
+        '''
+        return {record['stage']: record for record in self.records}
+
+
+class _NullMetrics:
+    '''
+    This class is the disabled StageMetrics, whose stages only yield a
+    throwaway record.
+    '''
+    records = []
+
+    def stage(self, name, **counts):
+        return contextlib.nullcontext({})
+
+
+NULL_METRICS = _NullMetrics()
+
+
+def get_metrics(metrics):
+    '''
+    This function returns the given metrics object, or NULL_METRICS if it is
+    None, so that pipeline functions can always call metrics.stage().
+
+    Args:
+        metrics (StageMetrics or None): metrics object
+
+    Returns:
+        metrics (StageMetrics or _NullMetrics): metrics object to use
+    '''
+    if metrics is None:
+        return NULL_METRICS
+
+    return metrics
@@ -4,397 +4,495 @@ price data series from either Stooq.com or from this directory and
 organizes it into 15 series, one for each of the last 15 recessions--
 from the most recent 2020 Coronavirus recession to the Great Depression of
 1929. It then creates a normalized peak plot of the DJIA for each of the last
-15 recessions using the Bokeh plotting library.
+15 recessions using the Bokeh plotting library. The data are read and aligned
+by get_djia_data() in djia_data.py, which is imported here for backward
+compatibility. Bokeh and the modules of the optional features of djia_npp()
+are only imported when they are used, so importing this module for its data
+functions stays fast.
 
 This module defines the following function(s):
-    get_djia_data()
+    offset_label()
+    event_line_styles()
+    plot_event_lines()
+    multi_line_source()
+    plot_event_multi_line()
+    plot_event_bands()
+    plot_forward_cones()
+    make_npp_figure()
     djia_npp()
 '''
 # Import packages
 import numpy as np
-import pandas as pd
-import pandas_datareader as pddr
 import datetime as dt
 import os
-from bokeh.io import output_file
-from bokeh.plotting import figure, show
-from bokeh.models import ColumnDataSource, Title, Legend, HoverTool
-# from bokeh.models import Label
-from bokeh.palettes import Category20
+import json
+import logging
+from djia_data import load_djia_close, get_djia_data
+from djia_align import (OFFSETS_PER_YEAR, to_epoch_days, bars_per_session,
+                        offsets_per_year, concat_events)
+from djia_events import load_event_table
+from djia_metrics import get_metrics
+from djia_bands import check_bands, event_bands
+
+NPP_FIG_TITLE_FMT = 'Progression of {} in last {} recessions'
+NPP_FIG_TITLE = NPP_FIG_TITLE_FMT.format('DJIA', 15)
+NPP_DRAWDOWN_TITLE_FMT = 'Progression of {} in {} drawdowns of {:.0%} or more'
+NPP_ANALOG_TITLE_FMT = ' and {} closest analogs'
+# Names of the data source of the current (last) event line and of the
+# shared multi_line data source, by which the server finds them
+NPP_CURRENT_SOURCE = 'npp_current'
+NPP_EVENTS_SOURCE = 'npp_events'
+logger = logging.getLogger('djia_npp')
+
+# Hover date of a point of a multi_line row with trading-session (or bar)
+# offsets. The offsets of a row have gaps where LOD downsampling dropped
+# points, so the point nearest the hovered offset is found by binary search.
+SESSION_DATE_JS = """
+    const i = special_vars.index
+    const xs = source.data['xs'][i]
+    const day_offsets = source.data['day_offsets'][i]
+    const x = special_vars.data_x
+    let lo = 0
+    let hi = xs.length - 1
+    while (lo < hi) {
+        const mid = (lo + hi) >> 1
+        if (xs[mid] < x)
+            lo = mid + 1
+        else
+            hi = mid
+    }
+    if (lo > 0 && x - xs[lo - 1] < xs[lo] - x)
+        lo -= 1
+    const date = new Date(value + day_offsets[lo] * 86400000)
+    return date.toISOString().slice(0, 10)
+"""
 
 '''
 Define functions
 '''
 
 
-def get_djia_data(frwd_days_max, bkwd_days_max, end_date_str,
-                  download_from_internet=True):
+def offset_label(events):
     '''
-    This function either downloads or reads in the DJIA data series and adds
-    variables days_frm_peak and close_dv_pk for each of the last 15 recessions.
+    This function returns the hover tooltip label of the offsets from peak
+    of the aligned events.
 
     Args:
-        frwd_days_max (int): maximum number of days forward from the peak to
-            plot
-        bckwd_days_max (int): maximum number of days backward from the peak to
-            plot
-        end_date_str (str): end date of DJIA time series in 'YYYY-mm-dd' format
-        download_from_internet (bool): =True if download data from Stooq.com,
-            otherwise read date in from local directory
+        events (AlignedEvents): aligned events x offsets arrays
 
-    Other functions and files called by this function:
-        djia_close_[yyyy-mm-dd].csv
+    Returns:
+        label (str): 'Days from peak' or 'Sessions from peak'
+    '''
+    label = events.offset_unit.capitalize() + ' from peak'
 
-    Files created by this function:
-        djia_close_[yyyy-mm-dd].csv
-        djia_close_pk_[yyyy-mm-dd].csv
+    return label
+
+
+def event_line_styles(n_events):
+    '''
+    This function returns the line color and width of each event line. The
+    first (oldest) event is a thick blue line, the last (current) event is a
+    thick black line, and the events in between cycle through the Category20
+    palette.
+
+    Args:
+        n_events (int): number of events
 
     Returns:
-        djia_close_pk (DataFrame): N x 46 DataFrame of days_frm_peak, Date{i},
-            Close{i}, and close_dv_pk{i} for each of the 15 recessions for the
-            periods specified by bkwd_days_max and frwd_days_max
-        end_date_str2 (str): actual end date of DJIA time series in
-            'YYYY-mm-dd' format. Can differ from the end_date input to this
-            function if the final data for that day have not come out yet
-            (usually 2 hours after markets close, 6:30pm EST), or if the
-            end_date is one on which markets are closed (e.g. weekends and
-            holidays). In this latter case, the pandas_datareader library
-            chooses the most recent date for which we have DJIA data.
-        peak_vals (list): list of peak DJIA value at the beginning of each of
-            the last 15 recessions
-        peak_dates (list): list of string date (YYYY-mm-dd) of peak DJIA value
-            at the beginning of each of the last 15 recessions
-        rec_label_yr_lst (list): list of string start year and end year of each
-            of the last 15 recessions
-        rec_label_yrmth_lst (list): list of string start year and month and end
-            year and month of each of the last 15 recessions
-        rec_beg_yrmth_lst (list): list of string start year and month of each
-            of the last 15 recessions
-        maxdate_rng_lst (list): list of tuples with start string date and end
-            string date within which range we define the peak DJIA value at the
-            beginning of each of the last 15 recessions
+        colors (list): list of line colors of each event
+        line_widths (list): list of line widths of each event
     '''
-    end_date = dt.datetime.strptime(end_date_str, '%Y-%m-%d')
+    from bokeh.palettes import Category20
+    colors = [Category20[20][(i - 1) % 20] for i in range(n_events)]
+    line_widths = [2] * n_events
+    colors[0] = 'blue'
+    colors[-1] = 'black'
+    line_widths[0] = 5
+    line_widths[-1] = 5
 
-    # Name the current directory and make sure it has a data folder
-    cur_path = os.path.split(os.path.abspath(__file__))[0]
-    data_fldr = 'data'
-    data_dir = os.path.join(cur_path, data_fldr)
-    if not os.access(data_dir, os.F_OK):
-        os.makedirs(data_dir)
-
-    filename_basic = ('data/djia_close_' + end_date_str + '.csv')
-    filename_full = ('data/djia_close_pk_' + end_date_str + '.csv')
-
-    if download_from_internet:
-        # Download the DJIA data directly from Stooq.com
-        # (requires internet connection)
-        start_date = dt.datetime(1896, 5, 27)
-        djia_df = pddr.stooq.StooqDailyReader(symbols='^DJI',
-                                              start=start_date,
-                                              end=end_date).read()
-        djia_close = djia_df['Close']
-        djia_close = pd.DataFrame(djia_close).sort_index()  # Sort old to new
-        djia_close = djia_close.reset_index(level=['Date'])
-        end_date_str2 = djia_close['Date'].iloc[-1].strftime('%Y-%m-%d')
-        end_date = dt.datetime.strptime(end_date_str2, '%Y-%m-%d')
-        filename_basic = ('data/djia_close_' + end_date_str2 + '.csv')
-        filename_full = ('data/djia_close_pk_' + end_date_str2 + '.csv')
-        djia_close.to_csv(filename_basic, index=False)
-    else:
-        # Import the data as pandas DataFrame
-        end_date_str2 = end_date_str
-        data_file_path = os.path.join(cur_path, filename_basic)
-        djia_close = pd.read_csv(data_file_path,
-                                 names=['Date', 'Close'],
-                                 parse_dates=['Date'], skiprows=1,
-                                 na_values=['.', 'na', 'NaN'])
-        djia_close = djia_close.dropna()
-
-    print('End date of DJIA series is', end_date.strftime('%Y-%m-%d'))
-
-    # Set recession-specific parameters
-    rec_label_yr_lst = \
-        ['1929-1933',  # (Aug 1929 - Mar 1933) Great Depression
-         '1937-1938',  # (May 1937 - Jun 1938)
-         '1945',       # (Feb 1945 - Oct 1945)
-         '1948-1949',  # (Nov 1948 - Oct 1949)
-         '1953-1954',  # (Jul 1953 - May 1954)
-         '1957-1958',  # (Aug 1957 - Apr 1958)
-         '1960-1961',  # (Apr 1960 - Feb 1961)
-         '1969-1970',  # (Dec 1969 - Nov 1970)
-         '1973-1975',  # (Nov 1973 - Mar 1975)
-         '1980',       # (Jan 1980 - Jul 1980)
-         '1981-1982',  # (Jul 1981 - Nov 1982)
-         '1990-1991',  # (Jul 1990 - Mar 1991)
-         '2001',       # (Mar 2001 - Nov 2001)
-         '2007-2009',  # (Dec 2007 - Jun 2009) Great Recession
-         '2020-2020']  # (Feb 2020 - Apr 2020) Coronavirus recession
-
-    rec_label_yrmth_lst = ['Aug 1929 - Mar 1933',  # Great Depression
-                           'May 1937 - Jun 1938',
-                           'Feb 1945 - Oct 1945',
-                           'Nov 1948 - Oct 1949',
-                           'Jul 1953 - May 1954',
-                           'Aug 1957 - Apr 1958',
-                           'Apr 1960 - Feb 1961',
-                           'Dec 1969 - Nov 1970',
-                           'Nov 1973 - Mar 1975',
-                           'Jan 1980 - Jul 1980',
-                           'Jul 1981 - Nov 1982',
-                           'Jul 1990 - Mar 1991',
-                           'Mar 2001 - Nov 2001',
-                           'Dec 2007 - Jun 2009',  # Great Recession
-                           'Feb 2020 - Apr 2020']  # Coronavirus recess'n
-
-    rec_beg_yrmth_lst = ['Aug 1929', 'May 1937', 'Feb 1945', 'Nov 1948',
-                         'Jul 1953', 'Aug 1957', 'Apr 1960', 'Dec 1969',
-                         'Nov 1973', 'Jan 1980', 'Jul 1981', 'Jul 1990',
-                         'Mar 2001', 'Dec 2007', 'Feb 2020']
-
-    maxdate_rng_lst = [('1929-7-1', '1929-10-30'),
-                       ('1937-3-1', '1937-7-1'),
-                       ('1945-1-1', '1945-4-1'),
-                       ('1948-9-1', '1949-1-31'),
-                       ('1953-5-1', '1953-9-30'),
-                       ('1957-6-1', '1957-10-31'),
-                       ('1959-12-1', '1960-7-1'),
-                       ('1969-10-1', '1970-1-31'),
-                       ('1973-9-1', '1973-12-31'),
-                       ('1979-12-1', '1980-3-1'),
-                       ('1981-6-1', '1981-8-30'),
-                       ('1990-6-1', '1991-8-31'),
-                       ('2001-1-25', '2001-4-30'),
-                       ('2007-10-1', '2008-1-31'),
-                       ('2020-2-1', '2020-3-15')]
-
-    # Create normalized peak series for each recession
-    djia_close_pk = \
-        pd.DataFrame(np.arange(-bkwd_days_max, frwd_days_max + 1, dtype=int),
-                     columns=['days_frm_peak'])
-    djia_close_pk_long = djia_close.copy()
-    peak_vals = []
-    peak_dates = []
-    for i, maxdate_rng in enumerate(maxdate_rng_lst):
-        # Identify peak closing value within two months (with only ?
-        # exceptions) of the beginning month of the recession
-        peak_val = \
-            djia_close['Close'][(djia_close['Date'] >= maxdate_rng[0]) &
-                                (djia_close['Date'] <=
-                                 maxdate_rng[1])].max()
-        peak_vals.append(peak_val)
-        close_dv_pk_name = 'close_dv_pk' + str(i)
-        djia_close_pk_long[close_dv_pk_name] = (djia_close_pk_long['Close'] /
-                                                peak_val)
-        # Identify date of peak closing value within two months (with
-        # only ? exceptions) of the beginning month of the recession
-        peak_date = \
-            djia_close['Date'][(djia_close['Date'] >= maxdate_rng[0]) &
-                               (djia_close['Date'] <= maxdate_rng[1]) &
-                               (djia_close['Close'] == peak_val)].max()
-        peak_dates.append(peak_date.strftime('%Y-%m-%d'))
-        days_frm_pk_name = 'days_frm_pk' + str(i)
-        djia_close_pk_long[days_frm_pk_name] = (djia_close_pk_long['Date'] -
-                                                peak_date).dt.days
-        print('peak_val ' + str(i) + ' is', peak_val, 'on date',
-              peak_date.strftime('%Y-%m-%d'), '(Beg. rec. month:',
-              rec_beg_yrmth_lst[i], ')')
-        # I need to merge the data into this new djia_close_pk DataFrame
-        # because weekends make these data have missing points relative to the
-        # initial left DataFrame
-        djia_close_pk = \
-            pd.merge(djia_close_pk,
-                     djia_close_pk_long[[days_frm_pk_name, 'Date', 'Close',
-                                         close_dv_pk_name]],
-                     left_on='days_frm_peak', right_on=days_frm_pk_name,
-                     how='left')
-        djia_close_pk.drop(columns=[days_frm_pk_name], inplace=True)
-        djia_close_pk.rename(
-            columns={'Date': f'Date{i}', 'Close': f'Close{i}'}, inplace=True)
-
-    djia_close_pk.to_csv(filename_full, index=False)
-
-    return (djia_close_pk, end_date_str2, peak_vals, peak_dates,
-            rec_label_yr_lst, rec_label_yrmth_lst, rec_beg_yrmth_lst,
-            maxdate_rng_lst)
+    return colors, line_widths
 
 
-def djia_npp(frwd_mths_main=36, bkwd_mths_main=4, frwd_mths_max=60,
-             bkwd_mths_max=8, djia_end_date='today',
-             download_from_internet=True, html_show=True):
+def plot_event_lines(fig, events, rec_label_lst):
     '''
-    This function creates the HTML and JavaScript code for the dynamic
-    visualization of the normalized peak plot of the last 15 recessions in the
-    United States, from the Great Depression (Aug. 1929 - Mar. 1933) to the
-    most recent COVID-19 recession (Feb. 2020 - present).
+    This function draws each event as its own line glyph with its own
+    ColumnDataSource of days_frm_peak, Date, Close, and close_dv_pk.
 
     Args:
-        frwd_mths_main (int): number of months forward from the peak to plot in
-            the default main window of the visualization
-        bkwd_mths_maim (int): number of months backward from the peak to plot
-            in the default main window of the visualization
-        frwd_mths_max (int): maximum number of months forward from the peak to
-            allow for the plot, to be seen by zooming out
-        bkwd_mths_max (int): maximum number of months backward from the peak to
-            allow for the plot, to be seen by zooming out
-        djia_end_date (str): either 'today' or the end date of DJIA time series
-            in 'YYYY-mm-dd' format
-        download_from_internet (bool): =True if download data from Stooq.com,
-            otherwise read date in from local directory
-        html_show (bool): =True if open dynamic visualization in browser once
-            created
+        fig (bokeh Figure): figure to draw in
+        events (AlignedEvents): aligned events x offsets arrays
+        rec_label_lst (list): list of string legend label of each event
 
-    Other functions and files called by this function:
-        get_djia_data()
+    Returns:
+        legend_items (list): list of LegendItem of each event line
+        tooltips (list): list of HoverTool tooltips
+        formatters (dict): dictionary of HoverTool formatters
+    '''
+    from bokeh.models import ColumnDataSource, LegendItem
+    colors, line_widths = event_line_styles(events.n_events)
+    legend_items = []
+    for i in range(events.n_events):
+        rec_cds = ColumnDataSource(events.event_frame(i))
+        if i == events.n_events - 1:
+            rec_cds.name = NPP_CURRENT_SOURCE
+        line_i = fig.line(x='days_frm_peak', y='close_dv_pk', source=rec_cds,
+                          color=colors[i], line_width=line_widths[i],
+                          alpha=0.7, muted_alpha=0.15)
+        legend_items.append(LegendItem(label=rec_label_lst[i],
+                                       renderers=[line_i]))
+
+    # Format the tooltip
+    tooltips = [('Date', '@Date{%F}'),
+                (offset_label(events), '$x{0.}'),
+                ('Closing value', '@Close{0,0.00}'),
+                ('Fraction of peak', '@close_dv_pk{0.0 %}')]
+    formatters = {'@Date': 'datetime'}
+
+    return legend_items, tooltips, formatters
 
-    Files created by this function:
-       images/djia_npp_[yyyy-mm-dd].html
 
-    Returns: None
+def multi_line_source(events, rec_label_lst):
     '''
-    # Create directory if images directory does not already exist
-    cur_path = os.path.split(os.path.abspath(__file__))[0]
-    image_fldr = 'images'
-    image_dir = os.path.join(cur_path, image_fldr)
-    if not os.access(image_dir, os.F_OK):
-        os.makedirs(image_dir)
+    This function packs all events into one ColumnDataSource for a single
+    MultiLine glyph. Each row is one event with its valid days_frm_peak (xs)
+    and close_dv_pk (ys) values plus per-event style, label, peak date, and
+    peak value columns. Dates and closing values are not stored per point
+    because they follow from the peak date plus days from peak and from the
+    peak value times close_dv_pk. With trading-session offsets, the dates
+    do not follow from the offsets, so each row also stores its calendar
+    days from peak (day_offsets).
 
-    if djia_end_date == 'today':
-        end_date = dt.date.today()  # Go through today
+    Args:
+        events (AlignedEvents): aligned events x offsets arrays
+        rec_label_lst (list): list of string legend label of each event
+
+    Returns:
+        multi_cds (ColumnDataSource): source with one row per event
+    '''
+    from bokeh.models import ColumnDataSource
+    ev_arr, off_arr = np.nonzero(events.valid)
+    split_pts = np.cumsum(events.valid.sum(axis=1))[:-1]
+    colors, line_widths = event_line_styles(events.n_events)
+    peak_ms = (np.array(events.peak_dates, dtype='datetime64[D]')
+               .astype('datetime64[ms]').astype(np.int64).astype(np.float64))
+    multi_dict = {
+        'xs': np.split(events.days_frm_peak[off_arr], split_pts),
+        'ys': np.split(events.close_dv_pk[ev_arr, off_arr], split_pts),
+        'color': colors, 'line_width': line_widths,
+        'alpha': [0.7] * events.n_events, 'label': list(rec_label_lst),
+        'peak_ms': peak_ms, 'peak_val': events.peak_vals}
+    if events.offset_unit != 'days':
+        # Offsets from peak fit in int16 (int32 for long windows of intraday
+        # bars), which serializes in a fraction of the bytes of float64
+        peak_days = (np.array(events.peak_dates, dtype='datetime64[D]')
+                     .astype(np.int64))
+        day_offsets = events.date_days[ev_arr, off_arr] - peak_days[ev_arr]
+        off_max = np.abs(events.days_frm_peak).max(initial=0)
+        off_dtype = np.int16 if off_max < 2 ** 15 else np.int32
+        multi_dict['xs'] = np.split(
+            events.days_frm_peak[off_arr].astype(off_dtype), split_pts)
+        multi_dict['day_offsets'] = np.split(day_offsets.astype(np.int16),
+                                             split_pts)
+    multi_cds = ColumnDataSource(multi_dict, name=NPP_EVENTS_SOURCE)
+
+    return multi_cds
+
+
+def plot_event_multi_line(fig, events, rec_label_lst, max_legend_items=30):
+    '''
+    This function draws all events with a single MultiLine glyph over one
+    shared ColumnDataSource from multi_line_source(). Because a legend click
+    mutes a whole renderer, each legend item points to an empty proxy line
+    of its event instead, and muting the proxy sets the alpha of the event's
+    row to 0.15 (0.7 when unmuted). Tapping (clicking) a line toggles the
+    proxy of its event, so the legend and the lines stay in step. Without a
+    legend (more than max_legend_items events), tapping toggles the alpha
+    directly. The hover tooltip reconstructs the date and closing value of
+    the hovered point from the event's peak date and peak value.
+
+    Args:
+        fig (bokeh Figure): figure to draw in
+        events (AlignedEvents): aligned events x offsets arrays
+        rec_label_lst (list): list of string legend label of each event
+        max_legend_items (int): maximum number of events for which to return
+            legend items
+
+    Returns:
+        legend_items (list): list of LegendItem of each event, empty if there
+            are more than max_legend_items events
+        tooltips (list): list of HoverTool tooltips
+        formatters (dict): dictionary of HoverTool formatters
+    '''
+    from bokeh.models import LegendItem, TapTool, CustomJS, CustomJSHover
+    multi_cds = multi_line_source(events, rec_label_lst)
+    multi_line = fig.multi_line(
+        xs='xs', ys='ys', source=multi_cds, color='color',
+        line_width='line_width', alpha='alpha', selection_alpha='alpha',
+        nonselection_alpha='alpha')
+
+    # Empty proxy line of each event for the legend to mute
+    proxies = []
+    legend_items = []
+    if events.n_events <= max_legend_items:
+        colors, line_widths = event_line_styles(events.n_events)
+        for i in range(events.n_events):
+            proxy = fig.line(x=[], y=[], color=colors[i],
+                             line_width=line_widths[i], alpha=0.7,
+                             muted_alpha=0.15)
+            proxy.js_on_change('muted', CustomJS(
+                args=dict(source=multi_cds, i=i), code="""
+                const alpha = source.data['alpha']
+                alpha[i] = cb_obj.muted ? 0.15 : 0.7
+                source.change.emit()
+            """))
+            proxies.append(proxy)
+            legend_items.append(LegendItem(label=rec_label_lst[i],
+                                           renderers=[proxy]))
+    mute_callback = CustomJS(args=dict(source=multi_cds, proxies=proxies),
+                             code="""
+        const indices = source.selected.indices
+        if (indices.length == 0)
+            return
+        const alpha = source.data['alpha']
+        for (const i of indices) {
+            if (proxies.length > 0)
+                proxies[i].muted = !proxies[i].muted
+            else
+                alpha[i] = alpha[i] > 0.5 ? 0.15 : 0.7
+        }
+        source.selected.indices = []
+        source.change.emit()
+    """)
+    multi_cds.selected.js_on_change('indices', mute_callback)
+    fig.add_tools(TapTool(renderers=[multi_line]))
+
+    # Format the tooltip
+    tooltips = [('Recession', '@label'),
+                ('Date', '@peak_ms{custom}'),
+                (offset_label(events), '$data_x{0.}'),
+                ('Closing value', '@peak_val{custom}'),
+                ('Fraction of peak', '$data_y{0.0 %}')]
+    if events.offset_unit == 'days':
+        date_hover = CustomJSHover(code="""
+            const date = new Date(value + special_vars.data_x * 86400000)
+            return date.toISOString().slice(0, 10)
+        """)
     else:
-        end_date = dt.datetime.strptime(djia_end_date, '%Y-%m-%d')
+        # Look up the calendar days from peak of the hovered session
+        date_hover = CustomJSHover(args=dict(source=multi_cds),
+                                   code=SESSION_DATE_JS)
+    formatters = {
+        '@peak_ms': date_hover,
+        '@peak_val': CustomJSHover(code="""
+            return (value * special_vars.data_y).toLocaleString(
+                'en-US', {minimumFractionDigits: 2, maximumFractionDigits: 2})
+        """)}
 
-    end_date_str = end_date.strftime('%Y-%m-%d')
+    return legend_items, tooltips, formatters
 
-    # Set main window and total data limits for monthly plot
-    frwd_mths_main = int(frwd_mths_main)
-    bkwd_mths_main = int(bkwd_mths_main)
-    frwd_days_main = int(np.round(frwd_mths_main * 364.25 / 12))
-    bkwd_days_main = int(np.round(bkwd_mths_main * 364.25 / 12))
-    frwd_mths_max = int(frwd_mths_max)
-    bkwd_mths_max = int(bkwd_mths_max)
-    frwd_days_max = int(np.round(frwd_mths_max * 364.25 / 12))
-    bkwd_days_max = int(np.round(bkwd_mths_max * 364.25 / 12))
 
-    (djia_close_pk, end_date_str2, peak_vals, peak_dates, rec_label_yr_lst,
-        rec_label_yrmth_lst, rec_beg_yrmth_lst, maxdate_rng_lst) = \
-        get_djia_data(frwd_days_max, bkwd_days_max, end_date_str,
-                      download_from_internet)
-    if end_date_str2 != end_date_str:
-        print('Updated end_date_str to ' + end_date_str2 + ' because ' +
-              'original end_date_str ' + end_date_str + ' data was not ' +
-              'available from Stooq.com')
-        end_date_str = end_date_str2
-        end_date = dt.datetime.strptime(end_date_str, '%Y-%m-%d')
+def plot_event_bands(fig, band_df, bands):
+    '''
+    This function draws the cross-event percentile bands under the event
+    lines: a shaded area between each pair of percentiles symmetric about
+    the median, darker towards the median, and a dashed median line.
 
-    rec_cds_list = []
-    min_main_val_lst = []
-    max_main_val_lst = []
-    for i in range(15):
-        djia_close_pk_rec = \
-            djia_close_pk[['days_frm_peak', f'Date{i}', f'Close{i}',
-                           f'close_dv_pk{i}']].dropna()
-        djia_close_pk_rec.rename(
-                columns={f'Date{i}': 'Date', f'Close{i}': 'Close',
-                         f'close_dv_pk{i}': 'close_dv_pk'}, inplace=True)
-        rec_cds_list.append(ColumnDataSource(djia_close_pk_rec))
-        # Find minimum and maximum close_dv_pk values as inputs to main plot
-        # frame size
-        min_main_val_lst.append(
-            djia_close_pk_rec['close_dv_pk'][
-                (djia_close_pk_rec['days_frm_peak'] >= -bkwd_days_main) &
-                (djia_close_pk_rec['days_frm_peak'] <= frwd_days_main)].min())
-        max_main_val_lst.append(
-            djia_close_pk_rec['close_dv_pk'][
-                (djia_close_pk_rec['days_frm_peak'] >= -bkwd_days_main) &
-                (djia_close_pk_rec['days_frm_peak'] <= frwd_days_main)].max())
+    Args:
+        fig (bokeh Figure): figure to draw on
+        band_df (DataFrame): DataFrame from djia_bands.event_bands()
+        bands (tuple): percentiles of the bands, e.g. (10, 25, 50, 75, 90)
 
-    # Create Bokeh plot of DJIA normalized peak plot figure
-    fig_title = 'Progression of DJIA in last 15 recessions'
-    filename = ('images/djia_npp_' + end_date_str + '.html')
-    output_file(filename, title=fig_title)
+    Returns:
+        legend_items (list): list of LegendItem of the bands
+        band_renderers (list): list of the band glyph renderers
+    '''
+    from bokeh.models import ColumnDataSource, LegendItem
+    band_cds = ColumnDataSource(band_df.dropna(subset=['p{:g}'.format(
+        bands[0])]))
+    pct_lst = sorted(bands)
+    legend_items = []
+    band_renderers = []
+    n_pairs = len(pct_lst) // 2
+    for i in range(n_pairs):
+        lo_col = 'p{:g}'.format(pct_lst[i])
+        hi_col = 'p{:g}'.format(pct_lst[-1 - i])
+        area_i = fig.varea(x='days_frm_peak', y1=lo_col, y2=hi_col,
+                           source=band_cds, fill_color='gray',
+                           fill_alpha=0.1 + 0.1 * i)
+        legend_items.append(LegendItem(
+            label='{:g}-{:g} pctile'.format(pct_lst[i], pct_lst[-1 - i]),
+            renderers=[area_i]))
+        band_renderers.append(area_i)
+    if len(pct_lst) % 2 == 1:
+        mid_col = 'p{:g}'.format(pct_lst[n_pairs])
+        line_mid = fig.line(x='days_frm_peak', y=mid_col, source=band_cds,
+                            color='dimgray', line_width=3,
+                            line_dash='dashed', muted_alpha=0.15)
+        mid_label = ('Median' if pct_lst[n_pairs] == 50 else
+                     mid_col[1:] + ' pctile')
+        legend_items.append(LegendItem(label=mid_label,
+                                       renderers=[line_mid]))
+        band_renderers.append(line_mid)
+
+    return legend_items, band_renderers
+
+
+def plot_forward_cones(fig, cone_df):
+    '''
+    This function draws the quantile cones of the simulated forward paths of
+    the current event: a shaded area between each pair of percentiles
+    symmetric about the median, darker towards the median, and a dotted
+    median line.
 
-    # Format the tooltip
-    tooltips = [('Date', '@Date{%F}'),
-                ('Days from peak', '$x{0.}'),
-                ('Closing value', '@Close{0,0.00}'),
-                ('Fraction of peak', '@close_dv_pk{0.0 %}')]
+    Args:
+        fig (bokeh Figure): figure to draw on
+        cone_df (DataFrame): DataFrame from djia_bootstrap.forward_cones()
 
-    # Solve for minimum and maximum DJIA/Peak values in monthly main display
-    # window in order to set the appropriate xrange and yrange
-    min_main_val = min(min_main_val_lst)
-    max_main_val = max(max_main_val_lst)
+    Returns:
+        legend_items (list): list of LegendItem of the cones
+        cone_renderers (list): list of the cone glyph renderers
+    '''
+    from bokeh.models import ColumnDataSource, LegendItem
+    cone_cds = ColumnDataSource(cone_df, name='npp_cones')
+    pct_cols = sorted([c for c in cone_df.columns if c != 'days_frm_peak'],
+                      key=lambda c: float(c[1:]))
+    legend_items = []
+    cone_renderers = []
+    n_pairs = len(pct_cols) // 2
+    for i in range(n_pairs):
+        area_i = fig.varea(x='days_frm_peak', y1=pct_cols[i],
+                           y2=pct_cols[-1 - i], source=cone_cds,
+                           fill_color='firebrick', fill_alpha=0.1 + 0.1 * i)
+        legend_items.append(LegendItem(
+            label='Paths {}-{} pctile'.format(pct_cols[i][1:],
+                                              pct_cols[-1 - i][1:]),
+            renderers=[area_i]))
+        cone_renderers.append(area_i)
+    if len(pct_cols) % 2 == 1:
+        line_mid = fig.line(x='days_frm_peak', y=pct_cols[n_pairs],
+                            source=cone_cds, color='firebrick', line_width=2,
+                            line_dash='dotted', muted_alpha=0.15)
+        legend_items.append(LegendItem(
+            label='Paths ' + ('median' if pct_cols[n_pairs] == 'p50' else
+                              pct_cols[n_pairs][1:] + ' pctile'),
+            renderers=[line_mid]))
+        cone_renderers.append(line_mid)
+
+    return legend_items, cone_renderers
+
+
+def make_npp_figure(events, rec_label_lst, end_date, frwd_mths_main=36,
+                    bkwd_mths_main=4, frwd_mths_max=60, bkwd_mths_max=8,
+                    render_mode='lines', fig_title=NPP_FIG_TITLE,
+                    metrics=None, series_label='DJIA', bands=None,
+                    cone_df=None, band_df=None):
+    '''
+    This function creates the Bokeh figure of the normalized peak plot from
+    the aligned events.
 
+    Args:
+        events (AlignedEvents): aligned events x offsets arrays
+        rec_label_lst (list): list of string legend label of each event
+        end_date (datetime): end date of the series, shown in the source text
+        frwd_mths_main (int): number of months forward from the peak to plot in
+            the default main window of the visualization
+        bkwd_mths_main (int): number of months backward from the peak to plot
+            in the default main window of the visualization
+        frwd_mths_max (int): maximum number of months forward from the peak to
+            allow for the plot, to be seen by zooming out
+        bkwd_mths_max (int): maximum number of months backward from the peak to
+            allow for the plot, to be seen by zooming out
+        render_mode (str): 'lines' or 'multi_line', see djia_npp()
+        fig_title (str): title of the figure
+        metrics (StageMetrics or None): if not None, records the 'cds_build'
+            stage, see djia_metrics.py
+        series_label (str): name of the series in the axis label and the
+            source text
+        bands (tuple or None): if not None, percentiles of the cross-event
+            bands drawn under the event lines, e.g. (10, 25, 50, 75, 90)
+        cone_df (DataFrame or None): if not None, quantile cones of the
+            forward paths of the current event from
+            djia_bootstrap.forward_cones(), drawn after its last value
+        band_df (DataFrame or None): minimum, maximum, and percentiles of
+            close_dv_pk at each offset from djia_bands.event_bands(),
+            defaults to those of events, e.g. computed before LOD
+            downsampling or from the recessions without the analogs
+
+    Other functions and files called by this function:
+        djia_bands.event_bands() (if band_df is None)
+        plot_event_lines() or plot_event_multi_line()
+        plot_event_bands() (if bands is not None)
+        plot_forward_cones() (if cone_df is not None)
+
+    Returns:
+        fig (bokeh Figure): normalized peak plot figure
+    '''
+    from bokeh.plotting import figure
+    from bokeh.models import Title, Legend, HoverTool
+    # Offsets per year of the offset unit of the events, so that months from
+    # peak map to calendar days, trading sessions, or intraday bars
+    per_year = offsets_per_year(events)
+    frwd_days_main = int(np.round(frwd_mths_main * per_year / 12))
+    bkwd_days_main = int(np.round(bkwd_mths_main * per_year / 12))
+
+    # Find minimum and maximum close_dv_pk values across all recessions in
+    # the main window as inputs to main plot frame size, in the same pass as
+    # the percentile bands
+    if bands is not None:
+        check_bands(bands)
+    if band_df is None:
+        band_df = event_bands(events, () if bands is None else tuple(bands))
+    main_cols = ((events.days_frm_peak >= -bkwd_days_main) &
+                 (events.days_frm_peak <= frwd_days_main))
+    min_main_val = np.nanmin(band_df['min'].to_numpy()[main_cols])
+    max_main_val = np.nanmax(band_df['max'].to_numpy()[main_cols])
+
+    # Create Bokeh plot of DJIA normalized peak plot figure
     datarange_main_vals = max_main_val - min_main_val
     datarange_main_days = int(np.round((frwd_mths_main + bkwd_mths_main) *
-                                       364.25 / 12))
+                                       per_year / 12))
     fig_buffer_pct = 0.07
     fig = figure(plot_height=450,
                  plot_width=800,
                  x_axis_label='Months from Peak',
-                 y_axis_label='DJIA as fraction of Peak',
+                 y_axis_label=series_label + ' as fraction of Peak',
                  y_range=(min_main_val - fig_buffer_pct * datarange_main_vals,
                           max_main_val + fig_buffer_pct * datarange_main_vals),
-                 x_range=((-np.round(bkwd_mths_main * 364.25 / 12) -
+                 x_range=((-np.round(bkwd_mths_main * per_year / 12) -
                           fig_buffer_pct * datarange_main_days),
-                          (np.round(frwd_mths_main * 364.25 / 12) +
+                          (np.round(frwd_mths_main * per_year / 12) +
                           fig_buffer_pct * datarange_main_days)),
                  tools=['save', 'zoom_in', 'zoom_out', 'box_zoom',
                         'pan', 'undo', 'redo', 'reset', 'hover', 'help'],
                  toolbar_location='left')
     fig.title.text_font_size = '18pt'
     fig.toolbar.logo = None
-    l0 = fig.line(x='days_frm_peak', y='close_dv_pk', source=rec_cds_list[0],
-                  color='blue', line_width=5, alpha=0.7, muted_alpha=0.15)
-    l1 = fig.line(x='days_frm_peak', y='close_dv_pk', source=rec_cds_list[1],
-                  color=Category20[13][0], line_width=2, alpha=0.7,
-                  muted_alpha=0.15)
-    l2 = fig.line(x='days_frm_peak', y='close_dv_pk', source=rec_cds_list[2],
-                  color=Category20[13][1], line_width=2, alpha=0.7,
-                  muted_alpha=0.15)
-    l3 = fig.line(x='days_frm_peak', y='close_dv_pk', source=rec_cds_list[3],
-                  color=Category20[13][2], line_width=2,
-                  alpha=0.7, muted_alpha=0.15)
-    l4 = fig.line(x='days_frm_peak', y='close_dv_pk', source=rec_cds_list[4],
-                  color=Category20[13][3], line_width=2, alpha=0.7,
-                  muted_alpha=0.15)
-    l5 = fig.line(x='days_frm_peak', y='close_dv_pk', source=rec_cds_list[5],
-                  color=Category20[13][4], line_width=2, alpha=0.7,
-                  muted_alpha=0.15)
-    l6 = fig.line(x='days_frm_peak', y='close_dv_pk', source=rec_cds_list[6],
-                  color=Category20[13][5], line_width=2, alpha=0.7,
-                  muted_alpha=0.15)
-    l7 = fig.line(x='days_frm_peak', y='close_dv_pk', source=rec_cds_list[7],
-                  color=Category20[13][6], line_width=2, alpha=0.7,
-                  muted_alpha=0.15)
-    l8 = fig.line(x='days_frm_peak', y='close_dv_pk', source=rec_cds_list[8],
-                  color=Category20[13][7], line_width=2, alpha=0.7,
-                  muted_alpha=0.15)
-    l9 = fig.line(x='days_frm_peak', y='close_dv_pk', source=rec_cds_list[9],
-                  color=Category20[13][8], line_width=2, alpha=0.7,
-                  muted_alpha=0.15)
-    l10 = fig.line(x='days_frm_peak', y='close_dv_pk', source=rec_cds_list[10],
-                   color=Category20[13][9], line_width=2, alpha=0.7,
-                   muted_alpha=0.15)
-    l11 = fig.line(x='days_frm_peak', y='close_dv_pk', source=rec_cds_list[11],
-                   color=Category20[13][10], line_width=2, alpha=0.7,
-                   muted_alpha=0.15)
-    l12 = fig.line(x='days_frm_peak', y='close_dv_pk', source=rec_cds_list[12],
-                   color=Category20[13][11], line_width=2, alpha=0.7,
-                   muted_alpha=0.15)
-    l13 = fig.line(x='days_frm_peak', y='close_dv_pk', source=rec_cds_list[13],
-                   color=Category20[13][12], line_width=2, alpha=0.7,
-                   muted_alpha=0.15)
-    l14 = fig.line(x='days_frm_peak', y='close_dv_pk', source=rec_cds_list[14],
-                   color='black', line_width=5, alpha=0.7, muted_alpha=0.15)
+    with get_metrics(metrics).stage(
+            'cds_build', n_rows=int(events.valid.sum())):
+        if bands is not None:
+            band_items, band_renderers = plot_event_bands(fig, band_df,
+                                                          bands)
+        if render_mode == 'multi_line':
+            legend_items, tooltips, formatters = \
+                plot_event_multi_line(fig, events, rec_label_lst)
+        else:
+            legend_items, tooltips, formatters = \
+                plot_event_lines(fig, events, rec_label_lst)
+        no_hover = []
+        if bands is not None:
+            no_hover += band_renderers
+        if cone_df is not None and len(cone_df):
+            cone_items, cone_renderers = plot_forward_cones(fig, cone_df)
+            legend_items = legend_items + cone_items
+            no_hover += cone_renderers
 
     # Dashed vertical line at the peak DJIA value period
     fig.line(x=[0.0, 0.0], y=[-0.5, 2.0], color='black', line_width=2,
              line_dash='dashed', alpha=0.5)
 
     # Dashed horizontal line at DJIA as fraction of peak equals 1
-    fig.line(x=[-np.round(bkwd_mths_max * 364.25 / 12),
-                np.round(frwd_mths_max * 364.25 / 12)], y=[1.0, 1.0],
+    fig.line(x=[-np.round(bkwd_mths_max * per_year / 12),
+                np.round(frwd_mths_max * per_year / 12)], y=[1.0, 1.0],
              color='black', line_width=2, line_dash='dashed', alpha=0.5)
 
     # Create the tick marks for the x-axis and set x-axis labels
@@ -402,7 +500,7 @@ def djia_npp(frwd_mths_main=36, bkwd_mths_main=4, frwd_mths_max=60,
     mths_frm_pk = []
     for i in range(-bkwd_mths_max, frwd_mths_max + 1):
         if i % 4 == 0:
-            days_frm_pk_mth.append(int(np.round(i * 364.25 / 12)))
+            days_frm_pk_mth.append(int(np.round(i * per_year / 12)))
             if i < 0:
                 mths_frm_pk.append(str(i) + 'mth')
             elif i == 0:
@@ -415,22 +513,9 @@ def djia_npp(frwd_mths_main=36, bkwd_mths_main=4, frwd_mths_max=60,
     fig.xaxis.major_label_overrides = mth_label_dict
 
     # Add legend
-    legend = Legend(items=[(rec_label_yrmth_lst[0], [l0]),
-                           (rec_label_yrmth_lst[1], [l1]),
-                           (rec_label_yrmth_lst[2], [l2]),
-                           (rec_label_yrmth_lst[3], [l3]),
-                           (rec_label_yrmth_lst[4], [l4]),
-                           (rec_label_yrmth_lst[5], [l5]),
-                           (rec_label_yrmth_lst[6], [l6]),
-                           (rec_label_yrmth_lst[7], [l7]),
-                           (rec_label_yrmth_lst[8], [l8]),
-                           (rec_label_yrmth_lst[9], [l9]),
-                           (rec_label_yrmth_lst[10], [l10]),
-                           (rec_label_yrmth_lst[11], [l11]),
-                           (rec_label_yrmth_lst[12], [l12]),
-                           (rec_label_yrmth_lst[13], [l13]),
-                           (rec_label_yrmth_lst[14], [l14])],
-                    location='center')
+    if bands is not None:
+        legend_items = band_items + legend_items
+    legend = Legend(items=legend_items, location='center')
     fig.add_layout(legend, 'right')
 
     # # Add label to current recession low point
@@ -454,7 +539,8 @@ def djia_npp(frwd_mths_main=36, bkwd_mths_main=4, frwd_mths_max=60,
     # Add source text below figure
     updated_date_str = end_date.strftime('%B %-d, %Y')
     fig.add_layout(Title(text='Source: Richard W. Evans (@RickEcon), ' +
-                              'historical DJIA data from Stooq.com, ' +
+                              'historical ' + series_label +
+                              ' data from Stooq.com, ' +
                               'updated ' + updated_date_str + '.',
                          align='left',
                          text_font_size='3mm',
@@ -463,15 +549,310 @@ def djia_npp(frwd_mths_main=36, bkwd_mths_main=4, frwd_mths_max=60,
     fig.legend.click_policy = 'mute'
 
     # Add the HoverTool to the figure
-    fig.add_tools(HoverTool(tooltips=tooltips, toggleable=False,
-                            formatters={'@Date': 'datetime'}))
+    if not no_hover:
+        fig.add_tools(HoverTool(tooltips=tooltips, toggleable=False,
+                                formatters=formatters))
+    else:
+        # The band and cone sources have no per-event columns to show
+        fig.add_tools(HoverTool(
+            tooltips=tooltips, toggleable=False, formatters=formatters,
+            renderers=[r for r in fig.renderers if r not in no_hover]))
+
+    return fig
+
+
+def djia_npp(frwd_mths_main=36, bkwd_mths_main=4, frwd_mths_max=60,
+             bkwd_mths_max=8, djia_end_date='today',
+             download_from_internet=True, html_show=True,
+             render_mode='lines', lod_factor=None, cache=None, metrics=None,
+             symbol='^DJI', series_name='djia', series_label='DJIA',
+             event_table=None, drawdown_threshold=None, bands=None,
+             offset_unit='days', data_mode='inline', intraday_file=None,
+             bar_size='1D', n_analogs=None, analog_metric='rmse',
+             reanchor=False, cone_paths=None, cone_seed=0, cone_procs=1):
+    '''
+    This function creates the HTML and JavaScript code for the dynamic
+    visualization of the normalized peak plot of the last 15 recessions in the
+    United States, from the Great Depression (Aug. 1929 - Mar. 1933) to the
+    most recent COVID-19 recession (Feb. 2020 - present).
+
+    Args:
+        frwd_mths_main (int): number of months forward from the peak to plot in
+            the default main window of the visualization
+        bkwd_mths_maim (int): number of months backward from the peak to plot
+            in the default main window of the visualization
+        frwd_mths_max (int): maximum number of months forward from the peak to
+            allow for the plot, to be seen by zooming out
+        bkwd_mths_max (int): maximum number of months backward from the peak to
+            allow for the plot, to be seen by zooming out
+        djia_end_date (str): either 'today' or the end date of DJIA time series
+            in 'YYYY-mm-dd' format
+        download_from_internet (bool): =True if download data from Stooq.com,
+            otherwise read date in from local directory
+        html_show (bool): =True if open dynamic visualization in browser once
+            created
+        render_mode (str): 'lines' to draw each recession as its own line
+            glyph and data source, or 'multi_line' to draw all recessions
+            with one MultiLine glyph over one shared data source
+        lod_factor (int or None): if not None, decimate each recession
+            outside the main window by this factor with LTTB downsampling
+            and report the serialized size of the figure
+        cache (AlignCache or None): cache of aligned events passed to
+            get_djia_data()
+        metrics (StageMetrics or None): if not None, collects the wall time,
+            peak memory, and row and byte counts of every stage from fetch to
+            'html_serialization', see djia_metrics.py
+        symbol (str): ticker symbol of the series, see get_djia_data()
+        series_name (str): name of the series in the data and image file
+            names, see get_djia_data()
+        series_label (str): name of the series in the figure text
+        event_table (str or None): path of the event table csv file, defaults
+            to data/recessions.csv, see get_djia_data()
+        drawdown_threshold (float or None): if not None, plot every drawdown
+            of at least this fraction of the running maximum instead of the
+            recessions of the event table, see get_djia_data()
+        bands (tuple or None): if not None, percentiles of the cross-event
+            median and percentile bands of the recessions (without the
+            analogs) overlaid under the event lines, e.g.
+            (10, 25, 50, 75, 90), see djia_bands.event_bands()
+        offset_unit (str): 'days' to plot calendar days from peak, or
+            'sessions' to plot trading sessions from peak, which has no
+            gaps for weekends and holidays and 252 sessions per year on the
+            month ticks, or 'bars' to plot the intraday bars of
+            intraday_file from peak
+        data_mode (str): 'inline' to embed the data in the HTML file, or
+            'sidecar' to always write the HTML file as a figure shell that
+            loads the data of each event from a compressed binary file in
+            images/npp_data, shared by the snapshots of different days, see
+            djia_sidecar.py
+        intraday_file (str or None): if not None, path of an intraday
+            (tick or minute) csv file to plot instead of the daily series,
+            streamed in chunks and aggregated to bars, keeping only the
+            rows in the windows of the events, see djia_intraday.py
+        bar_size (str): bar size of intraday_file as a pandas Timedelta
+            string, e.g. '1D' or '5min'
+        n_analogs (int or None): if not None, also plot this many windows
+            of the full history whose normalized path is closest to the
+            path of the current (last) event since its peak, see
+            djia_analogs.find_analogs()
+        analog_metric (str): 'rmse' or 'corr', ranking of the analogs
+        reanchor (bool): =True to add controls above the figure that
+            re-anchor every event in the browser at its peak, its trough,
+            its NBER start month, or N days after its peak, see
+            djia_anchor.py
+        cone_paths (int or None): if not None, simulate this many forward
+            paths of the current (last) event by block bootstrap of the
+            daily returns of the other events and draw their quantile cones,
+            see djia_bootstrap.forward_cones()
+        cone_seed (int): seed of the simulated paths
+        cone_procs (int or None): number of processes of the simulation,
+            None for the number of CPUs
+
+    Other functions and files called by this function:
+        djia_intraday.load_intraday_close() (if intraday_file is not None)
+        djia_data.load_djia_close() (if n_analogs is not None)
+        djia_data.get_djia_data()
+        djia_analogs.find_analogs() (if n_analogs is not None)
+        djia_analogs.analog_events() (if n_analogs is not None)
+        djia_bootstrap.forward_cones() (if cone_paths is not None)
+        djia_bands.check_bands() (if bands is not None)
+        djia_bands.event_bands()
+        djia_anchor.anchor_offsets() (if reanchor=True)
+        djia_lod.downsample_events() (if lod_factor is not None)
+        make_npp_figure()
+        djia_anchor.add_anchor_control() (if reanchor=True)
+        djia_sidecar.save_sidecar() (if data_mode='sidecar')
+
+    Files created by this function:
+       images/[series_name]_npp_[yyyy-mm-dd].html
+       images/npp_data/[hash].npb for each event (if data_mode='sidecar')
+
+    Returns:
+        fig (bokeh Figure): normalized peak plot figure
+        end_date_str (str): end date of the plotted series in 'YYYY-mm-dd'
+            format, the last date available if djia_end_date was not
+    '''
+    from bokeh.io import output_file
+    from bokeh.embed import json_item
+    from bokeh.plotting import show, save
+    from bokeh.util.browser import view
+    if render_mode not in ('lines', 'multi_line'):
+        raise ValueError('render_mode must be lines or multi_line, not ' +
+                         str(render_mode))
+    if offset_unit not in OFFSETS_PER_YEAR:
+        raise ValueError('offset_unit must be days, sessions, or bars, ' +
+                         'not ' + str(offset_unit))
+    if data_mode not in ('inline', 'sidecar'):
+        raise ValueError('data_mode must be inline or sidecar, not ' +
+                         str(data_mode))
+    if intraday_file is not None and drawdown_threshold is not None:
+        raise ValueError('drawdown_threshold needs the full daily series, ' +
+                         'not the event windows of intraday_file')
+    if bands is not None:
+        check_bands(bands)
+    if reanchor and data_mode == 'sidecar':
+        raise ValueError('reanchor needs the raw closing values inline, ' +
+                         'not in the sidecar files')
+
+    # Create directory if images directory does not already exist
+    cur_path = os.path.split(os.path.abspath(__file__))[0]
+    image_fldr = 'images'
+    image_dir = os.path.join(cur_path, image_fldr)
+    if not os.access(image_dir, os.F_OK):
+        os.makedirs(image_dir)
+
+    if djia_end_date == 'today':
+        end_date = dt.date.today()  # Go through today
+    else:
+        end_date = dt.datetime.strptime(djia_end_date, '%Y-%m-%d')
 
-    if html_show:
-        show(fig)
+    end_date_str = end_date.strftime('%Y-%m-%d')
+
+    # Set main window and total data limits for monthly plot
+    frwd_mths_main = int(frwd_mths_main)
+    bkwd_mths_main = int(bkwd_mths_main)
+    djia_close = None
+    per_year = OFFSETS_PER_YEAR[offset_unit]
+    if intraday_file is not None:
+        # Stream the intraday file, keeping only the bars in the windows of
+        # the events
+        from djia_intraday import load_intraday_close
+        djia_close = load_intraday_close(
+            intraday_file, load_event_table(event_table)[3],
+            int(bkwd_mths_max), int(frwd_mths_max), bar_size, offset_unit,
+            metrics=metrics)
+        if offset_unit == 'bars':
+            per_year *= bars_per_session(
+                to_epoch_days(djia_close['Date'].values))
+    frwd_days_main = int(np.round(frwd_mths_main * per_year / 12))
+    bkwd_days_main = int(np.round(bkwd_mths_main * per_year / 12))
+    frwd_mths_max = int(frwd_mths_max)
+    bkwd_mths_max = int(bkwd_mths_max)
+    frwd_days_max = int(np.round(frwd_mths_max * per_year / 12))
+    bkwd_days_max = int(np.round(bkwd_mths_max * per_year / 12))
+    if n_analogs is not None and djia_close is None:
+        # The analog search needs the full series, so load it once here
+        djia_close = load_djia_close(end_date_str, download_from_internet,
+                                     metrics=metrics, symbol=symbol,
+                                     series_name=series_name)[0]
+
+    (events, end_date_str2, peak_vals, peak_dates, rec_label_yr_lst,
+        rec_label_yrmth_lst, rec_beg_yrmth_lst, maxdate_rng_lst) = \
+        get_djia_data(frwd_days_max, bkwd_days_max, end_date_str,
+                      download_from_internet, return_events=True,
+                      cache=cache, metrics=metrics, symbol=symbol,
+                      series_name=series_name, event_table=event_table,
+                      drawdown_threshold=drawdown_threshold,
+                      offset_unit=offset_unit, djia_close=djia_close)
+    if end_date_str2 != end_date_str:
+        logger.info('Updated end_date_str to %s because original ' +
+                    'end_date_str %s data was not available from Stooq.com',
+                    end_date_str2, end_date_str)
+        end_date_str = end_date_str2
+        end_date = dt.datetime.strptime(end_date_str, '%Y-%m-%d')
+
+    n_rec = events.n_events
+    rec_rows = None
+    cone_df = None
+    if cone_paths is not None:
+        # Simulate from the recessions only, before the analogs are added
+        from djia_bootstrap import forward_cones
+        cone_df = forward_cones(events, cone_paths, n_procs=cone_procs,
+                                seed=cone_seed, metrics=metrics)
+    if n_analogs is not None:
+        from djia_analogs import find_analogs, analog_events
+        with get_metrics(metrics).stage('analog_search',
+                                        n_rows=len(djia_close)):
+            analog_df = find_analogs(djia_close, events.peak_dates[-1],
+                                     n_analogs, analog_metric)
+        an_events, an_labels = analog_events(
+            djia_close, analog_df, bkwd_days_max, frwd_days_max, offset_unit,
+            analog_metric)
+        for row in analog_df.itertuples():
+            logger.info('Analog from %s has RMSE %.4f and correlation %.3f',
+                        row.start_date, row.rmse, row.corr)
+        # Keep the current event last
+        events = concat_events([events.take(np.arange(n_rec - 1)),
+                                an_events, events.take([n_rec - 1])])
+        rec_rows = np.append(np.arange(n_rec - 1), events.n_events - 1)
+        rec_label_yrmth_lst = (rec_label_yrmth_lst[:-1] + an_labels +
+                               rec_label_yrmth_lst[-1:])
+        # The analogs have no NBER start month
+        rec_beg_yrmth_lst = (rec_beg_yrmth_lst[:-1] + [None] * len(an_labels)
+                             + rec_beg_yrmth_lst[-1:])
+
+    # The percentile bands and the plot range are of every point of the
+    # events, so take them before LOD downsampling, and the bands of the
+    # recessions only
+    band_pcts = () if bands is None else tuple(bands)
+    if rec_rows is None:
+        band_df = event_bands(events, band_pcts)
+    else:
+        band_df = event_bands(events.take(rec_rows), band_pcts)
+        band_df[['min', 'max']] = event_bands(events, ())[['min', 'max']]
+    if reanchor:
+        # The trough is the lowest close of every point, so also take the
+        # anchor table before LOD downsampling
+        from djia_anchor import anchor_offsets
+        anchor_df = anchor_offsets(events, rec_beg_yrmth_lst)
+
+    if lod_factor is not None:
+        # Keep full resolution only in the main window
+        from djia_lod import downsample_events
+        events = downsample_events(events, -bkwd_days_main, frwd_days_main,
+                                   lod_factor)
+
+    # Create Bokeh plot of DJIA normalized peak plot figure
+    if drawdown_threshold is None:
+        fig_title = NPP_FIG_TITLE_FMT.format(series_label, n_rec)
+    else:
+        fig_title = NPP_DRAWDOWN_TITLE_FMT.format(
+            series_label, n_rec, drawdown_threshold)
+    if n_analogs is not None:
+        fig_title += NPP_ANALOG_TITLE_FMT.format(len(analog_df))
+    filename = ('images/' + series_name + '_npp_' + end_date_str + '.html')
+    output_file(filename, title=fig_title)
+    fig = make_npp_figure(events, rec_label_yrmth_lst, end_date,
+                          frwd_mths_main, bkwd_mths_main, frwd_mths_max,
+                          bkwd_mths_max, render_mode, fig_title, metrics,
+                          series_label, bands, cone_df, band_df)
+    layout = fig
+    if reanchor:
+        from djia_anchor import add_anchor_control
+        layout = add_anchor_control(fig, events, anchor_df, series_label)
+
+    if lod_factor is not None:
+        # Report the number of plotted points and the serialized size of the
+        # saved layout (the figure and any controls), which is what the HTML
+        # file embeds
+        layout_bytes = len(json.dumps(json_item(layout)))
+        logger.info('Figure has %d data points and %d bytes of serialized ' +
+                    'JSON', int(events.valid.sum()), layout_bytes)
+
+    if data_mode == 'sidecar':
+        from djia_sidecar import save_sidecar
+        with get_metrics(metrics).stage('html_serialization') as record:
+            record['n_bytes'], record['n_data_bytes'] = save_sidecar(
+                fig, events, filename, fig_title)
+        logger.info('Wrote %d bytes of HTML and %d bytes of event data',
+                    record['n_bytes'], record['n_data_bytes'])
+        if html_show:
+            # The page must be served over HTTP to fetch its data files
+            view(filename)
+    elif html_show or metrics is not None:
+        # With metrics, the HTML file is written (and timed) even when it is
+        # not opened in the browser
+        with get_metrics(metrics).stage('html_serialization') as record:
+            if html_show:
+                show(layout)
+            else:
+                save(layout)
+            record['n_bytes'] = os.path.getsize(filename)
 
     return fig, end_date_str
 
 
 if __name__ == '__main__':
     # execute only if run as a script
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     fig, end_date_str = djia_npp()
@@ -0,0 +1,342 @@
+'''
+This module runs the DJIA normalized peak plot as a long-running Bokeh server
+application. The series is loaded and aligned once when the server starts.
+A server-level periodic callback then fetches only the closes after the last
+known date through a reader (see djia_store.py) and appends them to the
+local DJIA store, and each browser session streams the new closes into the
+data source of the most recent recession only, without re-rendering the
+figure. The fetch runs on a worker thread, so that a slow data feed does not
+block the sessions on the server's IO loop. A local stand-in reader can be
+used in place of Stooq.com to run and test the server offline.
+
+This module defines the following function(s):
+    load_npp_state()
+    fetch_new_closes()
+    add_new_closes()
+    refresh_npp_state()
+    stream_new_closes()
+    make_npp_doc()
+    serve_npp()
+'''
+# Import packages
+import numpy as np
+import pandas as pd
+import datetime as dt
+import logging
+import os
+import djia_npp_bokeh as djia
+from djia_store import stooq_reader, append_store
+
+logger = logging.getLogger('djia_npp')
+
+'''
+Define functions
+'''
+
+
+def load_npp_state(frwd_mths_main=36, bkwd_mths_main=4, frwd_mths_max=60,
+                   bkwd_mths_max=8, djia_end_date='today', reader=None,
+                   data_dir=None, symbol='^DJI', series_name='djia',
+                   render_mode='lines', bands=None):
+    '''
+    This function loads and aligns the DJIA series once and returns the
+    shared server state from which every session figure is built.
+
+    Args:
+        frwd_mths_main (int): number of months forward from the peak to plot in
+            the default main window of the visualization
+        bkwd_mths_main (int): number of months backward from the peak to plot
+            in the default main window of the visualization
+        frwd_mths_max (int): maximum number of months forward from the peak to
+            allow for the plot, to be seen by zooming out
+        bkwd_mths_max (int): maximum number of months backward from the peak to
+            allow for the plot, to be seen by zooming out
+        djia_end_date (str): either 'today' or the end date of DJIA time series
+            in 'YYYY-mm-dd' format
+        reader (function or None): reader(symbol, start_date, end_date), see
+            djia_store.py, defaults to stooq_reader()
+        data_dir (str or None): directory of the DJIA store, defaults to the
+            data folder of this directory
+        symbol (str): ticker symbol of the series, see get_djia_data()
+        series_name (str): name of the series, whose store is
+            [series_name]_close.csv, see get_djia_data()
+        render_mode (str): 'lines' or 'multi_line', see djia_npp()
+        bands (tuple or None): percentiles of the cross-event bands, see
+            djia_npp()
+
+    Other functions and files called by this function:
+        djia_npp_bokeh.get_djia_data()
+
+    Returns:
+        state (dict): dictionary with the aligned events, legend labels, plot
+            window, series, figure options, the peak date and value of the
+            most recent recession, the last known date, and a DataFrame
+            'tail' of the closes fetched after the alignment
+    '''
+    if reader is None:
+        reader = stooq_reader
+    if data_dir is None:
+        data_dir = os.path.join(
+            os.path.split(os.path.abspath(djia.__file__))[0], 'data')
+    if djia_end_date == 'today':
+        end_date_str = dt.date.today().strftime('%Y-%m-%d')
+    else:
+        end_date_str = djia_end_date
+    frwd_days_max = int(np.round(frwd_mths_max * 364.25 / 12))
+    bkwd_days_max = int(np.round(bkwd_mths_max * 364.25 / 12))
+    (events, end_date_str2, peak_vals, peak_dates, rec_label_yr_lst,
+        rec_label_yrmth_lst, rec_beg_yrmth_lst, maxdate_rng_lst) = \
+        djia.get_djia_data(frwd_days_max, bkwd_days_max, end_date_str,
+                           download_from_internet=True, reader=reader,
+                           data_dir=data_dir, return_events=True,
+                           save_data=False, symbol=symbol,
+                           series_name=series_name)
+    state = {'events': events, 'rec_label_lst': rec_label_yrmth_lst,
+             'frwd_mths_main': frwd_mths_main,
+             'bkwd_mths_main': bkwd_mths_main,
+             'frwd_mths_max': frwd_mths_max, 'bkwd_mths_max': bkwd_mths_max,
+             'frwd_days_max': frwd_days_max, 'reader': reader,
+             'data_dir': data_dir, 'symbol': symbol,
+             'series_name': series_name, 'render_mode': render_mode,
+             'bands': bands,
+             'peak_date': pd.Timestamp(peak_dates[-1]),
+             'peak_val': peak_vals[-1],
+             'aligned_date': pd.Timestamp(end_date_str2),
+             'last_date': pd.Timestamp(end_date_str2),
+             'tail': pd.DataFrame({'Date': pd.to_datetime([]),
+                                   'Close': np.array([])})}
+
+    return state
+
+
+def fetch_new_closes(state, end_date=None):
+    '''
+    This function fetches the closes of the series after the last known date
+    and appends them to its local store, without changing the server state.
+    It blocks on the reader, so the server runs it on a worker thread.
+
+    Args:
+        state (dict): server state from load_npp_state()
+        end_date (datetime or None): last date to fetch, defaults to now
+
+    Other functions and files called by this function:
+        djia_store.append_store()
+
+    Files created by this function:
+        [data_dir]/[series_name]_close.csv (appended)
+
+    Returns:
+        new_close (DataFrame): DataFrame with Date and Close columns of the
+            closes after the last known date, possibly empty
+    '''
+    if end_date is None:
+        end_date = dt.datetime.now()
+    start_date = state['last_date'] + pd.Timedelta(days=1)
+    if start_date > pd.Timestamp(end_date):
+        return state['tail'].iloc[:0]
+    new_close = state['reader'](state['symbol'], start_date.to_pydatetime(),
+                                end_date)
+    new_close = new_close[new_close['Date'] > state['last_date']]
+    if len(new_close):
+        append_store(state['data_dir'], state['series_name'] + '_close',
+                     new_close)
+
+    return new_close[['Date', 'Close']]
+
+
+def add_new_closes(state, new_close):
+    '''
+    This function appends fetched closes to the tail of the server state,
+    from which the sessions stream them.
+
+    Args:
+        state (dict): server state from load_npp_state()
+        new_close (DataFrame): DataFrame from fetch_new_closes()
+
+    Returns:
+        n_new (int): number of new closes
+    '''
+    new_close = new_close[new_close['Date'] > state['last_date']]
+    n_new = len(new_close)
+    if n_new == 0:
+        return n_new
+    state['tail'] = pd.concat([state['tail'], new_close], ignore_index=True)
+    state['last_date'] = state['tail']['Date'].iloc[-1]
+
+    return n_new
+
+
+def refresh_npp_state(state, end_date=None):
+    '''
+    This function fetches the closes after the last known date, appends them
+    to the local store of the series and to the tail of the server state.
+
+    Args:
+        state (dict): server state from load_npp_state()
+        end_date (datetime or None): last date to fetch, defaults to now
+
+    Other functions and files called by this function:
+        fetch_new_closes()
+        add_new_closes()
+
+    Returns:
+        n_new (int): number of new closes
+    '''
+    n_new = add_new_closes(state, fetch_new_closes(state, end_date))
+
+    return n_new
+
+
+def stream_new_closes(source, new_close, peak_date, peak_val, last_date,
+                      frwd_days_max):
+    '''
+    This function streams the closes after last_date that are within
+    frwd_days_max days of the peak into the ColumnDataSource of one
+    recession line, or patches them onto the last row of the shared source
+    of a multi_line figure. A Bokeh patch replaces elements of a row but
+    cannot append to it, so in multi_line mode each update resends the
+    whole path of the recession (but none of the other events), while in
+    lines mode it sends only the new points.
+
+    Args:
+        source (ColumnDataSource): source of the recession line with columns
+            days_frm_peak, Date, Close, and close_dv_pk (and index), or the
+            multi_line source with one row per event and the recession last
+        new_close (DataFrame): DataFrame with Date and Close columns
+        peak_date (Timestamp): date of the peak of the recession
+        peak_val (float): peak value of the recession
+        last_date (Timestamp): last date already in the source
+        frwd_days_max (int): maximum number of days forward from the peak
+
+    Returns:
+        n_streamed (int): number of rows streamed
+        last_date (Timestamp): last date in the source after streaming
+    '''
+    days_frm_peak = (new_close['Date'] - peak_date).dt.days
+    keep = ((new_close['Date'] > last_date) &
+            (days_frm_peak <= frwd_days_max)).to_numpy()
+    n_streamed = int(keep.sum())
+    if n_streamed == 0:
+        return n_streamed, last_date
+    close = new_close['Close'].to_numpy(dtype=np.float64)[keep]
+    if 'xs' in source.data:
+        # Multi_line source: replace the row of the recession, the last one,
+        # with its path extended by the new points
+        row = len(source.data['xs']) - 1
+        source.patch({
+            'xs': [(row, np.append(source.data['xs'][row],
+                                   days_frm_peak.to_numpy()[keep]))],
+            'ys': [(row, np.append(source.data['ys'][row],
+                                   close / peak_val))]})
+    else:
+        new_data = {'days_frm_peak': days_frm_peak.to_numpy()[keep],
+                    'Date': new_close['Date'].to_numpy()[keep],
+                    'Close': close,
+                    'close_dv_pk': close / peak_val}
+        if 'index' in source.data:
+            # Continue the offset position index of event_frame()
+            idx_offset = (source.data['index'][-1] -
+                          source.data['days_frm_peak'][-1])
+            new_data['index'] = new_data['days_frm_peak'] + idx_offset
+        source.stream(new_data)
+    last_date = new_close['Date'][keep].iloc[-1]
+
+    return n_streamed, last_date
+
+
+def make_npp_doc(doc, state, update_ms=60000):
+    '''
+    This function builds one session document of the server from the shared
+    state and adds a periodic callback that streams the closes fetched into
+    the state tail since the session was last updated.
+
+    Args:
+        doc (bokeh Document): session document
+        state (dict): server state from load_npp_state()
+        update_ms (int): milliseconds between session updates
+
+    Other functions and files called by this function:
+        djia_npp_bokeh.make_npp_figure()
+        stream_new_closes()
+
+    Returns:
+        update (function): the session update callback, which returns the
+            number of rows streamed
+    '''
+    fig = djia.make_npp_figure(
+        state['events'], state['rec_label_lst'], state['aligned_date'],
+        state['frwd_mths_main'], state['bkwd_mths_main'],
+        state['frwd_mths_max'], state['bkwd_mths_max'],
+        render_mode=state['render_mode'], bands=state['bands'])
+    source = fig.select_one({'name': djia.NPP_CURRENT_SOURCE})
+    if source is None:
+        source = fig.select_one({'name': djia.NPP_EVENTS_SOURCE})
+    session = {'last_date': state['aligned_date']}
+
+    def update():
+        n_streamed, session['last_date'] = stream_new_closes(
+            source, state['tail'], state['peak_date'], state['peak_val'],
+            session['last_date'], state['frwd_days_max'])
+
+        return n_streamed
+
+    update()
+    doc.title = djia.NPP_FIG_TITLE
+    doc.add_root(fig)
+    doc.add_periodic_callback(update, update_ms)
+
+    return update
+
+
+def serve_npp(port=5006, update_ms=60000, fetch_ms=600000, **state_kwargs):
+    '''
+    This function starts the Bokeh server at http://localhost:port/djia_npp
+    and blocks. The state is loaded once, refreshed every fetch_ms
+    milliseconds, and every session streams new closes every update_ms
+    milliseconds.
+
+    Args:
+        port (int): port of the server
+        update_ms (int): milliseconds between session updates
+        fetch_ms (int): milliseconds between fetches of new closes
+        state_kwargs (dict): keyword arguments of load_npp_state()
+
+    Other functions and files called by this function:
+        load_npp_state()
+        fetch_new_closes()
+        add_new_closes()
+        make_npp_doc()
+
+    Returns: None
+    '''
+    from bokeh.application import Application
+    from bokeh.application.handlers.function import FunctionHandler
+    from bokeh.server.server import Server
+    from tornado.ioloop import PeriodicCallback
+
+    state = load_npp_state(**state_kwargs)
+    app = Application(FunctionHandler(
+        lambda doc: make_npp_doc(doc, state, update_ms)))
+    server = Server({'/djia_npp': app}, port=port)
+    server.start()
+
+    async def refresh():
+        # Fetch on a worker thread and update the state on the IO loop,
+        # where the sessions read it
+        new_close = await server.io_loop.run_in_executor(
+            None, fetch_new_closes, state)
+        n_new = add_new_closes(state, new_close)
+        if n_new:
+            logger.info('Fetched %d new closes through %s', n_new,
+                        state['last_date'].strftime('%Y-%m-%d'))
+
+    PeriodicCallback(refresh, fetch_ms).start()
+    logger.info('Serving DJIA normalized peak plot at ' +
+                'http://localhost:%d/djia_npp', port)
+    server.io_loop.start()
+
+
+if __name__ == '__main__':
+    # execute only if run as a script
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    serve_npp()
@@ -0,0 +1,286 @@
+'''
+This module writes the normalized peak plot as an HTML figure shell plus
+compressed binary data files (the sidecar) instead of inlining every data
+source as JSON in the HTML file. Each event is one gzip-compressed file of
+little-endian typed arrays: int32 offsets from peak, int32 dates as epoch
+day numbers, and float64 closing values. The files are named by the hash of
+their content, so the snapshots of different days share the files of the
+events whose windows have not changed, and a static host or browser cache
+serves them once. The HTML file fetches and decodes the files on page load
+and fills the empty data sources of the figure. Because browsers do not
+fetch files from file:// pages, the HTML file must be served over HTTP, for
+example by running python -m http.server in the images directory.
+
+This module defines the following function(s):
+    encode_event()
+    decode_event()
+    write_event_files()
+    externalize_sources()
+    sidecar_template()
+    save_sidecar()
+'''
+# Import packages
+import numpy as np
+import gzip
+import hashlib
+import json
+import os
+from djia_npp_bokeh import NPP_CURRENT_SOURCE, NPP_EVENTS_SOURCE
+
+SIDECAR_DIR = 'npp_data'
+SIDECAR_EXT = '.npb'
+SIDECAR_VERSION = 1
+
+# Loader run by the HTML file once Bokeh has embedded the figure. The header
+# of each file is int32 [number of points, format version], so that the
+# float64 closing values start on an 8-byte boundary.
+SIDECAR_JS = """
+(function() {
+  const manifest = MANIFEST;
+  async function load_event(url) {
+    const resp = await fetch(url);
+    let buf = await resp.arrayBuffer();
+    const head = new Uint8Array(buf, 0, 2);
+    if (head[0] == 0x1f && head[1] == 0x8b) {
+      // Not already decoded by a Content-Encoding: gzip response
+      const stream = new Blob([buf]).stream().pipeThrough(
+        new DecompressionStream('gzip'));
+      buf = await new Response(stream).arrayBuffer();
+    }
+    const n = new Int32Array(buf, 0, 2)[0];
+    return {offsets: Float64Array.from(new Int32Array(buf, 8, n)),
+            days: new Int32Array(buf, 8 + 4 * n, n),
+            close: new Float64Array(buf, 8 + 8 * n, n)};
+  }
+  async function fill(doc) {
+    const arrays = await Promise.all(manifest.urls.map(load_event));
+    const close_dv_pk = arrays.map((a, i) =>
+      a.close.map((c) => c / manifest.peak_vals[i]));
+    if (manifest.render_mode == 'multi_line') {
+      const source = doc.get_model_by_name(manifest.sources[0]);
+      const data = Object.assign({}, source.data);
+      data.xs = arrays.map((a) => a.offsets);
+      data.ys = close_dv_pk;
+      if ('day_offsets' in data)
+        data.day_offsets = arrays.map((a, i) => Float64Array.from(
+          a.days, (d) => d - manifest.peak_days[i]));
+      source.data = data;
+    } else {
+      arrays.forEach((a, i) => {
+        const source = doc.get_model_by_name(manifest.sources[i]);
+        source.data = {days_frm_peak: a.offsets,
+                       Date: Float64Array.from(a.days, (d) => d * 86400000),
+                       Close: a.close, close_dv_pk: close_dv_pk[i]};
+      });
+    }
+  }
+  const timer = setInterval(function() {
+    if (window.Bokeh === undefined || Bokeh.documents.length == 0)
+      return;
+    clearInterval(timer);
+    fill(Bokeh.documents[0]);
+  }, 20);
+})();
+"""
+
+'''
+Define functions
+'''
+
+
+def encode_event(events, i):
+    '''
+    This function packs the valid points of event i into the uncompressed
+    binary format of the sidecar files.
+
+    Args:
+        events (AlignedEvents): aligned events x offsets arrays
+        i (int): event number
+
+    Returns:
+        raw (bytes): int32 header [n, SIDECAR_VERSION], then n int32 offsets
+            from peak, n int32 epoch day dates, and n float64 closing values,
+            all little-endian
+    '''
+    idx = np.flatnonzero(events.valid[i])
+    raw = b''.join([
+        np.array([len(idx), SIDECAR_VERSION], dtype='<i4').tobytes(),
+        events.days_frm_peak[idx].astype('<i4').tobytes(),
+        events.date_days[i, idx].astype('<i4').tobytes(),
+        events.close[i, idx].astype('<f8').tobytes()])
+
+    return raw
+
+
+def decode_event(data):
+    '''
+    This function unpacks one sidecar file, compressed or not, the same way
+    as the JavaScript loader of the HTML file.
+
+    Args:
+        data (bytes): content of a sidecar file
+
+    Returns:
+        offsets (array): int32 array of offsets from peak
+        date_days (array): int32 array of epoch day dates
+        close (array): float64 array of closing values
+    '''
+    if data[:2] == b'\x1f\x8b':
+        data = gzip.decompress(data)
+    n, version = np.frombuffer(data, dtype='<i4', count=2)
+    if version != SIDECAR_VERSION:
+        raise ValueError('Sidecar format version ' + str(version) +
+                         ' is not ' + str(SIDECAR_VERSION))
+    offsets = np.frombuffer(data, dtype='<i4', count=n, offset=8)
+    date_days = np.frombuffer(data, dtype='<i4', count=n, offset=8 + 4 * n)
+    close = np.frombuffer(data, dtype='<f8', count=n, offset=8 + 8 * n)
+
+    return offsets, date_days, close
+
+
+def write_event_files(events, data_dir):
+    '''
+    This function writes the sidecar file of each event, named by the hash
+    of its content, unless a file of the same name already exists.
+
+    Args:
+        events (AlignedEvents): aligned events x offsets arrays
+        data_dir (str): directory of the sidecar files
+
+    Files created by this function:
+        [data_dir]/[hash].npb for each event not already written
+
+    Returns:
+        file_lst (list): list of file names of each event
+        n_bytes (int): total bytes of the files of all events
+    '''
+    if not os.access(data_dir, os.F_OK):
+        os.makedirs(data_dir, exist_ok=True)
+    file_lst = []
+    n_bytes = 0
+    for i in range(events.n_events):
+        raw = encode_event(events, i)
+        file_name = hashlib.sha1(raw).hexdigest()[:20] + SIDECAR_EXT
+        file_path = os.path.join(data_dir, file_name)
+        if not os.access(file_path, os.F_OK):
+            # mtime=0 keeps the compressed bytes a function of the content
+            tmp_path = file_path + '.' + str(os.getpid()) + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(gzip.compress(raw, compresslevel=9, mtime=0))
+            os.replace(tmp_path, file_path)
+        file_lst.append(file_name)
+        n_bytes += os.path.getsize(file_path)
+
+    return file_lst, n_bytes
+
+
+def externalize_sources(fig, events, url_lst):
+    '''
+    This function empties the per-point columns of the event data sources of
+    a figure from djia_npp_bokeh.make_npp_figure() and returns the manifest
+    with which the loader refills them. The per-event columns of the
+    multi_line source (labels, colors, peak dates and values) stay inline.
+
+    Args:
+        fig (bokeh Figure): normalized peak plot figure
+        events (AlignedEvents): aligned events drawn in the figure
+        url_lst (list): list of URLs of the sidecar file of each event,
+            relative to the HTML file
+
+    Returns:
+        manifest (dict): dictionary of the render mode, source names, URLs,
+            peak values, and peak epoch days of the events
+    '''
+    multi_lines = [r for r in fig.renderers
+                   if type(r.glyph).__name__ == 'MultiLine']
+    if multi_lines:
+        render_mode = 'multi_line'
+        source = multi_lines[0].data_source
+        source.name = NPP_EVENTS_SOURCE
+        source_lst = [source.name]
+        data = dict(source.data)
+        for col in ['xs', 'ys', 'day_offsets']:
+            if col in data:
+                data[col] = [[] for i in range(events.n_events)]
+        source.data = data
+    else:
+        render_mode = 'lines'
+        source_lst = []
+        event_sources = [r.data_source for r in fig.renderers
+                         if 'close_dv_pk' in r.data_source.data]
+        for i, source in enumerate(event_sources):
+            # Keep the name of the current event source, by which the server
+            # finds it
+            if source.name != NPP_CURRENT_SOURCE:
+                source.name = 'npp_event_' + str(i)
+            source_lst.append(source.name)
+            source.data = {'days_frm_peak': [], 'Date': [], 'Close': [],
+                           'close_dv_pk': []}
+    peak_days = (np.array(events.peak_dates, dtype='datetime64[D]')
+                 .astype(np.int64))
+    manifest = {'render_mode': render_mode, 'sources': source_lst,
+                'urls': list(url_lst), 'peak_vals': events.peak_vals.tolist(),
+                'peak_days': peak_days.tolist()}
+
+    return manifest
+
+
+def sidecar_template(manifest):
+    '''
+    This function returns the Bokeh file template of the HTML figure shell,
+    which runs the loader with the manifest after the figure is embedded.
+
+    Args:
+        manifest (dict): manifest from externalize_sources()
+
+    Returns:
+        template (Template): Jinja2 template extending Bokeh's file.html
+    '''
+    from bokeh.core.templates import get_env
+    loader = SIDECAR_JS.replace('MANIFEST', json.dumps(manifest))
+    template = get_env().from_string(
+        '{% extends "file.html" %}\n{% block inner_body %}\n' +
+        '{{ super() }}\n<script type="text/javascript">{% raw %}' + loader +
+        '{% endraw %}</script>\n{% endblock %}')
+
+    return template
+
+
+def save_sidecar(fig, events, filename, title, resources=None):
+    '''
+    This function writes the sidecar files of the events and the HTML figure
+    shell that loads them.
+
+    Args:
+        fig (bokeh Figure): normalized peak plot figure of the events
+        events (AlignedEvents): aligned events drawn in the figure
+        filename (str): path of the HTML file
+        title (str): title of the HTML document
+        resources (Resources or None): BokehJS resources, defaults to CDN
+
+    Other functions and files called by this function:
+        write_event_files()
+        externalize_sources()
+        sidecar_template()
+
+    Files created by this function:
+        [filename]
+        [npp_data]/[hash].npb for each event, in the directory of filename
+
+    Returns:
+        html_bytes (int): size of the HTML file in bytes
+        data_bytes (int): total size of the sidecar files of the events
+    '''
+    from bokeh.io import save
+    from bokeh.resources import CDN
+    html_dir = os.path.dirname(os.path.abspath(filename))
+    file_lst, data_bytes = write_event_files(
+        events, os.path.join(html_dir, SIDECAR_DIR))
+    manifest = externalize_sources(
+        fig, events, [SIDECAR_DIR + '/' + f for f in file_lst])
+    save(fig, filename=filename, title=title,
+         resources=CDN if resources is None else resources,
+         template=sidecar_template(manifest))
+    html_bytes = os.path.getsize(filename)
+
+    return html_bytes, data_bytes
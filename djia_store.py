@@ -0,0 +1,332 @@
+'''
+This module maintains a persistent, append-only local store of a daily
+closing price series so that a daily refresh only fetches and writes the rows
+after the last stored date instead of re-downloading the full history. The
+store is a headed CSV file of Date and Close plus a small JSON metadata file
+that records the last stored date and the committed byte length of the CSV.
+An append writes the new rows after the committed length and then atomically
+replaces the metadata file, so an interrupted append is discarded on the next
+read or write.
+
+Readers are plain callables with the signature
+reader(symbol, start_date, end_date) that return a DataFrame with Date and
+Close columns. stooq_reader() downloads from Stooq.com and csv_reader()
+creates a local stand-in that reads from a csv file.
+
+This module defines the following function(s):
+    stooq_reader()
+    csv_reader()
+    retry_reader()
+    store_paths()
+    read_store_meta()
+    load_store()
+    append_store()
+    fetch_store()
+    update_store()
+'''
+# Import packages
+import numpy as np
+import pandas as pd
+import datetime as dt
+import json
+import time
+import io
+import os
+
+STORE_START_DATE = dt.datetime(1896, 5, 27)
+
+'''
+Define functions
+'''
+
+
+def stooq_reader(symbol, start_date, end_date):
+    '''
+    This function downloads daily closing values of a symbol from Stooq.com
+    (requires internet connection).
+
+    Args:
+        symbol (str): Stooq.com ticker symbol, e.g. '^DJI'
+        start_date (datetime): first date to download
+        end_date (datetime): last date to download
+
+    Returns:
+        close_df (DataFrame): DataFrame with Date and Close columns sorted
+            from old to new
+    '''
+    # Imported here so that the offline path never loads pandas_datareader
+    import pandas_datareader as pddr
+
+    stooq_df = pddr.stooq.StooqDailyReader(symbols=symbol, start=start_date,
+                                           end=end_date).read()
+    close_df = pd.DataFrame(stooq_df['Close']).sort_index()  # Old to new
+    close_df = close_df.reset_index(level=['Date'])
+
+    return close_df
+
+
+def csv_reader(file_path):
+    '''
+    This function creates a reader with the same signature as stooq_reader()
+    that serves closing values from a local csv file with Date and Close
+    columns. It is a stand-in for Stooq.com in tests and offline runs.
+
+    Args:
+        file_path (str or dict): path to csv file with Date and Close columns
+            served for every symbol, or dictionary of such paths by symbol
+
+    Returns:
+        reader (function): reader(symbol, start_date, end_date) returning a
+            DataFrame with Date and Close columns
+    '''
+    def reader(symbol, start_date, end_date):
+        if isinstance(file_path, dict):
+            if symbol not in file_path:
+                raise ValueError('No csv file for symbol ' + symbol)
+            symbol_path = file_path[symbol]
+        else:
+            symbol_path = file_path
+        close_df = pd.read_csv(symbol_path, names=['Date', 'Close'],
+                               parse_dates=['Date'], skiprows=1,
+                               na_values=['.', 'na', 'NaN']).dropna()
+        close_df = close_df[(close_df['Date'] >= pd.Timestamp(start_date)) &
+                            (close_df['Date'] <= pd.Timestamp(end_date))]
+
+        return close_df.reset_index(drop=True)
+
+    return reader
+
+
+def retry_reader(reader, retries=3, backoff_sec=1.0):
+    '''
+    This function wraps a reader so that a call that fails with an OSError,
+    which covers connection errors and pandas_datareader's RemoteDataError,
+    is retried up to retries more times with exponential backoff.
+
+    Args:
+        reader (function): reader(symbol, start_date, end_date)
+        retries (int): number of retries after the first failed call
+        backoff_sec (float): seconds to wait before the first retry, doubled
+            before each later retry
+
+    Returns:
+        retrying (function): reader(symbol, start_date, end_date) with retries
+    '''
+    def retrying(symbol, start_date, end_date):
+        for attempt in range(retries + 1):
+            try:
+                return reader(symbol, start_date, end_date)
+            except OSError:
+                if attempt == retries:
+                    raise
+                time.sleep(backoff_sec * 2 ** attempt)
+
+    return retrying
+
+
+def store_paths(store_dir, name):
+    '''
+    This function returns the paths of the csv data file and JSON metadata
+    file of a series store.
+
+    Args:
+        store_dir (str): directory of the store
+        name (str): name of the stored series, e.g. 'djia_close'
+
+    Returns:
+        csv_path (str): path of the csv data file
+        meta_path (str): path of the JSON metadata file
+    '''
+    csv_path = os.path.join(store_dir, name + '.csv')
+    meta_path = os.path.join(store_dir, name + '.meta.json')
+
+    return csv_path, meta_path
+
+
+def read_store_meta(store_dir, name):
+    '''
+    This function reads the metadata of a series store.
+
+    Args:
+        store_dir (str): directory of the store
+        name (str): name of the stored series
+
+    Returns:
+        meta (dict or None): dictionary with keys first_date, last_date,
+            n_rows, and n_bytes, or None if the store does not exist
+    '''
+    csv_path, meta_path = store_paths(store_dir, name)
+    if not (os.access(meta_path, os.F_OK) and os.access(csv_path, os.F_OK)):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+
+    return meta
+
+
+def _write_meta(meta_path, meta):
+    '''
+    This function atomically replaces the JSON metadata file of a store.
+    '''
+    tmp_path = meta_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, meta_path)
+
+
+def load_store(store_dir, name, end_date=None):
+    '''
+    This function loads the committed rows of a series store, optionally
+    truncated at an end date.
+
+    Args:
+        store_dir (str): directory of the store
+        name (str): name of the stored series
+        end_date (datetime or None): if not None, last date to load
+
+    Returns:
+        close_df (DataFrame or None): DataFrame with Date and Close columns
+            sorted from old to new, or None if the store does not exist
+    '''
+    meta = read_store_meta(store_dir, name)
+    if meta is None:
+        return None
+    csv_path, _ = store_paths(store_dir, name)
+    with open(csv_path, 'rb') as f:
+        csv_bytes = f.read(meta['n_bytes'])
+    close_df = pd.read_csv(io.BytesIO(csv_bytes), names=['Date', 'Close'],
+                           parse_dates=['Date'], skiprows=1,
+                           na_values=['.', 'na', 'NaN']).dropna()
+    if end_date is not None:
+        n_keep = np.searchsorted(close_df['Date'].values,
+                                 np.datetime64(pd.Timestamp(end_date)),
+                                 side='right')
+        close_df = close_df.iloc[:n_keep]
+
+    return close_df.reset_index(drop=True)
+
+
+def append_store(store_dir, name, new_close):
+    '''
+    This function appends the rows of new_close that are later than the last
+    stored date to a series store, creating the store if it does not exist.
+    The new rows are written after the committed byte length of the csv file
+    (discarding any partial tail of an interrupted append) and committed by
+    atomically replacing the metadata file.
+
+    Args:
+        store_dir (str): directory of the store
+        name (str): name of the stored series
+        new_close (DataFrame): DataFrame with Date and Close columns
+
+    Returns:
+        meta (dict): updated store metadata
+        n_new (int): number of rows appended
+    '''
+    if not os.access(store_dir, os.F_OK):
+        os.makedirs(store_dir)
+    csv_path, meta_path = store_paths(store_dir, name)
+    meta = read_store_meta(store_dir, name)
+    new_close = new_close[['Date', 'Close']].dropna().sort_values('Date')
+    if meta is not None:
+        new_close = new_close[new_close['Date'] >
+                              pd.Timestamp(meta['last_date'])]
+    n_new = len(new_close)
+    if n_new == 0:
+        return meta, n_new
+
+    csv_bytes = new_close.to_csv(index=False, header=(meta is None),
+                                 date_format='%Y-%m-%d').encode()
+    if meta is None:
+        tmp_path = csv_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(csv_bytes)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, csv_path)
+        meta = {'first_date': new_close['Date'].iloc[0].strftime('%Y-%m-%d'),
+                'n_rows': 0, 'n_bytes': 0}
+    else:
+        with open(csv_path, 'r+b') as f:
+            f.truncate(meta['n_bytes'])
+            f.seek(meta['n_bytes'])
+            f.write(csv_bytes)
+            f.flush()
+            os.fsync(f.fileno())
+    meta['last_date'] = new_close['Date'].iloc[-1].strftime('%Y-%m-%d')
+    meta['n_rows'] += n_new
+    meta['n_bytes'] += len(csv_bytes)
+    _write_meta(meta_path, meta)
+
+    return meta, n_new
+
+
+def fetch_store(store_dir, name, symbol, end_date, reader=stooq_reader,
+                start_date=STORE_START_DATE):
+    '''
+    This function fetches only the rows after the last stored date of a
+    series store (or the full history from start_date if the store does not
+    exist yet) through end_date and appends them.
+
+    Args:
+        store_dir (str): directory of the store
+        name (str): name of the stored series
+        symbol (str): ticker symbol passed to the reader
+        end_date (datetime): last date to fetch
+        reader (function): reader(symbol, start_date, end_date) returning a
+            DataFrame with Date and Close columns
+        start_date (datetime): first date to fetch for a new store
+
+    Returns:
+        meta (dict): store metadata after the append
+        n_new (int): number of rows appended
+    '''
+    meta = read_store_meta(store_dir, name)
+    n_new = 0
+    if meta is None:
+        fetch_start = start_date
+    else:
+        fetch_start = (dt.datetime.strptime(meta['last_date'], '%Y-%m-%d') +
+                       dt.timedelta(days=1))
+    if fetch_start <= end_date:
+        new_close = reader(symbol, fetch_start, end_date)
+        meta, n_new = append_store(store_dir, name, new_close)
+    if meta is None:
+        raise ValueError('No data for ' + symbol + ' from ' +
+                         fetch_start.strftime('%Y-%m-%d') + ' to ' +
+                         end_date.strftime('%Y-%m-%d'))
+
+    return meta, n_new
+
+
+def update_store(store_dir, name, symbol, end_date, reader=stooq_reader,
+                 start_date=STORE_START_DATE):
+    '''
+    This function brings a series store up to end_date by fetching only the
+    rows after its last stored date (or the full history from start_date if
+    the store does not exist yet) and appending them.
+
+    Args:
+        store_dir (str): directory of the store
+        name (str): name of the stored series
+        symbol (str): ticker symbol passed to the reader
+        end_date (datetime): last date to fetch
+        reader (function): reader(symbol, start_date, end_date) returning a
+            DataFrame with Date and Close columns
+        start_date (datetime): first date to fetch for a new store
+
+    Other functions and files called by this function:
+        fetch_store()
+        load_store()
+
+    Returns:
+        close_df (DataFrame): stored Date and Close series through end_date
+        n_new (int): number of rows appended
+    '''
+    meta, n_new = fetch_store(store_dir, name, symbol, end_date, reader,
+                              start_date)
+    close_df = load_store(store_dir, name, end_date)
+
+    return close_df, n_new
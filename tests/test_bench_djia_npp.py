@@ -0,0 +1,28 @@
+'''
+Tests of benchmarks/bench_djia_npp.py module
+'''
+
+import json
+from benchmarks import bench_djia_npp as bench
+
+
+# Test that a small benchmark run writes comparable JSON results
+def test_run_and_compare_benchmarks(tmp_path):
+    output = str(tmp_path / 'bench.json')
+    bench_new = bench.run_benchmarks(scales=(1,), n_events_lst=(10,),
+                                     repeats=1, output=output,
+                                     n_paths_lst=(1000,), procs_lst=(1, 2))
+    with open(output) as f:
+        bench_old = json.load(f)
+    stages = {(r['case'], r['stage']) for r in bench_old['results']}
+    assert ('bundled', 'peak_search') in stages
+    assert ('bundled', 'html_multi_line') in stages
+    assert ('synthetic_x1_e10', 'alignment') in stages
+    assert ('bootstrap_p1000', 'procs_2') in stages
+    offline = [r for r in bench_old['results']
+               if r['stage'] == 'offline_data_path'][0]
+    assert offline['heavy_modules'] == []
+    assert bench.compare_benchmarks(bench_old, bench_new, 1e6) == []
+    for rec in bench_old['results']:
+        rec['seconds_min'] /= 1e9
+    assert len(bench.compare_benchmarks(bench_old, bench_new)) > 0
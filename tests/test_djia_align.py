@@ -0,0 +1,108 @@
+'''
+Tests of djia_align.py module
+'''
+
+import os
+import pytest
+import numpy as np
+import pandas as pd
+import djia_align
+import djia_npp_bokeh as djia
+
+CUR_PATH = os.path.split(os.path.abspath(__file__))[0]
+DATA_DIR = os.path.join(CUR_PATH, '..', 'data')
+
+
+# Test that the aligned output for the bundled 2022-03-03 data is identical to
+# the bundled djia_close_pk csv file created by the original merge chain
+def test_align_matches_bundled_csv():
+    with open(os.path.join(DATA_DIR, 'djia_close_pk_2022-03-03.csv')) as f:
+        csv_expected = f.read()
+    djia_close_pk = djia.get_djia_data(1821, 243, '2022-03-03',
+                                       download_from_internet=False,
+                                       save_data=False)[0]
+    assert djia_close_pk.to_csv(index=False) == csv_expected
+
+
+# Test peak ties resolve to the latest date and windows only fill trading days
+def test_find_peaks_and_windows():
+    djia_close = pd.DataFrame(
+        {'Date': pd.to_datetime(['2020-01-01', '2020-01-02', '2020-01-06',
+                                 '2020-01-07', '2020-01-08']),
+         'Close': [1.0, 3.0, 2.0, 3.0, 1.5]})
+    djia_close_pk, peak_vals, peak_dates = djia_align.align_peaks(
+        djia_close, [('2020-01-01', '2020-01-07')], 3, 2)
+    assert peak_vals == [3.0]
+    assert peak_dates == ['2020-01-07']
+    assert list(djia_close_pk['days_frm_peak']) == [-3, -2, -1, 0, 1, 2]
+    assert np.allclose(djia_close_pk['close_dv_pk0'].to_numpy(),
+                       [np.nan, np.nan, 2.0 / 3.0, 1.0, 0.5, np.nan],
+                       equal_nan=True)
+
+
+# Test that an empty peak date range raises a ValueError
+def test_find_peaks_empty_range():
+    day_arr = djia_align.to_epoch_days(['2020-01-01', '2020-01-02'])
+    with pytest.raises(ValueError):
+        djia_align.find_peaks(day_arr, np.array([1.0, 2.0]),
+                              [('2021-01-01', '2021-02-01')])
+
+
+# Test that the AlignedEvents per-event frames match the dropna() of the
+# corresponding wide DataFrame columns
+def test_aligned_events_views():
+    events = djia.get_djia_data(1821, 243, '2022-03-03',
+                                download_from_internet=False,
+                                return_events=True, save_data=False)[0]
+    djia_close_pk = events.to_wide()
+    assert events.close.shape == (15, 2065)
+    assert events.date_days.dtype == np.int32
+    for i in [0, 7, 14]:
+        wide_rec = djia_close_pk[['days_frm_peak', f'Date{i}', f'Close{i}',
+                                  f'close_dv_pk{i}']].dropna()
+        wide_rec.columns = ['days_frm_peak', 'Date', 'Close', 'close_dv_pk']
+        pd.testing.assert_frame_equal(events.event_frame(i), wide_rec,
+                                      check_index_type=False)
+    n_valid = djia_close_pk.filter(like='Close').count().sum()
+    assert events.valid.sum() == n_valid
+
+
+# Test that truncating the aligned events at an earlier end date equals the
+# alignment of the series ending on that date
+def test_aligned_events_truncate():
+    djia_close = djia.load_djia_close('2022-03-03', False)[0]
+    events = djia.get_djia_data(1821, 243, '2022-03-03', False,
+                                return_events=True, save_data=False,
+                                djia_close=djia_close)[0]
+    for end_date in ['2021-06-15', '2020-12-25']:
+        events_end = djia.get_djia_data(
+            1821, 243, end_date, False, return_events=True, save_data=False,
+            djia_close=djia_close[djia_close['Date'] <= end_date])[0]
+        events_trunc = events.truncate(end_date)
+        assert np.array_equal(events_trunc.valid, events_end.valid)
+        assert np.array_equal(events_trunc.date_days, events_end.date_days)
+        assert np.array_equal(events_trunc.close, events_end.close,
+                              equal_nan=True)
+
+
+# Test that the trading-session alignment is dense and that each session
+# offset is the row that many sessions from the peak
+def test_align_sessions():
+    djia_close = djia.load_djia_close('2022-03-03', False)[0]
+    events = djia.get_djia_data(1260, 168, '2022-03-03', False,
+                                return_events=True, save_data=False,
+                                djia_close=djia_close,
+                                offset_unit='sessions')[0]
+    assert events.offset_unit == 'sessions'
+    assert events.close.shape == (15, 1429)
+    assert events.to_wide().columns[0] == 'sessions_frm_peak'
+    assert np.all(events.close_dv_pk[:, 168] == 1.0)
+    # Only the sessions after the end of the series are missing
+    assert np.all(events.valid[:-1])
+    dates = djia_close['Date'].to_numpy().astype('datetime64[D]')
+    peak_row = np.searchsorted(dates, np.datetime64(events.peak_dates[-1]))
+    n_valid = events.valid[-1].sum()
+    assert n_valid == len(dates) - peak_row + 168
+    assert np.array_equal(
+        events.date_days[-1, :n_valid],
+        dates[peak_row - 168:].astype(np.int64).astype(np.int32))
@@ -0,0 +1,65 @@
+'''
+Tests of djia_analogs.py module
+'''
+
+import numpy as np
+import pytest
+from numpy.lib.stride_tricks import sliding_window_view
+import djia_analogs
+import djia_npp_bokeh as djia
+
+
+# Test that the blocked FFT sliding dot products and the window scores equal
+# their direct computation over every window
+@pytest.mark.parametrize('block_len', [16, 65536])
+def test_window_scores(block_len):
+    rng = np.random.default_rng(0)
+    log_arr = np.cumsum(rng.normal(0, 0.01, 3000))
+    path_arr = np.cumsum(rng.normal(0, 0.01, 50))
+    path_arr -= path_arr[0]
+    windows = sliding_window_view(log_arr, 50)
+    assert np.allclose(
+        djia_analogs.sliding_dot(log_arr, path_arr, block_len),
+        windows @ path_arr)
+    rmse, corr = djia_analogs.window_scores(log_arr, path_arr)
+    norm_windows = windows - windows[:, :1]
+    assert np.allclose(
+        rmse, np.sqrt(((norm_windows - path_arr) ** 2).mean(axis=1)))
+    assert np.allclose(corr[::37], [np.corrcoef(w, path_arr)[0, 1]
+                                    for w in windows[::37]])
+
+
+# Test that the analogs of the 2020 path end before its peak and do not
+# overlap, and that djia_npp() plots them before the current event
+def test_find_analogs():
+    djia_close = djia.load_djia_close('2022-03-03', False)[0]
+    analog_df = djia_analogs.find_analogs(djia_close, '2020-02-12', 5)
+    n_path = (djia_close['Date'] >= '2020-02-12').sum()
+    peak_row = len(djia_close) - n_path
+    rows = analog_df['start_row'].to_numpy()
+    assert len(rows) == 5 and np.all(rows + n_path <= peak_row)
+    assert np.all(np.diff(analog_df['rmse']) >= 0)
+    assert np.abs(rows[:, np.newaxis] - rows).min(initial=n_path,
+                                                  where=~np.eye(5, dtype=bool)
+                                                  ) >= n_path
+    fig, end_date_str = djia.djia_npp(
+        djia_end_date='2022-03-03', download_from_internet=False,
+        html_show=False, n_analogs=3)
+    labels = [item.label['value'] for item in fig.legend[0].items]
+    assert len(labels) == 18
+    assert labels[14].startswith('Analog') and '(RMSE=' in labels[14]
+    assert labels[-1] == 'Feb 2020 - Apr 2020'
+
+
+# Test that the analog labels show the score of the ranking metric
+@pytest.mark.parametrize('metric,label_start', [('rmse', ' (RMSE='),
+                                                ('corr', ' (r=')])
+def test_analog_labels(metric, label_start):
+    djia_close = djia.load_djia_close('2022-03-03', False)[0]
+    analog_df = djia_analogs.find_analogs(djia_close, '2020-02-12', 2,
+                                          metric)
+    label_lst = djia_analogs.analog_events(djia_close, analog_df, 243, 1821,
+                                           metric=metric)[1]
+    for label, score in zip(label_lst, analog_df[metric]):
+        assert label_start in label
+        assert np.isclose(float(label.split('=')[1][:-1]), score, atol=0.01)
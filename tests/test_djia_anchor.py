@@ -0,0 +1,73 @@
+'''
+Tests of djia_anchor.py module
+'''
+
+import numpy as np
+import pytest
+import djia_anchor
+import djia_npp_bokeh as djia
+from djia_data import get_djia_data
+
+
+# Test the anchor table of the recessions and of an event without an NBER
+# start month
+def test_anchor_offsets():
+    events = get_djia_data(1821, 243, '2022-03-03', False,
+                           return_events=True, save_data=False)[0]
+    anchor_df = djia_anchor.anchor_offsets(
+        events, ['Feb 1945'] * (events.n_events - 2) + [None, 'Feb 2020'])
+    assert list(anchor_df.columns) == ['peak', 'trough', 'nber', 'peak_ms']
+    assert np.all(anchor_df['peak'] == 0)
+    # 2020 trough on 2020-03-23, first trading day of Feb 2020 on 2020-02-03
+    assert anchor_df['trough'].iloc[-1] == 40
+    assert anchor_df['nber'].iloc[-1] == -9
+    assert anchor_df['nber'].iloc[-2] == 0
+    trough_pos = np.searchsorted(events.days_frm_peak, anchor_df['trough'])
+    trough_vals = events.close[np.arange(events.n_events), trough_pos]
+    after = events.days_frm_peak >= 0
+    assert np.allclose(trough_vals, np.nanmin(events.close[:, after],
+                                              axis=1))
+
+
+# Test that djia_npp() adds the raw offsets from peak to the event data
+# sources, and that the re-anchoring needs the data inline
+@pytest.mark.parametrize('render_mode', ['lines', 'multi_line'])
+def test_reanchor(render_mode):
+    fig, end_date_str = djia.djia_npp(
+        djia_end_date='2022-03-03', download_from_internet=False,
+        html_show=False, render_mode=render_mode, reanchor=True)
+    sources = [r.data_source for r in fig.renderers
+               if 'peak_offset' in r.data_source.data]
+    if render_mode == 'multi_line':
+        assert len(sources) == 1
+        data = sources[0].data
+        assert np.array_equal(data['peak_offset'][-1], data['xs'][-1])
+        assert np.allclose(data['close'][-1] / data['peak_val'][-1],
+                           data['ys'][-1])
+    else:
+        assert len(sources) == 15
+        assert np.array_equal(sources[-1].data['peak_offset'],
+                              sources[-1].data['days_frm_peak'])
+    with pytest.raises(ValueError):
+        djia.djia_npp(djia_end_date='2022-03-03',
+                      download_from_internet=False, html_show=False,
+                      reanchor=True, data_mode='sidecar')
+
+
+# Test that the anchor table is of the full-resolution events with LOD
+# downsampling, whose troughs outside the main window may be dropped
+def test_reanchor_lod(monkeypatch):
+    anchor_df_lst = []
+    add_anchor_control = djia_anchor.add_anchor_control
+
+    def capture(fig, events, anchor_df, series_label='DJIA'):
+        anchor_df_lst.append(anchor_df)
+        return add_anchor_control(fig, events, anchor_df, series_label)
+
+    monkeypatch.setattr(djia_anchor, 'add_anchor_control', capture)
+    for lod_factor in (None, 10):
+        djia.djia_npp(djia_end_date='2022-03-03',
+                      download_from_internet=False, html_show=False,
+                      frwd_mths_main=12, reanchor=True,
+                      lod_factor=lod_factor)
+    assert anchor_df_lst[0].equals(anchor_df_lst[1])
@@ -0,0 +1,27 @@
+'''
+Tests of djia_backfill.py module
+'''
+
+import os
+import pytest
+import djia_backfill
+
+
+# Test that the backfill writes one snapshot per trading day with a pool
+def test_backfill_npp(tmp_path):
+    filename_lst = djia_backfill.backfill_npp(
+        '2022-02-26', '2022-03-03', download_from_internet=False,
+        render_mode='multi_line', n_procs=2,
+        image_dir=str(tmp_path))
+    assert [os.path.basename(f) for f in filename_lst] == \
+        ['djia_npp_2022-02-28.html', 'djia_npp_2022-03-01.html',
+         'djia_npp_2022-03-02.html', 'djia_npp_2022-03-03.html']
+    assert all(os.path.getsize(f) > 0 for f in filename_lst)
+
+
+# Test that a start date before the last peak date range raises ValueError
+def test_backfill_npp_early_start(tmp_path):
+    with pytest.raises(ValueError):
+        djia_backfill.backfill_npp('2020-03-01', '2022-03-03',
+                                   download_from_internet=False, n_procs=1,
+                                   image_dir=str(tmp_path))
@@ -0,0 +1,83 @@
+'''
+Tests of djia_bands.py module
+'''
+
+import warnings
+import datetime as dt
+import numpy as np
+import pytest
+import djia_bands
+import djia_npp_bokeh as djia
+
+
+# Test that the one-sort quantiles equal np.nanpercentile()
+def test_nan_quantiles():
+    rng = np.random.default_rng(0)
+    values = rng.random((200, 50))
+    values[rng.random(values.shape) < 0.4] = np.nan
+    values[:, 3] = np.nan
+    values[1:, 4] = np.nan
+    percentiles = (0, 10, 25, 50, 75, 90, 100)
+    quant_mat, n_valid = djia_bands.nan_quantiles(values, percentiles)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        expected = np.nanpercentile(values, percentiles, axis=0)
+    assert np.allclose(quant_mat, expected, equal_nan=True)
+    assert n_valid[3] == 0 and n_valid[4] == 1
+
+
+# Test the bands of the aligned recessions and the figure overlay
+def test_event_bands():
+    events = djia.get_djia_data(1821, 243, '2022-03-03', False,
+                                return_events=True, save_data=False)[0]
+    band_df = djia_bands.event_bands(events, (10, 50, 90), min_events=3)
+    assert np.allclose(band_df['min'], np.nanmin(events.close_dv_pk, axis=0),
+                       equal_nan=True)
+    assert np.all(band_df.loc[band_df['n_events'] < 3, 'p50'].isna())
+    assert np.all(band_df['p10'] <= band_df['p50'])
+    assert band_df.loc[243, 'p50'] == 1.0
+    fig = djia.make_npp_figure(events, ['rec'] * 15,
+                               dt.datetime(2022, 3, 3), bands=(10, 50, 90))
+    labels = [item.label['value'] for item in fig.legend[0].items]
+    assert labels[:2] == ['10-90 pctile', 'Median']
+
+
+# Test that bands without a pair of percentiles to shade are rejected
+@pytest.mark.parametrize('bands', [(), (50,), (10, 50, 110)])
+def test_check_bands(bands):
+    with pytest.raises(ValueError):
+        djia_bands.check_bands(bands)
+    with pytest.raises(ValueError):
+        djia.djia_npp(djia_end_date='2022-03-03',
+                      download_from_internet=False, html_show=False,
+                      bands=bands)
+
+
+# Test that the bands are of the recessions only when analogs are plotted
+def test_bands_without_analogs():
+    events = djia.get_djia_data(1821, 243, '2022-03-03', False,
+                                return_events=True, save_data=False)[0]
+    fig, end_date_str = djia.djia_npp(
+        djia_end_date='2022-03-03', download_from_internet=False,
+        html_show=False, bands=(25, 50, 75), n_analogs=3)
+    band_data = [r.data_source.data for r in fig.renderers
+                 if 'n_events' in r.data_source.data][0]
+    rec_df = djia_bands.event_bands(events, (25, 50, 75)).dropna(
+        subset=['p25'])
+    assert np.array_equal(band_data['n_events'], rec_df['n_events'])
+    assert np.allclose(band_data['p50'], rec_df['p50'])
+
+
+# Test that the bands and the plot range are those of the full-resolution
+# events with LOD downsampling
+def test_bands_with_lod():
+    figs = [djia.djia_npp(djia_end_date='2022-03-03',
+                          download_from_internet=False, html_show=False,
+                          bands=(10, 50, 90), lod_factor=lod_factor)[0]
+            for lod_factor in (None, 10)]
+    band_data = [[r.data_source.data for r in fig.renderers
+                  if 'n_events' in r.data_source.data][0] for fig in figs]
+    for col in ['days_frm_peak', 'n_events', 'p10', 'p50', 'p90']:
+        assert np.array_equal(band_data[0][col], band_data[1][col])
+    assert figs[0].y_range.start == figs[1].y_range.start
+    assert figs[0].y_range.end == figs[1].y_range.end
@@ -0,0 +1,44 @@
+'''
+Tests of djia_batch.py module
+'''
+
+import os
+import pandas as pd
+import djia_batch
+import djia_store
+
+CUR_PATH = os.path.split(os.path.abspath(__file__))[0]
+DJIA_CSV = os.path.join(CUR_PATH, '..', 'data', 'djia_close_2022-03-03.csv')
+
+
+# Test the names of the series of a batch
+def test_parse_symbols():
+    assert djia_batch.parse_symbols(['djia=^DJI', '^SPX']) == \
+        [('djia', '^DJI'), ('spx', '^SPX')]
+    assert djia_batch.parse_symbols({'djia': '^DJI'}) == [('djia', '^DJI')]
+
+
+# Test a batch with a shorter series and a symbol the reader does not serve
+def test_batch_npp(tmp_path):
+    djia_close = pd.read_csv(DJIA_CSV, parse_dates=['Date'])
+    spx_csv = str(tmp_path / 'spx.csv')
+    spx_close = djia_close[djia_close['Date'] >= '1985-01-01'].copy()
+    spx_close['Close'] = spx_close['Close'] / 8.0
+    spx_close.to_csv(spx_csv, index=False)
+    reader = djia_store.csv_reader({'^DJI': DJIA_CSV, '^SPX': spx_csv})
+    data_dir = str(tmp_path / 'data')
+    image_dir = str(tmp_path / 'images')
+    filename_dict, failed = djia_batch.batch_npp(
+        ['djia=^DJI', 'spx=^SPX', 'bad=^BAD'], '2022-03-03', reader=reader,
+        render_mode='multi_line', n_procs=2, image_dir=image_dir,
+        data_dir=data_dir)
+    assert sorted(filename_dict) == ['djia', 'spx']
+    assert list(failed) == ['bad']
+    assert os.path.basename(filename_dict['spx']) == \
+        'spx_npp_2022-03-03.html'
+    spx_pk = pd.read_csv(os.path.join(data_dir,
+                                      'spx_close_pk_2022-03-03.csv'))
+    assert spx_pk.filter(like='close_dv_pk').shape[1] == 4
+    djia_pk = pd.read_csv(os.path.join(data_dir,
+                                       'djia_close_pk_2022-03-03.csv'))
+    assert djia_pk.filter(like='close_dv_pk').shape[1] == 15
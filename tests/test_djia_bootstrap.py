@@ -0,0 +1,70 @@
+'''
+Tests of djia_bootstrap.py module
+'''
+
+import numpy as np
+import pytest
+import djia_bootstrap
+import djia_npp_bokeh as djia
+from djia_data import get_djia_data
+
+
+@pytest.fixture(scope='module')
+def events():
+    return get_djia_data(1821, 243, '2022-03-03', False,
+                         return_events=True, save_data=False)[0]
+
+
+# Test that the histogram quantiles are within one bin of the exact
+# percentiles of the same values
+def test_hist_quantiles():
+    rng = np.random.default_rng(0)
+    values = rng.normal(0.0, [[0.1], [0.5]], (2, 20000))
+    width = ((djia_bootstrap.HIST_HI - djia_bootstrap.HIST_LO) /
+             djia_bootstrap.HIST_BINS)
+    bins = ((values - djia_bootstrap.HIST_LO) / width).astype(np.int64)
+    hist = np.array([np.bincount(b, minlength=djia_bootstrap.HIST_BINS)
+                     for b in bins])
+    quant_mat = djia_bootstrap.hist_quantiles(hist, (5, 50, 95))
+    assert np.allclose(quant_mat, np.percentile(values, (5, 50, 95),
+                                                axis=1), atol=width)
+
+
+# Test that paths of constant returns grow by one return per session
+def test_simulate_chunk():
+    ret_mat = np.full((3, 100), 0.01)
+    ret_mat[1, 60:] = np.nan
+    hist = djia_bootstrap.simulate_chunk(ret_mat, 10, 50, 500, 7, 5,
+                                         np.random.SeedSequence(1))
+    assert np.all(hist.sum(axis=1) == 500)
+    quant_mat = djia_bootstrap.hist_quantiles(hist, (0.1, 99.9))
+    assert np.allclose(quant_mat, 0.01 * np.arange(1, 51), atol=0.002)
+
+
+# Test that the cones of the current recession start at its last value,
+# are ordered, and do not depend on the number of processes
+def test_forward_cones(events):
+    cone_df = djia_bootstrap.forward_cones(events, 4000, chunk_size=1500,
+                                           n_procs=1, seed=3)
+    cone_df2 = djia_bootstrap.forward_cones(events, 4000, chunk_size=1500,
+                                            n_procs=2, seed=3)
+    assert cone_df.equals(cone_df2)
+    last = np.flatnonzero(events.valid[-1])[-1]
+    assert cone_df['days_frm_peak'].iloc[0] == events.days_frm_peak[last]
+    assert cone_df['days_frm_peak'].iloc[-1] <= events.days_frm_peak[-1]
+    assert np.all(np.diff(cone_df['days_frm_peak']) > 0)
+    assert np.allclose(cone_df.iloc[0, 1:], events.close_dv_pk[-1, last])
+    pct_mat = cone_df[['p5', 'p25', 'p50', 'p75', 'p95']].to_numpy()
+    assert np.all(np.diff(pct_mat, axis=1) >= 0)
+    assert pct_mat[-1, 4] - pct_mat[-1, 0] > pct_mat[1, 4] - pct_mat[1, 0]
+
+
+# Test that djia_npp() draws the cones after the event lines
+def test_npp_cones():
+    fig, end_date_str = djia.djia_npp(
+        djia_end_date='2022-03-03', download_from_internet=False,
+        html_show=False, cone_paths=2000)
+    labels = [item.label['value'] for item in fig.legend[0].items]
+    assert labels[-3:] == ['Paths 5-95 pctile', 'Paths 25-75 pctile',
+                           'Paths median']
+    assert labels[-4] == 'Feb 2020 - Apr 2020'
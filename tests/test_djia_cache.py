@@ -0,0 +1,101 @@
+'''
+Tests of djia_cache.py module
+'''
+
+import os
+import shutil
+import numpy as np
+import djia_cache
+import djia_npp_bokeh as djia
+
+CUR_PATH = os.path.split(os.path.abspath(__file__))[0]
+DATA_DIR = os.path.join(CUR_PATH, '..', 'data')
+
+
+# Test that repeated and smaller windows are cache hits with the same result
+# as a direct alignment
+def test_cache_hits_and_slicing(tmp_path):
+    cache = djia_cache.AlignCache(cache_dir=str(tmp_path))
+    events = djia.get_djia_data(1821, 243, '2022-03-03',
+                                download_from_internet=False,
+                                return_events=True, cache=cache,
+                                save_data=False)[0]
+    assert (cache.hits, cache.misses) == (0, 1)
+    djia.get_djia_data(1821, 243, '2022-03-03', download_from_internet=False,
+                       return_events=True, cache=cache, save_data=False)
+    events_small = djia.get_djia_data(365, 122, '2022-03-03',
+                                      download_from_internet=False,
+                                      return_events=True, cache=cache,
+                                      save_data=False)[0]
+    assert (cache.hits, cache.misses) == (2, 1)
+    events_direct = djia.get_djia_data(365, 122, '2022-03-03',
+                                       download_from_internet=False,
+                                       return_events=True,
+                                       save_data=False)[0]
+    assert events_small.to_wide().equals(events_direct.to_wide())
+    assert events.close.shape[1] == 2065
+
+    # A new process-level cache is answered from the on-disk tier
+    cache2 = djia_cache.AlignCache(cache_dir=str(tmp_path))
+    events_disk = djia.get_djia_data(365, 122, '2022-03-03',
+                                     download_from_internet=False,
+                                     return_events=True, cache=cache2,
+                                     save_data=False)[0]
+    assert cache2.hits == 1
+    assert np.array_equal(events_disk.close, events_direct.close,
+                          equal_nan=True)
+
+
+# Test that the in-process and on-disk tiers evict to their limits
+def test_cache_eviction(tmp_path):
+    events = djia.get_djia_data(30, 30, '2022-03-03',
+                                download_from_internet=False,
+                                return_events=True, save_data=False)[0]
+    cache = djia_cache.AlignCache(max_entries=2, cache_dir=str(tmp_path),
+                                  max_bytes=1)
+    for i in range(3):
+        cache.put('hash' + str(i), 30, 30, events)
+    assert len(cache._mem) == 2
+    assert cache.get('hash0', 30, 30) is None
+    assert len(os.listdir(str(tmp_path))) == 0
+
+
+# Test that trading-session events have their own key and keep their offset
+# unit through the on-disk tier
+def test_cache_offset_unit(tmp_path):
+    djia.get_djia_data(252, 84, '2022-03-03', download_from_internet=False,
+                       return_events=True, save_data=False,
+                       cache=djia_cache.AlignCache(cache_dir=str(tmp_path)),
+                       offset_unit='sessions')
+    cache = djia_cache.AlignCache(cache_dir=str(tmp_path))
+    events = djia.get_djia_data(252, 84, '2022-03-03',
+                                download_from_internet=False,
+                                return_events=True, save_data=False,
+                                cache=cache, offset_unit='sessions')[0]
+    assert (cache.hits, cache.misses) == (1, 0)
+    assert events.offset_unit == 'sessions'
+    events_days = djia.get_djia_data(252, 84, '2022-03-03',
+                                     download_from_internet=False,
+                                     return_events=True, save_data=False,
+                                     cache=cache)[0]
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert events_days.offset_unit == 'days'
+
+
+# Test that a cache hit does not rewrite the aligned output file
+def test_cache_hit_skips_write(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    shutil.copy(os.path.join(DATA_DIR, 'djia_close_2022-03-03.csv'),
+                str(data_dir))
+    cache = djia_cache.AlignCache(cache_dir=str(tmp_path / 'cache'))
+    out_path = str(data_dir / 'djia_close_pk_2022-03-03.csv')
+    djia.get_djia_data(1821, 243, '2022-03-03', download_from_internet=False,
+                       return_events=True, cache=cache,
+                       data_dir=str(data_dir))
+    mtime = os.stat(out_path).st_mtime_ns
+    djia.get_djia_data(1821, 243, '2022-03-03', download_from_internet=False,
+                       return_events=True, cache=cache,
+                       data_dir=str(data_dir))
+    assert cache.hits == 1
+    assert os.stat(out_path).st_mtime_ns == mtime
@@ -0,0 +1,44 @@
+'''
+Tests of djia_columnar.py module
+'''
+
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import djia_columnar
+import djia_npp_bokeh as djia
+
+CUR_PATH = os.path.split(os.path.abspath(__file__))[0]
+CSV_PATH = os.path.join(CUR_PATH, '..', 'data', 'djia_close_2022-03-03.csv')
+
+
+# Test that dates (including NaT) and values survive a round trip
+def test_columnar_round_trip(tmp_path):
+    df = pd.DataFrame({'days_frm_peak': np.arange(-1, 2),
+                       'Date0': pd.to_datetime(['2020-02-11', None,
+                                                '2020-02-13']),
+                       'Close0': [1.5, np.nan, 2.5]})
+    col_path = djia_columnar.columnar_path(str(tmp_path), 'df')
+    n_bytes = djia_columnar.write_columnar(df, col_path)
+    assert n_bytes > 0
+    assert np.load(os.path.join(col_path, '1.npy')).dtype == np.int64
+    pd.testing.assert_frame_equal(djia_columnar.read_columnar(col_path), df)
+
+
+# Test that the npy storage format gives the same data as the csv format
+def test_get_djia_data_npy(tmp_path):
+    shutil.copy(CSV_PATH, str(tmp_path))
+    out_csv = djia.get_djia_data(1821, 243, '2022-03-03',
+                                 download_from_internet=False,
+                                 data_dir=str(tmp_path))
+    for _ in range(2):
+        # The first call creates the columnar copy, the second reads it
+        out_npy = djia.get_djia_data(1821, 243, '2022-03-03',
+                                     download_from_internet=False,
+                                     data_dir=str(tmp_path),
+                                     storage_format='npy')
+        pd.testing.assert_frame_equal(out_npy[0], out_csv[0])
+    pd.testing.assert_frame_equal(
+        djia_columnar.read_columnar(djia_columnar.columnar_path(
+            str(tmp_path), 'djia_close_pk_2022-03-03')), out_csv[0])
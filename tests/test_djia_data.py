@@ -0,0 +1,40 @@
+'''
+Tests of djia_data.py module
+'''
+
+import os
+import shutil
+import subprocess
+import sys
+import pandas as pd
+import djia_data
+
+CUR_PATH = os.path.split(os.path.abspath(__file__))[0]
+DATA_DIR = os.path.join(CUR_PATH, '..', 'data')
+
+
+# Test that the offline data path loads neither Bokeh nor pandas_datareader
+def test_offline_path_skips_heavy_imports():
+    code = ('import sys, djia_data\n'
+            "djia_data.get_djia_data(1821, 243, '2022-03-03', False, "
+            'save_data=False)\n'
+            "print(sorted({m.split('.')[0] for m in sys.modules} & "
+            "{'bokeh', 'pandas_datareader'}))\n")
+    out = subprocess.run([sys.executable, '-c', code],
+                         cwd=os.path.join(CUR_PATH, '..'),
+                         capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == '[]'
+
+
+# Test that the command line interface writes the aligned csv file
+def test_main_offline(tmp_path):
+    shutil.copy(os.path.join(DATA_DIR, 'djia_close_2022-03-03.csv'),
+                str(tmp_path))
+    end_date_str = djia_data.main(['2022-03-03', '--offline', '--data-dir',
+                                   str(tmp_path)])
+    assert end_date_str == '2022-03-03'
+    djia_close_pk = pd.read_csv(
+        str(tmp_path / 'djia_close_pk_2022-03-03.csv'))
+    expected = pd.read_csv(os.path.join(DATA_DIR,
+                                        'djia_close_pk_2022-03-03.csv'))
+    pd.testing.assert_frame_equal(djia_close_pk, expected)
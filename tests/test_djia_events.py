@@ -0,0 +1,45 @@
+'''
+Tests of djia_events.py module
+'''
+
+import numpy as np
+import pandas as pd
+import djia_events
+import djia_npp_bokeh as djia
+
+
+# Test that the default event table holds the last 15 recessions
+def test_load_event_table():
+    (rec_label_yr_lst, rec_label_yrmth_lst, rec_beg_yrmth_lst,
+        maxdate_rng_lst) = djia_events.load_event_table()
+    assert len(rec_label_yr_lst) == len(maxdate_rng_lst) == 15
+    assert rec_label_yrmth_lst[0] == 'Aug 1929 - Mar 1933'
+    assert rec_beg_yrmth_lst[-1] == 'Feb 2020'
+    assert maxdate_rng_lst[-1] == ('2020-2-1', '2020-3-15')
+
+
+# Test the peaks, troughs, and labels of detected drawdowns
+def test_detect_drawdowns():
+    djia_close = pd.DataFrame(
+        {'Date': pd.date_range('2019-11-01', periods=9, freq='MS'),
+         'Close': [1.0, 2.0, 1.5, 1.9, 2.5, 2.0, 1.8, 2.6, 2.4]})
+    (rec_label_yr_lst, rec_label_yrmth_lst, rec_beg_yrmth_lst,
+        maxdate_rng_lst) = djia_events.detect_drawdowns(djia_close, 0.2)
+    assert rec_label_yr_lst == ['2019-2020', '2020']
+    assert rec_label_yrmth_lst == ['Dec 2019 - Jan 2020',
+                                   'Mar 2020 - May 2020']
+    assert rec_beg_yrmth_lst == ['Dec 2019', 'Mar 2020']
+    assert maxdate_rng_lst == [('2019-12-01', '2019-12-01'),
+                               ('2020-03-01', '2020-03-01')]
+
+
+# Test that get_djia_data() aligns the detected drawdowns at their peaks
+def test_get_djia_data_drawdowns():
+    djia_close = djia.load_djia_close('2022-03-03', False)[0]
+    maxdate_rng_lst = djia_events.detect_drawdowns(djia_close, 0.2)[3]
+    events, end_date_str, peak_vals, peak_dates = djia.get_djia_data(
+        1821, 243, '2022-03-03', False, return_events=True, save_data=False,
+        djia_close=djia_close, drawdown_threshold=0.2)[:4]
+    assert events.n_events == len(maxdate_rng_lst) > 15
+    assert peak_dates == [rng[0] for rng in maxdate_rng_lst]
+    assert np.all(events.close_dv_pk[:, 243] == 1.0)
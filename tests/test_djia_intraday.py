@@ -0,0 +1,87 @@
+'''
+Tests of djia_intraday.py module
+'''
+
+import numpy as np
+import pandas as pd
+import pytest
+import djia_align
+import djia_intraday
+import djia_npp_bokeh as djia
+
+
+def write_minute_file(file_path, start_date, end_date):
+    '''
+    This function writes a synthetic Stooq-like file of one-minute bars of
+    the 390 minutes of each weekday session between two dates.
+    '''
+    days = pd.bdate_range(start_date, end_date)
+    mins = pd.timedelta_range('09:30:00', periods=390, freq='1min')
+    times = pd.DatetimeIndex((days.values[:, np.newaxis] +
+                              mins.values[np.newaxis, :]).ravel())
+    rng = np.random.default_rng(0)
+    close = np.round(25000 * np.exp(np.cumsum(
+        rng.normal(0, 0.0005, len(times)))), 2)
+    minute_df = pd.DataFrame({'Date': times.strftime('%Y-%m-%d'),
+                              'Time': times.strftime('%H:%M:%S'),
+                              'Open': close - 1.0, 'High': close + 2.0,
+                              'Low': close - 3.0, 'Close': close})
+    minute_df.to_csv(file_path, index=False)
+
+    return minute_df
+
+
+# Test that overlapping event windows are merged into one interval
+def test_event_windows():
+    win_lo, win_hi = djia_intraday.event_windows(
+        [('2020-01-01', '2020-01-10'), ('2020-02-01', '2020-02-01'),
+         ('2021-01-01', '2021-01-01')], 0, 1)
+    assert pd.to_datetime(win_lo).strftime('%Y-%m-%d').tolist() == \
+        ['2019-12-22', '2020-12-22']
+    assert pd.to_datetime(win_hi).strftime('%Y-%m-%d').tolist() == \
+        ['2020-03-13', '2021-02-11']
+
+
+# Test that the streamed bars equal the bars of the whole windowed file for
+# any chunk size, including chunks that split a bar
+@pytest.mark.parametrize('bar_size', ['1D', '1H', '5min'])
+def test_read_intraday(tmp_path, bar_size):
+    file_path = str(tmp_path / 'minutes.csv')
+    minute_df = write_minute_file(file_path, '2019-12-02', '2020-02-28')
+    windows = djia_intraday.event_windows([('2020-01-15', '2020-01-15')],
+                                          0, 1)
+    times = pd.to_datetime(minute_df['Date'] + ' ' + minute_df['Time'])
+    minute_df.index = times
+    in_win = ((times.values.astype(np.int64) >= windows[0][0]) &
+              (times.values.astype(np.int64) < windows[1][0]))
+    bars_exp = (minute_df[in_win][['Open', 'High', 'Low', 'Close']]
+                .resample(bar_size).agg({'Open': 'first', 'High': 'max',
+                                         'Low': 'min', 'Close': 'last'})
+                .dropna())
+    for chunksize in [len(minute_df), 997]:
+        bar_df = djia_intraday.read_intraday(
+            file_path, windows, bar_size, 'ohlc', chunksize=chunksize)
+        assert np.array_equal(bar_df['Date'].values, bars_exp.index.values)
+        assert np.array_equal(bar_df[['Open', 'High', 'Low', 'Close']].values,
+                              bars_exp.values)
+    bar_df = djia_intraday.read_intraday(file_path, windows, bar_size,
+                                         chunksize=997)
+    assert bar_df.columns.tolist() == ['Date', 'Close']
+
+
+# Test that intraday bars of the 2020 recession are aligned by bars from peak
+def test_intraday_alignment(tmp_path):
+    file_path = str(tmp_path / 'minutes.csv')
+    write_minute_file(file_path, '2019-12-02', '2020-04-30')
+    maxdate_rng_lst = djia.load_event_table()[3]
+    with pytest.raises(ValueError):
+        djia_intraday.load_intraday_close(file_path, maxdate_rng_lst, 1, 1,
+                                          '1H')
+    bar_df = djia_intraday.load_intraday_close(
+        file_path, maxdate_rng_lst, 1, 1, '30min', 'bars')
+    events = djia.get_djia_data(
+        13 * 21, 13 * 21, '2020-04-30', return_events=True, save_data=False,
+        djia_close=bar_df, offset_unit='bars')[0]
+    assert events.n_events == 1
+    assert djia_align.offsets_per_year(events) == 252 * 13
+    assert events.close_dv_pk[0, 13 * 21] == 1.0
@@ -0,0 +1,51 @@
+'''
+Tests of djia_lod.py module
+'''
+
+import json
+import logging
+import numpy as np
+from bokeh.embed import json_item
+import djia_lod
+import djia_npp_bokeh as djia
+
+
+# Test that LTTB keeps the endpoints and an extreme spike
+def test_lttb_indices():
+    x = np.arange(100, dtype=float)
+    y = np.zeros(100)
+    y[37] = 5.0
+    idx = djia_lod.lttb_indices(x, y, 10)
+    assert len(idx) == 10
+    assert idx[0] == 0 and idx[-1] == 99
+    assert 37 in idx
+    assert np.all(np.diff(idx) > 0)
+    assert len(djia_lod.lttb_indices(x, y, 200)) == 100
+
+
+# Test that downsampling keeps the main window at full resolution
+def test_downsample_events():
+    events = djia.get_djia_data(1821, 243, '2022-03-03',
+                                download_from_internet=False,
+                                return_events=True, save_data=False)[0]
+    events_lod = djia_lod.downsample_events(events, -122, 365, 5)
+    main_cols = ((events.days_frm_peak >= -122) &
+                 (events.days_frm_peak <= 365))
+    assert np.array_equal(events_lod.valid[:, main_cols],
+                          events.valid[:, main_cols])
+    n_out = events.valid[:, ~main_cols].sum()
+    n_out_lod = events_lod.valid[:, ~main_cols].sum()
+    assert n_out_lod < 0.25 * n_out
+    assert np.all(np.isnan(events_lod.close[~events_lod.valid]))
+
+
+# Test that the size report of djia_npp() with LOD downsampling measures the
+# saved layout, with the re-anchoring controls and columns
+def test_lod_size_report(caplog):
+    with caplog.at_level(logging.INFO, logger='djia_npp'):
+        fig, end_date_str = djia.djia_npp(
+            djia_end_date='2022-03-03', download_from_internet=False,
+            html_show=False, lod_factor=5, reanchor=True)
+    record = [rec for rec in caplog.records
+              if rec.msg.startswith('Figure has')][0]
+    assert record.args[1] > len(json.dumps(json_item(fig)))
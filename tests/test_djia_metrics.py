@@ -0,0 +1,43 @@
+'''
+Tests of djia_metrics.py module
+'''
+
+import logging
+import djia_metrics
+import djia_npp_bokeh as djia
+
+
+# Test that a stage records its time, memory, and counts and logs the record
+def test_stage_record(caplog):
+    metrics = djia_metrics.StageMetrics(track_memory=True)
+    with caplog.at_level(logging.INFO, logger='djia_npp.metrics'):
+        with metrics.stage('parse', n_bytes=10) as record:
+            buf = [0.0] * 100000
+            record['n_rows'] = len(buf)
+    record = metrics.records[0]
+    assert record['stage'] == 'parse'
+    assert record['n_rows'] == 100000 and record['n_bytes'] == 10
+    assert record['seconds'] >= 0.0
+    assert record['alloc_peak_bytes'] >= 800000
+    assert caplog.records[0].djia_metrics is record
+    assert metrics.to_dict()['parse'] is record
+
+
+# Test that disabled metrics keep no records
+def test_null_metrics():
+    metrics = djia_metrics.get_metrics(None)
+    with metrics.stage('parse') as record:
+        record['n_rows'] = 1
+    assert metrics.records == []
+
+
+# Test that get_djia_data() reports its stages with row counts
+def test_get_djia_data_stages():
+    metrics = djia_metrics.StageMetrics()
+    djia.get_djia_data(1821, 243, '2022-03-03', download_from_internet=False,
+                       return_events=True, save_data=False, metrics=metrics)
+    stages = metrics.to_dict()
+    assert [r['stage'] for r in metrics.records] == \
+        ['parse', 'peak_search', 'alignment']
+    assert stages['parse']['n_rows'] == stages['peak_search']['n_rows'] > 0
+    assert stages['alignment']['n_bytes'] > 0
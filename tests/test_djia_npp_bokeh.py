@@ -10,11 +10,17 @@ Three main tests:
 '''
 
 import pytest
+import numpy as np
 import datetime as dt
-# import os
+import json
+import shutil
+import subprocess
+import sys
+import os
 # import pathlib
 # import runpy
 import djia_npp_bokeh as djia
+from djia_lod import downsample_events
 
 
 # Create function to validate datetime text
@@ -66,3 +72,129 @@ def test_html_fig(frwd_mths_main, bkwd_mths_main, frwd_mths_max, bkwd_mths_max,
     # assert html file exists
     # assert djia series csv file exists
     # assert djia ColumnDataSource source DataFrame csv file exists
+
+
+# Test that the multi_line render mode draws all recessions with a single
+# MultiLine glyph over one shared data source
+def test_multi_line_mode():
+    fig, end_date_str = djia.djia_npp(
+        djia_end_date='2022-03-03', download_from_internet=False,
+        html_show=False, render_mode='multi_line')
+    multi_lines = [r for r in fig.renderers
+                   if type(r.glyph).__name__ == 'MultiLine']
+    assert len(multi_lines) == 1
+    multi_data = multi_lines[0].data_source.data
+    assert len(multi_data['xs']) == 15
+    assert len(fig.legend[0].items) == 15
+    assert end_date_str == '2022-03-03'
+    assert fig.legend[0].click_policy == 'mute'
+
+
+# Test that a legend click mutes one event of the multi_line glyph through
+# its proxy line, and that tapping a line toggles the same proxy
+def test_multi_line_legend_mute():
+    if shutil.which('node') is None:
+        pytest.skip('node is not installed')
+    fig, end_date_str = djia.djia_npp(
+        djia_end_date='2022-03-03', download_from_internet=False,
+        html_show=False, render_mode='multi_line')
+    multi_cds = [r for r in fig.renderers
+                 if type(r.glyph).__name__ == 'MultiLine'][0].data_source
+    proxies = [item.renderers[0] for item in fig.legend[0].items]
+    assert len(set(proxies)) == 15
+    assert all(len(p.data_source.data['x']) == 0 for p in proxies)
+    mute_code = proxies[3].js_property_callbacks['change:muted'][0].code
+    tap_callback = multi_cds.selected.js_property_callbacks[
+        'change:indices'][0]
+    script = ('''
+        const source = {data: {alpha: Array(15).fill(0.7)},
+                        selected: {indices: []}, change: {emit() {}}}
+        const proxies = Array.from({length: 15}, (_, i) => ({_m: false}))
+        proxies.forEach((proxy, i) => Object.defineProperty(proxy, 'muted', {
+            get() { return this._m },
+            set(v) { this._m = v; mute(source, i, this) }}))
+        function mute(source, i, cb_obj) {''' + mute_code + '''}
+        function tap(source, proxies) {''' + tap_callback.code + '''}
+        proxies[3].muted = true
+        const legend = source.data.alpha.slice()
+        source.selected.indices = [5]
+        tap(source, proxies)
+        source.selected.indices = [3]
+        tap(source, proxies)
+        console.log(JSON.stringify([legend, source.data.alpha,
+                                    proxies.map((p) => p.muted)]))
+    ''')
+    out = subprocess.run(['node', '-e', script], capture_output=True,
+                         text=True, check=True)
+    legend_alpha, tap_alpha, muted = json.loads(out.stdout)
+    assert legend_alpha == [0.15 if i == 3 else 0.7 for i in range(15)]
+    assert tap_alpha == [0.15 if i == 5 else 0.7 for i in range(15)]
+    assert muted == [i == 5 for i in range(15)]
+
+
+# Test that the trading-session mode puts the month ticks at 21 sessions per
+# month and looks up the hover dates of each session
+def test_sessions_mode():
+    events = djia.get_djia_data(1260, 168, '2022-03-03',
+                                download_from_internet=False,
+                                return_events=True, save_data=False,
+                                offset_unit='sessions')[0]
+    fig = djia.make_npp_figure(events, ['label'] * events.n_events,
+                               dt.datetime(2022, 3, 3),
+                               render_mode='multi_line')
+    assert fig.xaxis.ticker.ticks == list(range(-168, 1261, 84))
+    multi_line = [r for r in fig.renderers
+                  if type(r.glyph).__name__ == 'MultiLine'][0]
+    multi_data = multi_line.data_source.data
+    assert multi_data['day_offsets'][0][168] == 0
+    assert np.all(np.diff(multi_data['day_offsets'][0]) > 0)
+
+
+# Test that the hover dates of trading sessions are found by the offsets of
+# the points when LOD downsampling leaves gaps between them
+def test_sessions_lod_hover_date():
+    if shutil.which('node') is None:
+        pytest.skip('node is not installed')
+    events = djia.get_djia_data(1260, 168, '2022-03-03',
+                                download_from_internet=False,
+                                return_events=True, save_data=False,
+                                offset_unit='sessions')[0]
+    events = downsample_events(events, -84, 756, 10)
+    fig = djia.make_npp_figure(events, ['label'] * events.n_events,
+                               dt.datetime(2022, 3, 3),
+                               render_mode='multi_line')
+    multi_line = [r for r in fig.renderers
+                  if type(r.glyph).__name__ == 'MultiLine'][0]
+    multi_data = multi_line.data_source.data
+    i = 0
+    xs = np.asarray(multi_data['xs'][i], dtype=np.int64)
+    assert np.any(np.diff(xs) > 1)
+    peak_day = int(np.datetime64(events.peak_dates[i], 'D').astype(np.int64))
+    cols = np.searchsorted(events.days_frm_peak, xs)
+    expected = (events.date_days[i, cols].astype('datetime64[D]')
+                .astype(str).tolist())
+    script = ('const source = {data: ' + json.dumps(
+        {'xs': [xs.tolist()],
+         'day_offsets': [np.asarray(multi_data['day_offsets'][i])
+                         .tolist()]}) + '}\n' +
+        'function hover(value, special_vars) {' + djia.SESSION_DATE_JS +
+        '}\n' + 'console.log(JSON.stringify(' + json.dumps(xs.tolist()) +
+        '.map((x) => hover(' + str(peak_day * 86400000) +
+        ', {index: 0, data_x: x + 0.3}))))')
+    out = subprocess.run(['node', '-e', script], capture_output=True,
+                         text=True, check=True)
+    assert json.loads(out.stdout) == expected
+
+
+# Test that importing the module loads neither Bokeh nor the modules of the
+# optional features of djia_npp()
+def test_import_skips_feature_modules():
+    code = ('import sys, djia_npp_bokeh\n'
+            "print(sorted({m.split('.')[0] for m in sys.modules} & "
+            "{'bokeh', 'djia_analogs', 'djia_anchor', 'djia_bootstrap', "
+            "'djia_intraday', 'djia_lod', 'djia_sidecar'}))\n")
+    out = subprocess.run([sys.executable, '-c', code],
+                         cwd=os.path.join(os.path.dirname(
+                             os.path.abspath(__file__)), '..'),
+                         capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == '[]'
@@ -0,0 +1,95 @@
+'''
+Tests of djia_server.py module
+'''
+
+import os
+import datetime as dt
+import pandas as pd
+from bokeh.document import Document
+import djia_store
+import djia_server
+import djia_npp_bokeh as djia
+
+CUR_PATH = os.path.split(os.path.abspath(__file__))[0]
+CSV_PATH = os.path.join(CUR_PATH, '..', 'data', 'djia_close_2022-03-03.csv')
+
+
+# Create a stand-in data feed that only serves closes through feed['now']
+def feed_reader(feed):
+    base_reader = djia_store.csv_reader(CSV_PATH)
+
+    def reader(symbol, start_date, end_date):
+        return base_reader(symbol, start_date, min(end_date, feed['now']))
+
+    return reader
+
+
+# Test that new closes are streamed into the most recent recession source
+def test_server_streams_new_closes(tmp_path):
+    feed = {'now': dt.datetime(2022, 2, 25)}
+    state = djia_server.load_npp_state(
+        frwd_mths_max=30, djia_end_date='2022-03-10',
+        reader=feed_reader(feed), data_dir=str(tmp_path))
+    assert state['last_date'] == pd.Timestamp('2022-02-25')
+    doc = Document()
+    update = djia_server.make_npp_doc(doc, state)
+    fig = doc.roots[0]
+    source = fig.select_one({'name': djia.NPP_CURRENT_SOURCE})
+    assert source is fig.legend[0].items[-1].renderers[0].data_source
+    first_source = fig.legend[0].items[0].renderers[0].data_source
+    n_rows = len(source.data['Date'])
+    n_rows_first = len(first_source.data['Date'])
+
+    feed['now'] = dt.datetime(2022, 3, 3)
+    assert djia_server.refresh_npp_state(state, feed['now']) == 4
+    assert update() == 4
+    assert update() == 0
+    assert len(source.data['Date']) == n_rows + 4
+    assert len(first_source.data['Date']) == n_rows_first
+    assert source.data['days_frm_peak'][-1] == (
+        pd.Timestamp('2022-03-03') - state['peak_date']).days
+    assert source.data['index'][-1] - source.data['days_frm_peak'][-1] == (
+        source.data['index'][0] - source.data['days_frm_peak'][0])
+    # The new closes are appended to the local DJIA store
+    meta = djia_store.read_store_meta(str(tmp_path), 'djia_close')
+    assert meta['last_date'] == '2022-03-03'
+
+    # A new session starts from the same state with the streamed closes
+    doc2 = Document()
+    djia_server.make_npp_doc(doc2, state)
+    source2 = doc2.roots[0].select_one({'name': djia.NPP_CURRENT_SOURCE})
+    assert len(source2.data['Date']) == n_rows + 4
+
+
+# Test streaming into a multi_line figure with bands, and into the store of
+# the series named in the state
+def test_server_streams_multi_line(tmp_path):
+    feed = {'now': dt.datetime(2022, 2, 25)}
+    state = djia_server.load_npp_state(
+        frwd_mths_max=30, djia_end_date='2022-03-10',
+        reader=feed_reader(feed), data_dir=str(tmp_path),
+        series_name='index', render_mode='multi_line',
+        bands=(10, 50, 90))
+    doc = Document()
+    update = djia_server.make_npp_doc(doc, state)
+    source = doc.roots[0].select_one({'name': djia.NPP_EVENTS_SOURCE})
+    n_events = len(source.data['xs'])
+    n_points = len(source.data['xs'][-1])
+    n_points_first = len(source.data['xs'][0])
+
+    feed['now'] = dt.datetime(2022, 3, 3)
+    new_close = djia_server.fetch_new_closes(state, feed['now'])
+    assert len(new_close) == 4
+    # Fetching does not change the state that the sessions read
+    assert state['last_date'] == pd.Timestamp('2022-02-25')
+    assert djia_server.add_new_closes(state, new_close) == 4
+    assert djia_server.add_new_closes(state, new_close) == 0
+    assert update() == 4
+    assert len(source.data['xs']) == n_events
+    assert len(source.data['xs'][-1]) == n_points + 4
+    assert len(source.data['ys'][-1]) == n_points + 4
+    assert len(source.data['xs'][0]) == n_points_first
+    assert source.data['xs'][-1][-1] == (
+        pd.Timestamp('2022-03-03') - state['peak_date']).days
+    meta = djia_store.read_store_meta(str(tmp_path), 'index_close')
+    assert meta['last_date'] == '2022-03-03'
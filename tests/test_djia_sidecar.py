@@ -0,0 +1,68 @@
+'''
+Tests of djia_sidecar.py module
+'''
+
+import os
+import datetime as dt
+import numpy as np
+import pytest
+import djia_sidecar
+import djia_backfill
+import djia_npp_bokeh as djia
+
+
+# Test that the compressed file of each event decodes to its valid points
+def test_event_files_round_trip(tmp_path):
+    events = djia.get_djia_data(1821, 243, '2022-03-03',
+                                download_from_internet=False,
+                                return_events=True, save_data=False)[0]
+    file_lst, n_bytes = djia_sidecar.write_event_files(events,
+                                                       str(tmp_path))
+    assert len(set(file_lst)) == 15
+    assert n_bytes == sum(os.path.getsize(os.path.join(str(tmp_path), f))
+                          for f in file_lst)
+    for i in [0, 14]:
+        with open(os.path.join(str(tmp_path), file_lst[i]), 'rb') as f:
+            offsets, date_days, close = djia_sidecar.decode_event(f.read())
+        valid = events.valid[i]
+        assert np.array_equal(offsets, events.days_frm_peak[valid])
+        assert np.array_equal(date_days, events.date_days[i, valid])
+        assert np.array_equal(close, events.close[i, valid])
+    assert djia_sidecar.write_event_files(events, str(tmp_path))[0] == \
+        file_lst
+    assert len(os.listdir(str(tmp_path))) == 15
+
+
+# Test that daily sidecar snapshots share the files of the unchanged events
+# and that the HTML shells do not embed the event data
+def test_backfill_sidecar(tmp_path):
+    filename_lst = djia_backfill.backfill_npp(
+        '2022-02-28', '2022-03-03', download_from_internet=False, n_procs=1,
+        image_dir=str(tmp_path), data_mode='sidecar')
+    data_dir = os.path.join(str(tmp_path), djia_sidecar.SIDECAR_DIR)
+    assert len(os.listdir(data_dir)) == 15 + 3
+    with open(filename_lst[-1]) as f:
+        html = f.read()
+    assert html.count(djia_sidecar.SIDECAR_DIR + '/') == 15
+    assert len(html) < 100000
+
+
+# Test that the manifest names the event sources by the shared source names
+# of djia_npp_bokeh.py and keeps the name of the current event source
+@pytest.mark.parametrize('render_mode', ['lines', 'multi_line'])
+def test_externalize_source_names(render_mode):
+    events = djia.get_djia_data(1821, 243, '2022-03-03',
+                                download_from_internet=False,
+                                return_events=True, save_data=False)[0]
+    fig = djia.make_npp_figure(events, ['label'] * events.n_events,
+                               dt.datetime(2022, 3, 3),
+                               render_mode=render_mode)
+    manifest = djia_sidecar.externalize_sources(
+        fig, events, ['url'] * events.n_events)
+    if render_mode == 'multi_line':
+        assert manifest['sources'] == [djia.NPP_EVENTS_SOURCE]
+    else:
+        assert manifest['sources'][0] == 'npp_event_0'
+        assert manifest['sources'][-1] == djia.NPP_CURRENT_SOURCE
+        assert fig.select_one({'name': djia.NPP_CURRENT_SOURCE}) is not None
+    assert len(set(manifest['sources'])) == len(manifest['sources'])
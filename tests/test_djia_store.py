@@ -0,0 +1,103 @@
+'''
+Tests of djia_store.py module
+'''
+
+import os
+import pytest
+import datetime as dt
+import pandas as pd
+import djia_store
+import djia_npp_bokeh as djia
+
+CUR_PATH = os.path.split(os.path.abspath(__file__))[0]
+CSV_PATH = os.path.join(CUR_PATH, '..', 'data', 'djia_close_2022-03-03.csv')
+
+
+# Create a stand-in reader that records the date ranges it is asked for
+def recording_reader(calls):
+    base_reader = djia_store.csv_reader(CSV_PATH)
+
+    def reader(symbol, start_date, end_date):
+        calls.append((start_date, end_date))
+        return base_reader(symbol, start_date, end_date)
+
+    return reader
+
+
+# Test that a second update only fetches and appends the missing tail
+def test_update_store_fetches_delta(tmp_path):
+    calls = []
+    reader = recording_reader(calls)
+    close_df, n_new = djia_store.update_store(
+        str(tmp_path), 'djia_close', '^DJI', dt.datetime(2022, 2, 25),
+        reader=reader)
+    assert n_new == len(close_df)
+    assert close_df['Date'].iloc[-1] == pd.Timestamp('2022-02-25')
+    close_df, n_new = djia_store.update_store(
+        str(tmp_path), 'djia_close', '^DJI', dt.datetime(2022, 3, 3),
+        reader=reader)
+    assert calls[-1][0] == dt.datetime(2022, 2, 26)
+    assert n_new == 4
+    expected = djia_store.csv_reader(CSV_PATH)('^DJI', dt.datetime(1896, 1, 1),
+                                               dt.datetime(2022, 3, 3))
+    pd.testing.assert_frame_equal(close_df, expected)
+    # An up-to-date store does not call the reader
+    n_calls = len(calls)
+    djia_store.update_store(str(tmp_path), 'djia_close', '^DJI',
+                            dt.datetime(2022, 3, 3), reader=reader)
+    assert len(calls) == n_calls
+
+
+# Test that a partial tail left by an interrupted append is discarded
+def test_append_store_discards_torn_tail(tmp_path):
+    store_dir = str(tmp_path)
+    close_df = pd.DataFrame({'Date': pd.to_datetime(['2020-01-02',
+                                                     '2020-01-03']),
+                             'Close': [1.0, 2.0]})
+    djia_store.append_store(store_dir, 'djia_close', close_df)
+    csv_path, _ = djia_store.store_paths(store_dir, 'djia_close')
+    with open(csv_path, 'ab') as f:
+        f.write(b'2020-01-06,9')
+    assert len(djia_store.load_store(store_dir, 'djia_close')) == 2
+    meta, n_new = djia_store.append_store(
+        store_dir, 'djia_close',
+        pd.DataFrame({'Date': pd.to_datetime(['2020-01-03', '2020-01-06']),
+                      'Close': [2.0, 3.0]}))
+    assert n_new == 1
+    assert meta['last_date'] == '2020-01-06'
+    loaded = djia_store.load_store(store_dir, 'djia_close')
+    assert list(loaded['Close']) == [1.0, 2.0, 3.0]
+
+
+# Test get_djia_data with a stand-in reader and the store fallback offline
+def test_get_djia_data_with_store(tmp_path):
+    reader = djia_store.csv_reader(CSV_PATH)
+    out_online = djia.get_djia_data(1821, 243, '2022-03-05',
+                                    download_from_internet=True,
+                                    reader=reader, data_dir=str(tmp_path))
+    assert out_online[1] == '2022-03-03'
+    out_offline = djia.get_djia_data(1821, 243, '2022-03-05',
+                                     download_from_internet=False,
+                                     data_dir=str(tmp_path))
+    assert out_offline[1] == '2022-03-03'
+    pd.testing.assert_frame_equal(out_online[0], out_offline[0])
+    assert os.access(os.path.join(str(tmp_path),
+                                  'djia_close_pk_2022-03-03.csv'), os.F_OK)
+
+
+# Test that a retrying reader retries OSErrors and then gives up
+def test_retry_reader():
+    calls = []
+
+    def flaky_reader(symbol, start_date, end_date):
+        calls.append(symbol)
+        if len(calls) < 3:
+            raise ConnectionError('connection reset')
+        return symbol
+
+    assert djia_store.retry_reader(flaky_reader, 2, 0.0)('^DJI', 0, 1) == \
+        '^DJI'
+    calls.clear()
+    with pytest.raises(ConnectionError):
+        djia_store.retry_reader(flaky_reader, 1, 0.0)('^DJI', 0, 1)
+    assert len(calls) == 2